@@ -0,0 +1,413 @@
+import json
+import logging
+import re
+import shlex
+import socket
+import subprocess
+import threading
+import time
+import urllib.error
+import urllib.request
+from collections import defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from sqlalchemy import insert, or_
+from models import db, MaintenanceAction, MaintenanceActionResult
+
+PHASES = ('start', 'end')
+
+_PLACEHOLDER = re.compile(r'\{(\w+)\}')
+
+class ActionTimeout(Exception):
+    """Raised by an action type when the action ran out of time"""
+
+def render(template, context):
+    """Substitute {name} placeholders found in context; other braces are left alone"""
+    return _PLACEHOLDER.sub(lambda match: str(context.get(match.group(1), match.group(0))), template)
+
+def run_shell(action, context, timeout):
+    """Run the command line without a shell; placeholders are substituted per argument"""
+    args = [render(arg, context) for arg in shlex.split(action['command'])]
+    try:
+        completed = subprocess.run(args, capture_output=True, text=True, timeout=timeout)
+    except subprocess.TimeoutExpired:
+        raise ActionTimeout(f'Command timed out after {timeout}s')
+    return completed.returncode == 0, completed.returncode, completed.stdout + completed.stderr
+
+def run_http(action, context, timeout):
+    """Call the URL; any 2xx response is a success. The context is sent as the JSON body."""
+    method = (action['method'] or 'POST').upper()
+    body = None if method in ('GET', 'HEAD') else json.dumps(context).encode()
+    http_request = urllib.request.Request(
+        render(action['url'], context), data=body, method=method,
+        headers={'Content-Type': 'application/json'}
+    )
+    try:
+        with urllib.request.urlopen(http_request, timeout=timeout) as response:
+            return True, response.status, response.read(65536).decode(errors='replace')
+    except urllib.error.HTTPError as e:
+        return False, e.code, e.read(65536).decode(errors='replace')
+    except urllib.error.URLError as e:
+        if isinstance(e.reason, (socket.timeout, TimeoutError)):
+            raise ActionTimeout(f'Request timed out after {timeout}s')
+        return False, None, str(e.reason)
+    except (socket.timeout, TimeoutError):
+        raise ActionTimeout(f'Request timed out after {timeout}s')
+
+# Action types by MaintenanceAction.kind: callables (action, context, timeout)
+# returning (succeeded, return_code, output) or raising ActionTimeout
+ACTION_TYPES = {
+    'shell': run_shell,
+    'http': run_http
+}
+
+# Runners that stop at the timeout themselves; the executor enforces it for the others
+_SELF_TIMED = {run_shell, run_http}
+
+def register_action_type(kind, runner, enforces_timeout=False):
+    """Make a new MaintenanceAction.kind available
+
+    Unless the runner stops at its timeout argument itself
+    (enforces_timeout), the executor runs it on a separate thread and gives
+    up on it when the timeout passes.
+    """
+    ACTION_TYPES[kind] = runner
+    if enforces_timeout:
+        _SELF_TIMED.add(runner)
+    else:
+        _SELF_TIMED.discard(runner)
+
+def call_with_timeout(runner, action, context, timeout):
+    """Call a runner, raising ActionTimeout if it has not returned after timeout seconds
+
+    A runner that overruns keeps its (daemon) thread until it returns, but
+    no longer holds an executor worker.
+    """
+    outcome = {}
+
+    def target():
+        try:
+            outcome['result'] = runner(action, context, timeout)
+        except BaseException as e:
+            outcome['error'] = e
+
+    thread = threading.Thread(target=target, name=f"maintenance-action-{action['id']}", daemon=True)
+    thread.start()
+    thread.join(timeout)
+    if thread.is_alive():
+        raise ActionTimeout(f'Action did not finish within {timeout}s')
+    if 'error' in outcome:
+        raise outcome['error']
+    return outcome['result']
+
+def actions_for(phase, server_ids=None):
+    """Enabled actions of a phase as plain dicts, in run order
+
+    With server_ids, only actions that may apply to those servers are
+    read (group actions and actions of those servers).
+    """
+    query = MaintenanceAction.query.filter(
+        MaintenanceAction.phase == phase,
+        MaintenanceAction.enabled.is_(True)
+    )
+    if server_ids is not None:
+        query = query.filter(or_(
+            MaintenanceAction.server_id.is_(None),
+            MaintenanceAction.server_id.in_(list(server_ids))
+        ))
+    actions = []
+    for action in query.order_by(MaintenanceAction.position, MaintenanceAction.id):
+        data = action.to_dict()
+        # Actions with neither a server nor a prefix apply to every server
+        data['server_prefix'] = data['server_prefix'] or ''
+        actions.append(data)
+    return actions
+
+def applies_to(action, server):
+    if action['server_id'] is not None:
+        return action['server_id'] == server['server_id']
+    return server['name'].startswith(action['server_prefix'])
+
+class _Run:
+    """The actions of one phase for one server, run one after another"""
+
+    def __init__(self, maintenance_id, context, actions):
+        self.maintenance_id = maintenance_id
+        self.context = context
+        self.actions = actions
+        self.index = 0
+
+    @property
+    def action(self):
+        return self.actions[self.index]
+
+class ActionExecutor:
+    """Runs maintenance actions on a thread pool
+
+    Each server's actions for a phase run in order, servers in parallel.
+    The pool size bounds the actions running at once overall; each
+    concurrency group (an action's concurrency_group, or the action
+    itself) additionally runs at most its max_concurrency at a time. Runs
+    over a group's limit wait in a per-group queue instead of holding a
+    pool thread. Results are buffered and written in batches by a single
+    writer thread.
+    """
+
+    def __init__(self, max_workers=32, group_concurrency=8, default_timeout=60, retry_delay=1,
+                 output_limit=4000, flush_interval=0.5, flush_size=200):
+        self.app = None
+        self.max_workers = max_workers
+        self.group_concurrency = group_concurrency
+        self.default_timeout = default_timeout
+        self.retry_delay = retry_delay
+        self.output_limit = output_limit
+        self.flush_interval = flush_interval
+        self.flush_size = flush_size
+        self.logger = logging.getLogger(__name__)
+        self._pool = None
+        self._closed = False
+        self._lock = threading.Lock()
+        self._running = defaultdict(int)
+        self._waiting = defaultdict(deque)
+        self._pending = 0
+        self._idle = threading.Condition(self._lock)
+        self._results = []
+        self._results_lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._flush_wanted = threading.Event()
+        self._writer = None
+
+    def init_app(self, app):
+        self.app = app
+        self.max_workers = app.config.get('ACTION_MAX_WORKERS', self.max_workers)
+        self.group_concurrency = app.config.get('ACTION_GROUP_CONCURRENCY', self.group_concurrency)
+        self.default_timeout = app.config.get('ACTION_DEFAULT_TIMEOUT', self.default_timeout)
+        self.retry_delay = app.config.get('ACTION_RETRY_DELAY', self.retry_delay)
+        self.output_limit = app.config.get('ACTION_OUTPUT_LIMIT', self.output_limit)
+
+    def run(self, phase, targets):
+        """Queue the actions of a phase for (maintenance_id, server) pairs; returns the runs queued
+
+        Must be called inside an app context; only one query is made for
+        all targets and nothing waits for the actions to finish.
+        """
+        targets = [
+            (maintenance_id, {
+                'maintenance_id': maintenance_id,
+                'phase': phase,
+                'server_id': server.id,
+                'name': server.name,
+                'hostname': server.hostname,
+                'ip_address': server.ip_address
+            })
+            for maintenance_id, server in targets
+        ]
+        if not targets:
+            return 0
+        actions = actions_for(phase, {context['server_id'] for _, context in targets})
+        if not actions:
+            return 0
+
+        runs = []
+        for maintenance_id, context in targets:
+            server_actions = [action for action in actions if applies_to(action, context)]
+            if server_actions:
+                runs.append(_Run(maintenance_id, context, server_actions))
+        if not runs:
+            return 0
+
+        self._start()
+        with self._lock:
+            self._pending += len(runs)
+        for action_run in runs:
+            self._enqueue(action_run)
+        return len(runs)
+
+    def wait(self, timeout=None):
+        """Block until every queued run has finished and its results are written"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._idle:
+            while self._pending:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._idle.wait(remaining)
+        self.flush()
+        return True
+
+    def stats(self):
+        with self._lock:
+            return {
+                'pending_runs': self._pending,
+                'running': sum(self._running.values()),
+                'waiting': sum(len(queue) for queue in self._waiting.values())
+            }
+
+    def shutdown(self):
+        """Stop accepting work and write the results collected so far
+
+        Runs waiting for a group slot, or queued on the pool, are recorded
+        as skipped; steps that are running finish and record their result,
+        but start nothing new.
+        """
+        with self._lock:
+            self._closed = True
+            pool, self._pool = self._pool, None
+            waiting = [action_run for queue in self._waiting.values() for action_run in queue]
+            self._waiting.clear()
+        for action_run in waiting:
+            self._abandon(action_run, 'Skipped because the action executor shut down')
+        if pool is not None:
+            pool.shutdown(wait=False)
+        self.flush()
+
+    def _start(self):
+        with self._lock:
+            if self._pool is None:
+                self._closed = False
+                self._pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='maintenance-action')
+            if self._writer is None:
+                self._writer = threading.Thread(target=self._write_results, name='maintenance-action-results', daemon=True)
+                self._writer.start()
+
+    @staticmethod
+    def _group(action):
+        return action['concurrency_group'] or f"action:{action['id']}"
+
+    def _enqueue(self, action_run):
+        action = action_run.action
+        group = self._group(action)
+        limit = action['max_concurrency'] or self.group_concurrency
+        with self._lock:
+            closed = self._closed
+            if not closed:
+                if self._running[group] >= limit:
+                    self._waiting[group].append(action_run)
+                    return
+                self._running[group] += 1
+                # Under the lock, so shutdown() cannot take the pool away in between
+                self._pool.submit(self._run_step, action_run)
+        if closed:
+            self._abandon(action_run, 'Skipped because the action executor shut down')
+
+    def _run_step(self, action_run):
+        action = action_run.action
+        group = self._group(action)
+        with self._lock:
+            closed = self._closed
+            if closed:
+                self._running[group] -= 1
+        if closed:
+            self._abandon(action_run, 'Skipped because the action executor shut down')
+            return
+        try:
+            result = self._execute(action, action_run)
+        finally:
+            # Hand the group slot straight to the next waiting run
+            with self._lock:
+                waiting = self._waiting[group]
+                if waiting and not self._closed:
+                    self._pool.submit(self._run_step, waiting.popleft())
+                else:
+                    self._running[group] -= 1
+
+        self._record(result)
+        action_run.index += 1
+        if result['status'] != 'succeeded':
+            # Later actions depend on the earlier ones having worked
+            self._abandon(action_run, 'Skipped after an earlier action failed')
+        elif action_run.index < len(action_run.actions):
+            self._enqueue(action_run)
+        else:
+            self._finish_run()
+
+    def _abandon(self, action_run, reason):
+        """Record the run's remaining actions as skipped and finish it"""
+        for skipped in action_run.actions[action_run.index:]:
+            self._record(self._result(skipped, action_run, 'skipped', 0, None, reason))
+        action_run.index = len(action_run.actions)
+        self._finish_run()
+
+    def _execute(self, action, action_run):
+        runner = ACTION_TYPES.get(action['kind'])
+        timeout = action['timeout_seconds'] or self.default_timeout
+        started_at = datetime.utcnow()
+        attempts = 0
+        while True:
+            attempts += 1
+            try:
+                if runner is None:
+                    raise ValueError(f"Unknown action type '{action['kind']}'")
+                if runner in _SELF_TIMED:
+                    succeeded, return_code, output = runner(action, action_run.context, timeout)
+                else:
+                    succeeded, return_code, output = call_with_timeout(runner, action, action_run.context, timeout)
+                status = 'succeeded' if succeeded else 'failed'
+            except ActionTimeout as e:
+                status, return_code, output = 'timeout', None, str(e)
+            except Exception as e:
+                status, return_code, output = 'failed', None, str(e)
+
+            if status == 'succeeded' or attempts > action['retries'] or runner is None:
+                break
+            time.sleep(self.retry_delay * 2 ** (attempts - 1))
+
+        if status != 'succeeded':
+            self.logger.warning(
+                f"Maintenance action '{action['name']}' {status} for {action_run.context['name']} "
+                f"(maintenance {action_run.maintenance_id}, {attempts} attempts)"
+            )
+        return self._result(action, action_run, status, attempts, return_code, output, started_at)
+
+    def _result(self, action, action_run, status, attempts, return_code, output, started_at=None):
+        finished_at = datetime.utcnow()
+        return {
+            'maintenance_id': action_run.maintenance_id,
+            'server_id': action_run.context['server_id'],
+            'action_id': action['id'],
+            'action_name': action['name'],
+            'phase': action_run.context['phase'],
+            'status': status,
+            'attempts': attempts,
+            'return_code': return_code,
+            'output': output[-self.output_limit:] if output else output,
+            'started_at': started_at,
+            'finished_at': finished_at,
+            'duration_ms': int((finished_at - started_at).total_seconds() * 1000) if started_at else None
+        }
+
+    def _finish_run(self):
+        with self._idle:
+            self._pending -= 1
+            if not self._pending:
+                self._flush_wanted.set()
+                self._idle.notify_all()
+
+    def _record(self, result):
+        with self._results_lock:
+            self._results.append(result)
+            if len(self._results) >= self.flush_size:
+                self._flush_wanted.set()
+
+    def _write_results(self):
+        while True:
+            self._flush_wanted.wait(self.flush_interval)
+            self._flush_wanted.clear()
+            self.flush()
+
+    def flush(self):
+        """Insert the buffered results with one statement"""
+        with self._flush_lock:
+            with self._results_lock:
+                results, self._results = self._results, []
+            if not results or self.app is None:
+                return
+            with self.app.app_context():
+                try:
+                    db.session.execute(insert(MaintenanceActionResult), results)
+                    db.session.commit()
+                except Exception as e:
+                    db.session.rollback()
+                    self.logger.error(f"Error recording {len(results)} maintenance action results: {e}")
+
+action_executor = ActionExecutor()
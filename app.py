@@ -1,12 +1,32 @@
-from flask import Flask, request, jsonify, render_template, redirect, url_for, flash
+from flask import Flask, request, jsonify, render_template, redirect, url_for, flash, current_app, stream_with_context
 from flask_sqlalchemy import SQLAlchemy
 from datetime import datetime, timedelta
+import base64
 import os
 import logging
 from dateutil import parser
+from sqlalchemy import and_, or_
+import pytz
 
-from models import db, Server, MaintenanceSchedule, ServerStatus, MaintenanceStatus
+from models import (db, Server, MaintenanceSchedule, ServerStatus, MaintenanceStatus, MaintenanceAction,
+                    MaintenanceActionResult, ServerTag, backfill_ip_keys, ensure_columns, ensure_indexes)
 from scheduler import MaintenanceScheduler
+from stats import dashboard_stats
+from events import event_broker
+from actions import ACTION_TYPES, PHASES, action_executor
+from prober import health_prober
+from search import server_search
+from tags import filter_ids, normalize_tags, set_server_tags, tag_index, tags_by_server
+from importer import iter_csv_servers, iter_json_servers, import_servers
+import exporter
+import serializers
+import changes
+import history
+import recurrence
+from iprange import ip_key, parse_cidrs
+from conflicts import find_conflicts, find_conflicts_bulk, find_plan_conflicts
+from placement import concurrency_limit, load_busy_windows, plan_windows
+from occupancy import BUCKETS, OCCUPYING_STATUSES, bucket_spans, load_spans, server_names
 from config import config
 
 def create_app(config_name=None):
@@ -20,6 +40,11 @@ def create_app(config_name=None):
     
     # Initialize extensions
     db.init_app(app)
+    dashboard_stats.init_app(app)
+    changes.init_app(app)
+    event_broker.init_app(app)
+    action_executor.init_app(app)
+    history.init_app(app)
     
     # Setup logging
     log_level = getattr(logging, app.config['LOG_LEVEL'].upper())
@@ -32,6 +57,13 @@ def create_app(config_name=None):
     with app.app_context():
         try:
             db.create_all()
+            ensure_columns()
+            ensure_indexes()
+            backfill_ip_keys()
+            history.record_initial_status()
+            server_search.init_app(app)
+            tag_index.init_app(app)
+            changes.prune_tombstones(app)
             logger.info("Database tables created successfully")
         except Exception as e:
             logger.error(f"Database initialization error: {e}")
@@ -43,6 +75,16 @@ def create_app(config_name=None):
     except Exception as e:
         logger.error(f"Scheduler initialization error: {e}")
 
+    app.extensions['maintenance_scheduler'] = scheduler
+    
+    # Probe from the process that runs the scheduler jobs only
+    health_prober.init_app(app, active=scheduler.is_running_jobs)
+    if app.config['PROBE_ENABLED']:
+        health_prober.start()
+    
+    if app.config['SCHEDULER_LEADER_ELECTION'] or not app.config['SCHEDULER_RUN_JOBS']:
+        changes.watch_collections(app, event_broker, app.config['SSE_CHANGE_POLL_SECONDS'])
+    
     # Register routes
     register_routes(app, scheduler)
     
@@ -55,12 +97,12 @@ def register_routes(app, scheduler):
     def index():
         """Main dashboard"""
         servers = Server.query.all()
-        maintenance_schedules = MaintenanceSchedule.query.order_by(MaintenanceSchedule.scheduled_start.desc()).limit(10).all()
+        maintenance_schedules = MaintenanceSchedule.query_with_server().order_by(MaintenanceSchedule.scheduled_start.desc()).limit(10).all()
         return render_template('index.html', servers=servers, maintenance_schedules=maintenance_schedules)
 
     # Server Management Endpoints
     @app.route('/api/servers/import', methods=['POST'])
-    def import_servers():
+    def import_servers_file():
         """Import servers from uploaded file (CSV or JSON)"""
         try:
             if 'file' not in request.files:
@@ -70,59 +112,143 @@ def register_routes(app, scheduler):
             if file.filename == '':
                 return jsonify({'error': 'No file selected'}), 400
             
-            # Read file content
-            content = file.read().decode('utf-8')
-            imported_servers = []
-            errors = []
-            
+            # Parse the upload lazily; rows are validated and inserted chunk by chunk
             if file.filename.endswith('.csv'):
-                imported_servers, errors = _import_from_csv(content)
+                parsed_rows = iter_csv_servers(file.stream)
             elif file.filename.endswith('.json'):
-                imported_servers, errors = _import_from_json(content)
+                parsed_rows = iter_json_servers(file.stream)
             else:
                 return jsonify({'error': 'Unsupported file format. Use CSV or JSON'}), 400
             
-            # Import successful servers
-            success_count = 0
-            for server_data in imported_servers:
-                try:
-                    # Check if server name already exists
-                    if Server.query.filter_by(name=server_data['name']).first():
-                        errors.append(f"Server '{server_data['name']}' already exists")
-                        continue
-                    
-                    server = Server(
-                        name=server_data['name'],
-                        hostname=server_data['hostname'],
-                        ip_address=server_data['ip_address'],
-                        description=server_data.get('description', ''),
-                        status=ServerStatus.ONLINE
-                    )
-                    
-                    db.session.add(server)
-                    success_count += 1
-                    
-                except Exception as e:
-                    errors.append(f"Error importing '{server_data.get('name', 'Unknown')}': {str(e)}")
+            result = import_servers(
+                parsed_rows,
+                chunk_size=app.config['IMPORT_CHUNK_SIZE'],
+                max_errors=app.config['IMPORT_MAX_ERRORS']
+            )
+            success_count = result['success_count']
             
-            db.session.commit()
+            if success_count:
+                event_broker.publish('servers.imported', {'count': success_count})
             
-            return jsonify({
-                'success_count': success_count,
-                'error_count': len(errors),
-                'errors': errors,
-                'message': f'Successfully imported {success_count} servers'
-            })
+            result['message'] = f'Successfully imported {success_count} servers'
+            return jsonify(result)
             
         except Exception as e:
             app.logger.error(f"Error importing servers: {e}")
             return jsonify({'error': 'Failed to import servers'}), 500
 
+    @app.route('/api/servers/export', methods=['GET'])
+    def export_servers():
+        """Stream servers as CSV or NDJSON (?format=), with the filters of the server list"""
+        try:
+            export_format = _parse_export_format(request.args)
+            query = _filter_server_query(Server.projection_query(), request.args)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        
+        return _export_response('servers', export_format, exporter.encode(
+            exporter.iter_servers(query), exporter.SERVER_FIELDS, export_format
+        ))
+
     @app.route('/api/servers', methods=['GET'])
     def get_servers():
-        """Get all servers"""
-        servers = Server.query.all()
-        return jsonify([server.to_dict() for server in servers])
+        """Get servers (optionally filtered by status/name_prefix/cidr/tags), or with ?since= only the changes after that time"""
+        etag = changes.collection_etag(Server, request.args)
+        if request.if_none_match.contains(etag):
+            return _not_modified(etag)
+        
+        as_of = changes.changes_as_of(app)
+        try:
+            since = _parse_since(request.args)
+            fields = _parse_fields(request.args, Server.FIELDS)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        
+        if since is None:
+            try:
+                query = _filter_server_query(Server.projection_query(fields), request.args)
+            except ValueError as e:
+                return jsonify({'error': str(e)}), 400
+            return _collection_response(_encode_servers(query, query.all(), fields), etag, as_of)
+        
+        if since < changes.retention_cutoff(app):
+            return jsonify({'error': 'since is older than the change log; reload the full list'}), 410
+        query = Server.projection_query(fields).filter(Server.updated_at > since)
+        return _collection_response(_delta_payload(
+            Server, since, as_of, _encode_servers(query, query.all(), fields)
+        ), etag, as_of)
+
+    @app.route('/api/servers/search', methods=['GET'])
+    def search_servers():
+        """Ranked prefix/token search over name, hostname, ip_address and description
+        
+        Every word of q must match; 'web-01' or '10.0.3' match as a token sequence and the
+        last token of each word as a prefix. Paginated with limit and offset.
+        """
+        query = request.args.get('q', '').strip()
+        if not query:
+            return jsonify({'error': "Missing search query 'q'"}), 400
+        try:
+            limit = _parse_limit(request.args, app.config['SEARCH_PAGE_SIZE_MAX']) or 50
+            offset = request.args.get('offset', '0')
+            if not offset.isdigit():
+                raise ValueError(f'Invalid offset: {offset}')
+            offset = int(offset)
+            fields = _parse_fields(request.args, Server.FIELDS)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        
+        try:
+            projection = Server.projection_query(fields)
+            rows, total = server_search.search(query, limit, offset, projection)
+            payload = {
+                'query': query,
+                'total': total,
+                'limit': limit,
+                'offset': offset,
+                'results': _encode_servers(projection, rows, fields)
+            }
+            if offset + limit < total:
+                payload['next_offset'] = offset + limit
+            return serializers.json_response(payload)
+        except Exception as e:
+            app.logger.error(f"Error searching servers: {e}")
+            return jsonify({'error': 'Failed to search servers'}), 500
+
+    @app.route('/api/servers/availability', methods=['GET'])
+    def get_servers_availability():
+        """Uptime, planned maintenance and unplanned downtime of a group of servers over from/to
+        
+        The group is selected with the status/name_prefix filters of the server list; with
+        per_server=true the figures of each server are included.
+        """
+        try:
+            range_from, range_to = _parse_range(request.args, app.config['AVAILABILITY_MAX_DAYS'])
+            server_ids = [server_id for (server_id,) in _filter_server_query(db.session.query(Server.id), request.args)]
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        
+        try:
+            per_server = request.args.get('per_server', 'false').lower() in ['true', '1', 'on']
+            return jsonify(_availability_report(server_ids, range_from, range_to, per_server))
+        except Exception as e:
+            app.logger.error(f"Error computing server availability: {e}")
+            return jsonify({'error': 'Failed to compute server availability'}), 500
+
+    @app.route('/api/servers/<int:server_id>/availability', methods=['GET'])
+    def get_server_availability(server_id):
+        """Uptime, planned maintenance and unplanned downtime of a server over from/to"""
+        Server.query.get_or_404(server_id)
+        try:
+            range_from, range_to = _parse_range(request.args, app.config['AVAILABILITY_MAX_DAYS'])
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        
+        try:
+            return jsonify(_availability_report([server_id], range_from, range_to))
+        except Exception as e:
+            app.logger.error(f"Error computing server availability: {e}")
+            return jsonify({'error': 'Failed to compute server availability'}), 500
 
     @app.route('/api/servers', methods=['POST'])
     def create_server():
@@ -136,6 +262,13 @@ def register_routes(app, scheduler):
                 if field not in data:
                     return jsonify({'error': f'Missing required field: {field}'}), 400
             
+            if ip_key(data['ip_address']) is None:
+                return jsonify({'error': f"Invalid IP address: {data['ip_address']}"}), 400
+            try:
+                tags = normalize_tags(data.get('tags', []))
+            except ValueError as e:
+                return jsonify({'error': str(e)}), 400
+            
             # Check if server name already exists
             if Server.query.filter_by(name=data['name']).first():
                 return jsonify({'error': 'Server name already exists'}), 400
@@ -147,10 +280,13 @@ def register_routes(app, scheduler):
                 description=data.get('description', ''),
                 status=ServerStatus.ONLINE
             )
+            set_server_tags(server, tags)
             
             db.session.add(server)
             db.session.commit()
             
+            event_broker.publish('server.created', {'id': server.id, 'status': server.status.value})
+            
             return jsonify(server.to_dict()), 201
             
         except Exception as e:
@@ -159,9 +295,18 @@ def register_routes(app, scheduler):
 
     @app.route('/api/servers/<int:server_id>', methods=['GET'])
     def get_server(server_id):
-        """Get a specific server"""
-        server = Server.query.get_or_404(server_id)
-        return jsonify(server.to_dict())
+        """Get a specific server (only the columns of ?fields= when given)"""
+        try:
+            fields = _parse_fields(request.args, Server.FIELDS)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        if fields is None:
+            server = Server.query.get_or_404(server_id)
+            return jsonify(server.to_dict())
+        
+        query = Server.projection_query(fields).filter(Server.id == server_id)
+        row = query.first_or_404()
+        return serializers.json_response(_encode_servers(query, [row], fields, single=True))
 
     @app.route('/api/servers/<int:server_id>', methods=['PUT'])
     def update_server(server_id):
@@ -170,6 +315,19 @@ def register_routes(app, scheduler):
             server = Server.query.get_or_404(server_id)
             data = request.get_json()
             
+            if 'ip_address' in data and ip_key(data['ip_address']) is None:
+                return jsonify({'error': f"Invalid IP address: {data['ip_address']}"}), 400
+            try:
+                tags = normalize_tags(data['tags']) if 'tags' in data else None
+            except ValueError as e:
+                return jsonify({'error': str(e)}), 400
+            
+            if data.get('name', server.name) != server.name:
+                # server_name is embedded in maintenance rows; bump them for the delta feed
+                MaintenanceSchedule.query.filter_by(server_id=server.id).update(
+                    {'updated_at': datetime.utcnow()}, synchronize_session=False
+                )
+            
             server.name = data.get('name', server.name)
             server.hostname = data.get('hostname', server.hostname)
             server.ip_address = data.get('ip_address', server.ip_address)
@@ -177,9 +335,13 @@ def register_routes(app, scheduler):
             
             if 'status' in data:
                 server.status = ServerStatus(data['status'])
+            if tags is not None:
+                set_server_tags(server, tags)
             
             db.session.commit()
             
+            event_broker.publish('server.updated', {'id': server.id, 'status': server.status.value})
+            
             return jsonify(server.to_dict())
             
         except Exception as e:
@@ -200,6 +362,8 @@ def register_routes(app, scheduler):
             db.session.delete(server)
             db.session.commit()
             
+            event_broker.publish('server.deleted', {'id': server_id})
+            
             return jsonify({'message': 'Server deleted successfully'})
             
         except Exception as e:
@@ -209,9 +373,77 @@ def register_routes(app, scheduler):
     # Maintenance Schedule Endpoints
     @app.route('/api/maintenance', methods=['GET'])
     def get_maintenance_schedules():
-        """Get all maintenance schedules"""
-        schedules = MaintenanceSchedule.query.order_by(MaintenanceSchedule.scheduled_start.desc()).all()
-        return jsonify([schedule.to_dict() for schedule in schedules])
+        """Get maintenance schedules, optionally filtered and keyset-paginated
+        
+        Query parameters: status (comma separated), server_id, from, to
+        (bounds on scheduled_start), limit and cursor. When a page is cut
+        short the cursor for the next page is returned in X-Next-Cursor.
+        With ?since= the response is instead the unfiltered delta feed of
+        rows changed or deleted after that time.
+        """
+        etag = changes.collection_etag(MaintenanceSchedule, request.args)
+        if request.if_none_match.contains(etag):
+            return _not_modified(etag)
+        as_of = changes.changes_as_of(app)
+        
+        try:
+            since = _parse_since(request.args)
+            fields = _parse_fields(request.args, MaintenanceSchedule.FIELDS)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        
+        if since is not None:
+            if since < changes.retention_cutoff(app):
+                return jsonify({'error': 'since is older than the change log; reload the full list'}), 410
+            query = MaintenanceSchedule.projection_query(fields).filter(MaintenanceSchedule.updated_at > since)
+            return _collection_response(_delta_payload(
+                MaintenanceSchedule, since, as_of, serializers.row_encoder(query).encode(query.all())
+            ), etag, as_of)
+        
+        try:
+            query = _filter_maintenance_query(MaintenanceSchedule.projection_query(fields), request.args)
+            limit = _parse_limit(request.args, app.config['MAINTENANCE_PAGE_SIZE_MAX'])
+            cursor = request.args.get('cursor')
+            if cursor:
+                cursor_start, cursor_id = _decode_cursor(cursor)
+                query = query.filter(or_(
+                    MaintenanceSchedule.scheduled_start < cursor_start,
+                    and_(MaintenanceSchedule.scheduled_start == cursor_start,
+                         MaintenanceSchedule.id < cursor_id)
+                ))
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        
+        query = query.order_by(MaintenanceSchedule.scheduled_start.desc(), MaintenanceSchedule.id.desc())
+        if limit is None:
+            return _collection_response(serializers.row_encoder(query).encode(query.all()), etag, as_of)
+        
+        encoder = serializers.row_encoder(query)
+        if fields is not None and 'scheduled_start' not in fields:
+            # Read for the next cursor only; the encoder leaves out the extra column
+            query = query.add_columns(MaintenanceSchedule.scheduled_start)
+        rows = query.limit(limit + 1).all()
+        has_more = len(rows) > limit
+        schedules = rows[:limit]
+        
+        response = _collection_response(encoder.encode(schedules), etag, as_of)
+        if has_more:
+            last = schedules[-1]
+            response.headers['X-Next-Cursor'] = _encode_cursor(last.scheduled_start, last.id)
+        return response
+
+    @app.route('/api/maintenance/export', methods=['GET'])
+    def export_maintenance_schedules():
+        """Stream maintenance schedules as CSV or NDJSON (?format=), with the filters of the maintenance list"""
+        try:
+            export_format = _parse_export_format(request.args)
+            query = _filter_maintenance_query(MaintenanceSchedule.projection_query(), request.args)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        
+        return _export_response('maintenance', export_format, exporter.encode(
+            exporter.iter_maintenance(query), exporter.MAINTENANCE_FIELDS, export_format
+        ))
 
     @app.route('/api/maintenance', methods=['POST'])
     def create_maintenance_schedule():
@@ -230,16 +462,16 @@ def register_routes(app, scheduler):
             if not server:
                 return jsonify({'error': 'Server not found'}), 404
             
-            # Parse dates
-            scheduled_start = parser.parse(data['scheduled_start'])
-            scheduled_end = parser.parse(data['scheduled_end'])
-            
-            # Validate dates
-            if scheduled_start >= scheduled_end:
-                return jsonify({'error': 'Start time must be before end time'}), 400
+            # Parse and validate dates
+            try:
+                scheduled_start, scheduled_end = _parse_window(data)
+                _validate_recurrence(data, scheduled_start, scheduled_end)
+            except ValueError as e:
+                return jsonify({'error': str(e)}), 400
             
-            if scheduled_start <= datetime.utcnow():
-                return jsonify({'error': 'Start time must be in the future'}), 400
+            conflicts = find_conflicts(server.id, scheduled_start, scheduled_end)
+            if conflicts:
+                return _conflict_response(conflicts)
             
             maintenance = MaintenanceSchedule(
                 server_id=data['server_id'],
@@ -251,12 +483,20 @@ def register_routes(app, scheduler):
                 recurring_pattern=data.get('recurring_pattern'),
                 status=MaintenanceStatus.SCHEDULED
             )
+            if maintenance.recurring and maintenance.recurring_pattern:
+                recurrence.create_series(maintenance)
             
             db.session.add(maintenance)
             db.session.commit()
             
             # Schedule the maintenance job
             scheduler.schedule_maintenance(maintenance.id)
+            if maintenance.series_id is not None:
+                scheduler.materialize_recurrences([maintenance.series_id])
+            
+            event_broker.publish('maintenance.created', {
+                'id': maintenance.id, 'server_id': maintenance.server_id, 'status': maintenance.status.value
+            })
             
             return jsonify(maintenance.to_dict()), 201
             
@@ -264,11 +504,303 @@ def register_routes(app, scheduler):
             app.logger.error(f"Error creating maintenance schedule: {e}")
             return jsonify({'error': 'Failed to create maintenance schedule'}), 500
 
+    @app.route('/api/maintenance/bulk', methods=['POST'])
+    def create_bulk_maintenance_schedules():
+        """Schedule the same maintenance window on many servers at once
+        
+        The body holds the window template (title, scheduled_start,
+        scheduled_end, optional description/recurring/recurring_pattern)
+        and either 'server_ids' or a 'filter' object using the same keys as
+        the GET /api/servers filters. Servers with an overlapping active
+        window are reported as failed; all other schedules are inserted in
+        one transaction and their jobs registered in one batch.
+        """
+        try:
+            data = request.get_json() or {}
+            
+            for field in ['title', 'scheduled_start', 'scheduled_end']:
+                if field not in data:
+                    return jsonify({'error': f'Missing required field: {field}'}), 400
+            if ('server_ids' in data) == ('filter' in data):
+                return jsonify({'error': "Provide exactly one of 'server_ids' or 'filter'"}), 400
+            
+            try:
+                scheduled_start, scheduled_end = _parse_window(data)
+                _validate_recurrence(data, scheduled_start, scheduled_end)
+                requested_ids, found_ids = _resolve_server_ids(data)
+            except (TypeError, ValueError) as e:
+                return jsonify({'error': str(e)}), 400
+            
+            if len(requested_ids) > app.config['BULK_SCHEDULE_MAX']:
+                return jsonify({'error': f"At most {app.config['BULK_SCHEDULE_MAX']} servers per request"}), 400
+            
+            conflicts = find_conflicts_bulk(found_ids, scheduled_start, scheduled_end)
+            
+            results = []
+            created = []
+            for server_id in dict.fromkeys(requested_ids):
+                if server_id not in found_ids:
+                    results.append({'server_id': server_id, 'status': 'error', 'error': 'Server not found'})
+                    continue
+                if server_id in conflicts:
+                    results.append({
+                        'server_id': server_id, 'status': 'error',
+                        'error': 'Conflicts with existing maintenance', 'conflicts': conflicts[server_id]
+                    })
+                    continue
+                maintenance = MaintenanceSchedule(
+                    server_id=server_id,
+                    title=data['title'],
+                    description=data.get('description', ''),
+                    scheduled_start=scheduled_start,
+                    scheduled_end=scheduled_end,
+                    recurring=data.get('recurring', False),
+                    recurring_pattern=data.get('recurring_pattern'),
+                    status=MaintenanceStatus.SCHEDULED
+                )
+                if maintenance.recurring and maintenance.recurring_pattern:
+                    recurrence.create_series(maintenance)
+                created.append(maintenance)
+                results.append({'server_id': server_id, 'status': 'created', 'maintenance': maintenance})
+            
+            db.session.add_all(created)
+            db.session.commit()
+            
+            scheduler.schedule_maintenance_batch(created)
+            series_ids = [maintenance.series_id for maintenance in created if maintenance.series_id is not None]
+            if series_ids:
+                scheduler.materialize_recurrences(series_ids)
+            
+            for result in results:
+                if 'maintenance' in result:
+                    result['maintenance_id'] = result.pop('maintenance').id
+            
+            if created:
+                event_broker.publish('maintenance.bulk_created', {'count': len(created)})
+            
+            body = {'created': len(created), 'failed': len(results) - len(created), 'results': results}
+            return jsonify(body), 201 if created else 400
+            
+        except Exception as e:
+            db.session.rollback()
+            app.logger.error(f"Error creating bulk maintenance schedules: {e}")
+            return jsonify({'error': 'Failed to create maintenance schedules'}), 500
+
+    @app.route('/api/maintenance/plan', methods=['POST'])
+    def plan_maintenance_windows():
+        """Pack one maintenance window per server into a time range under a concurrency limit
+        
+        Body: 'server_ids' or 'filter' (as for /api/maintenance/bulk),
+        duration_minutes, window_start, window_end, and max_concurrent or
+        max_concurrent_percent of the group; optional slot_minutes
+        (start-time grid, default the duration). Existing active windows
+        of the group count against the limit and servers are never placed
+        over their own windows. Returns the plan; with "create": true
+        (plus title/description) the windows are scheduled as well.
+        """
+        try:
+            data = request.get_json() or {}
+            
+            for field in ['duration_minutes', 'window_start', 'window_end']:
+                if field not in data:
+                    return jsonify({'error': f'Missing required field: {field}'}), 400
+            if ('server_ids' in data) == ('filter' in data):
+                return jsonify({'error': "Provide exactly one of 'server_ids' or 'filter'"}), 400
+            if ('max_concurrent' in data) == ('max_concurrent_percent' in data):
+                return jsonify({'error': "Provide exactly one of 'max_concurrent' or 'max_concurrent_percent'"}), 400
+            if data.get('create') and not data.get('title'):
+                return jsonify({'error': 'Missing required field: title'}), 400
+            
+            try:
+                window_start, window_end = _parse_window({
+                    'scheduled_start': data['window_start'], 'scheduled_end': data['window_end']
+                })
+                duration = timedelta(minutes=float(data['duration_minutes']))
+                step = timedelta(minutes=float(data['slot_minutes'])) if data.get('slot_minutes') else None
+                if duration <= timedelta(0) or (step is not None and step <= timedelta(0)):
+                    raise ValueError('duration_minutes and slot_minutes must be positive')
+                requested_ids, found_ids = _resolve_server_ids(data)
+                server_ids = [server_id for server_id in dict.fromkeys(requested_ids) if server_id in found_ids]
+                limit = concurrency_limit(len(server_ids), data.get('max_concurrent'), data.get('max_concurrent_percent'))
+            except (TypeError, ValueError) as e:
+                return jsonify({'error': str(e)}), 400
+            
+            if len(server_ids) > app.config['PLACEMENT_MAX_SERVERS']:
+                return jsonify({'error': f"At most {app.config['PLACEMENT_MAX_SERVERS']} servers per plan"}), 400
+            
+            placements, unplaced = plan_windows(
+                server_ids, duration, window_start, window_end, limit, step,
+                load_busy_windows(server_ids, window_start, window_end)
+            )
+            
+            body = {
+                'max_concurrent': limit,
+                'placed': len(placements),
+                'unplaced': unplaced + [server_id for server_id in requested_ids if server_id not in found_ids],
+                'makespan_end': placements[-1][2].isoformat() if placements else None,
+                'placements': [
+                    {'server_id': server_id, 'scheduled_start': start.isoformat(), 'scheduled_end': end.isoformat()}
+                    for server_id, start, end in placements
+                ]
+            }
+            if not data.get('create'):
+                return jsonify(body)
+            
+            # The plan avoids the windows it read; re-check in case others were added since
+            conflicts = find_plan_conflicts(placements)
+            if conflicts:
+                body['error'] = 'Planned windows conflict with existing maintenance'
+                body['conflicts'] = conflicts
+                return jsonify(body), 409
+            
+            created = [
+                MaintenanceSchedule(
+                    server_id=server_id,
+                    title=data['title'],
+                    description=data.get('description', ''),
+                    scheduled_start=start,
+                    scheduled_end=end,
+                    status=MaintenanceStatus.SCHEDULED
+                )
+                for server_id, start, end in placements
+            ]
+            db.session.add_all(created)
+            db.session.commit()
+            
+            scheduler.schedule_maintenance_batch(created)
+            for placement, maintenance in zip(body['placements'], created):
+                placement['maintenance_id'] = maintenance.id
+            
+            if created:
+                event_broker.publish('maintenance.bulk_created', {'count': len(created)})
+            
+            body['created'] = len(created)
+            return jsonify(body), 201
+            
+        except Exception as e:
+            db.session.rollback()
+            app.logger.error(f"Error planning maintenance windows: {e}")
+            return jsonify({'error': 'Failed to plan maintenance windows'}), 500
+
+    @app.route('/api/maintenance/occurrences', methods=['GET'])
+    def get_maintenance_occurrences():
+        """Get every maintenance window overlapping a time range, including future recurrences
+        
+        Query params: from and to (required, at most
+        RECURRENCE_EXPAND_MAX_DAYS apart), server_id, fields. Scheduled rows
+        are returned as in GET /api/maintenance; recurrences past the
+        materialized horizon are expanded from their rule on the fly and
+        marked 'virtual' with id null.
+        """
+        try:
+            try:
+                range_from, range_to = _parse_range(request.args, app.config['RECURRENCE_EXPAND_MAX_DAYS'])
+                server_ids = [int(request.args['server_id'])] if request.args.get('server_id') else None
+                fields = _parse_fields(request.args, MaintenanceSchedule.FIELDS)
+            except ValueError as e:
+                return jsonify({'error': str(e)}), 400
+            
+            # scheduled_start orders the list even when it is not one of the fields
+            query = MaintenanceSchedule.projection_query(
+                fields + ('scheduled_start',) if fields is not None else None
+            ).filter(
+                MaintenanceSchedule.scheduled_start < range_to,
+                MaintenanceSchedule.scheduled_end > range_from
+            )
+            if server_ids is not None:
+                query = query.filter(MaintenanceSchedule.server_id.in_(server_ids))
+            
+            if fields is None:
+                occurrences = [(row.scheduled_start, MaintenanceSchedule.row_to_dict(row)) for row in query]
+            else:
+                occurrences = [(row.scheduled_start, _projected_dict(row, fields)) for row in query]
+            for series, server_name, start, end in recurrence.expand_spans(range_from, range_to, server_ids):
+                occurrence = recurrence.occurrence_dict(series, server_name, start, end)
+                if fields is not None:
+                    occurrence = {key: occurrence[key] for key in fields + ('virtual',) if key in occurrence}
+                occurrences.append((start, occurrence))
+            occurrences.sort(key=lambda occurrence: occurrence[0])
+            return jsonify([occurrence for _, occurrence in occurrences])
+            
+        except Exception as e:
+            app.logger.error(f"Error expanding maintenance occurrences: {e}")
+            return jsonify({'error': 'Failed to get maintenance occurrences'}), 500
+
+    @app.route('/api/maintenance/calendar', methods=['GET'])
+    def get_maintenance_calendar():
+        """Get per-bucket maintenance occupancy over a time range
+        
+        Query params: from and to (required), bucket ('hour' or 'day'),
+        status (comma-separated; default all but cancelled), server_id,
+        name_prefix, lanes=true for each server's busy buckets. Buckets
+        start at from; windows and servers hold, per bucket, the number of
+        windows and of distinct servers in maintenance during it, including
+        recurrences that are not materialized yet.
+        """
+        try:
+            try:
+                range_from, range_to = _parse_range(request.args, app.config['RECURRENCE_EXPAND_MAX_DAYS'])
+                bucket = request.args.get('bucket', 'day')
+                if bucket not in BUCKETS:
+                    raise ValueError(f"bucket must be one of: {', '.join(BUCKETS)}")
+                if (range_to - range_from) / BUCKETS[bucket] > app.config['CALENDAR_MAX_BUCKETS']:
+                    raise ValueError(f"Range is limited to {app.config['CALENDAR_MAX_BUCKETS']} buckets")
+                statuses = OCCUPYING_STATUSES
+                if request.args.get('status'):
+                    statuses = tuple(MaintenanceStatus(value.strip()) for value in request.args['status'].split(',') if value.strip())
+                server_ids = None
+                if request.args.get('server_id'):
+                    server_ids = [int(request.args['server_id'])]
+                elif request.args.get('name_prefix'):
+                    server_ids = [server_id for (server_id,) in _filter_server_query(
+                        db.session.query(Server.id), {'name_prefix': request.args['name_prefix']}
+                    )]
+            except ValueError as e:
+                return jsonify({'error': str(e)}), 400
+            
+            lanes = request.args.get('lanes', 'false').lower() in ['true', '1', 'on']
+            occupancy = bucket_spans(
+                load_spans(range_from, range_to, server_ids, statuses),
+                range_from, range_to, BUCKETS[bucket], lanes
+            )
+            calendar = {
+                'from': range_from.isoformat(),
+                'to': range_to.isoformat(),
+                'bucket': bucket,
+                'windows': occupancy['windows'],
+                'servers': occupancy['servers']
+            }
+            if lanes:
+                # Lanes in server name order; busy holds [first, last) bucket index ranges
+                busy = occupancy['lanes']
+                names = server_names(busy)
+                lane_ids = sorted(busy, key=lambda server_id: names.get(server_id, ''))
+                max_lanes = app.config['CALENDAR_MAX_LANES']
+                calendar['lanes'] = [
+                    {'server_id': server_id, 'server_name': names.get(server_id), 'busy': busy[server_id]}
+                    for server_id in lane_ids[:max_lanes]
+                ]
+                calendar['lanes_truncated'] = len(lane_ids) > max_lanes
+            return jsonify(calendar)
+            
+        except Exception as e:
+            app.logger.error(f"Error building maintenance calendar: {e}")
+            return jsonify({'error': 'Failed to get maintenance calendar'}), 500
+
     @app.route('/api/maintenance/<int:maintenance_id>', methods=['GET'])
     def get_maintenance_schedule(maintenance_id):
-        """Get a specific maintenance schedule"""
-        maintenance = MaintenanceSchedule.query.get_or_404(maintenance_id)
-        return jsonify(maintenance.to_dict())
+        """Get a specific maintenance schedule (only the columns of ?fields= when given)"""
+        try:
+            fields = _parse_fields(request.args, MaintenanceSchedule.FIELDS)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        if fields is None:
+            maintenance = MaintenanceSchedule.query.get_or_404(maintenance_id)
+            return jsonify(maintenance.to_dict())
+        
+        query = MaintenanceSchedule.projection_query(fields).filter(MaintenanceSchedule.id == maintenance_id)
+        row = query.first_or_404()
+        return serializers.json_response(serializers.row_encoder(query).encode_object(row))
 
     @app.route('/api/maintenance/<int:maintenance_id>', methods=['PUT'])
     def update_maintenance_schedule(maintenance_id):
@@ -281,8 +813,17 @@ def register_routes(app, scheduler):
             if maintenance.status != MaintenanceStatus.SCHEDULED:
                 return jsonify({'error': 'Can only update scheduled maintenance'}), 400
             
-            # Cancel existing scheduled job
-            scheduler.cancel_maintenance(maintenance_id)
+            try:
+                _validate_recurrence({
+                    'recurring': data.get('recurring', maintenance.recurring),
+                    'recurring_pattern': data.get('recurring_pattern', maintenance.recurring_pattern)
+                })
+            except ValueError as e:
+                return jsonify({'error': str(e)}), 400
+            
+            previous = (maintenance.recurring, maintenance.recurring_pattern,
+                        maintenance.scheduled_start, maintenance.scheduled_end)
+            original_start = maintenance.scheduled_start
             
             # Update fields
             maintenance.title = data.get('title', maintenance.title)
@@ -303,10 +844,47 @@ def register_routes(app, scheduler):
             if maintenance.scheduled_start <= datetime.utcnow():
                 return jsonify({'error': 'Start time must be in the future'}), 400
             
+            try:
+                _validate_recurrence({'recurring': maintenance.recurring, 'recurring_pattern': maintenance.recurring_pattern},
+                                     maintenance.scheduled_start, maintenance.scheduled_end)
+            except ValueError as e:
+                return jsonify({'error': str(e)}), 400
+            
+            # Changing the rule or times of an occurrence applies to it and the following ones
+            current = (maintenance.recurring, maintenance.recurring_pattern,
+                       maintenance.scheduled_start, maintenance.scheduled_end)
+            split = current != previous and (maintenance.series_id is not None or maintenance.recurring)
+            
+            # The occurrences the split replaces are not conflicts
+            replaced_ids = [maintenance.id]
+            if split and maintenance.series_id is not None:
+                replaced_ids.extend(occurrence_id for (occurrence_id,) in recurrence.later_occurrences(
+                    maintenance, original_start
+                ).with_entities(MaintenanceSchedule.id))
+            conflicts = find_conflicts(
+                maintenance.server_id, maintenance.scheduled_start, maintenance.scheduled_end,
+                exclude_ids=replaced_ids, exclude_series_id=maintenance.series_id
+            )
+            if conflicts:
+                return _conflict_response(conflicts)
+            
+            removed_ids = recurrence.split_series(maintenance, original_start) if split else []
+            
+            # Remove the existing jobs; they are re-added after the update
+            scheduler.unschedule_maintenance(maintenance_id)
+            
             db.session.commit()
             
             # Reschedule the maintenance job
+            for removed_id in removed_ids:
+                scheduler.unschedule_maintenance(removed_id)
             scheduler.schedule_maintenance(maintenance.id)
+            if maintenance.series_id is not None:
+                scheduler.materialize_recurrences([maintenance.series_id])
+            
+            event_broker.publish('maintenance.updated', {
+                'id': maintenance.id, 'server_id': maintenance.server_id, 'status': maintenance.status.value
+            })
             
             return jsonify(maintenance.to_dict())
             
@@ -341,54 +919,162 @@ def register_routes(app, scheduler):
             if maintenance.status == MaintenanceStatus.SCHEDULED:
                 scheduler.cancel_maintenance(maintenance_id)
             
+            server_id = maintenance.server_id
             db.session.delete(maintenance)
             db.session.commit()
             
+            event_broker.publish('maintenance.deleted', {'id': maintenance_id, 'server_id': server_id})
+            
             return jsonify({'message': 'Maintenance schedule deleted successfully'})
             
         except Exception as e:
             app.logger.error(f"Error deleting maintenance schedule: {e}")
             return jsonify({'error': 'Failed to delete maintenance schedule'}), 500
 
+    @app.route('/api/maintenance/<int:maintenance_id>/actions', methods=['GET'])
+    def get_maintenance_action_results(maintenance_id):
+        """Get the results of the actions run for a maintenance window"""
+        MaintenanceSchedule.query.get_or_404(maintenance_id)
+        try:
+            results = MaintenanceActionResult.query.filter_by(maintenance_id=maintenance_id).order_by(MaintenanceActionResult.id)
+            return jsonify([result.to_dict() for result in results])
+        except Exception as e:
+            app.logger.error(f"Error getting maintenance action results: {e}")
+            return jsonify({'error': 'Failed to get maintenance action results'}), 500
+
+    # Maintenance action endpoints
+    @app.route('/api/actions', methods=['GET'])
+    def get_actions():
+        """Get registered maintenance actions (optionally filtered by phase)"""
+        query = MaintenanceAction.query
+        if request.args.get('phase'):
+            query = query.filter_by(phase=request.args['phase'])
+        actions = query.order_by(MaintenanceAction.phase, MaintenanceAction.position, MaintenanceAction.id)
+        return jsonify([action.to_dict() for action in actions])
+
+    @app.route('/api/actions', methods=['POST'])
+    def create_action():
+        """Register an action to run when maintenance starts or ends"""
+        try:
+            data = request.get_json()
+            try:
+                _validate_action(data)
+            except ValueError as e:
+                return jsonify({'error': str(e)}), 400
+            
+            action = MaintenanceAction(
+                name=data['name'],
+                kind=data['kind'],
+                phase=data['phase'],
+                server_id=data.get('server_id'),
+                server_prefix=data.get('server_prefix'),
+                command=data.get('command'),
+                url=data.get('url'),
+                method=data.get('method', 'POST'),
+                timeout_seconds=data.get('timeout_seconds'),
+                retries=data.get('retries', 0),
+                concurrency_group=data.get('concurrency_group'),
+                max_concurrency=data.get('max_concurrency'),
+                position=data.get('position', 0),
+                enabled=data.get('enabled', True)
+            )
+            db.session.add(action)
+            db.session.commit()
+            
+            return jsonify(action.to_dict()), 201
+            
+        except Exception as e:
+            app.logger.error(f"Error creating maintenance action: {e}")
+            return jsonify({'error': 'Failed to create maintenance action'}), 500
+
+    @app.route('/api/actions/<int:action_id>', methods=['DELETE'])
+    def delete_action(action_id):
+        """Delete a maintenance action; its recorded results are kept"""
+        action = MaintenanceAction.query.get_or_404(action_id)
+        try:
+            db.session.delete(action)
+            db.session.commit()
+            return jsonify({'message': 'Maintenance action deleted successfully'})
+        except Exception as e:
+            app.logger.error(f"Error deleting maintenance action: {e}")
+            return jsonify({'error': 'Failed to delete maintenance action'}), 500
+
     # Dashboard and utility endpoints
+    @app.route('/api/tags', methods=['GET'])
+    def get_tags():
+        """Tags in use with their server counts"""
+        try:
+            counts = tag_index.counts()
+            return jsonify([
+                {'tag': ServerTag.display(name), 'servers': count} for name, count in counts.items()
+            ])
+        except Exception as e:
+            app.logger.error(f"Error fetching tags: {e}")
+            return jsonify({'error': 'Failed to fetch tags'}), 500
+
     @app.route('/api/dashboard/stats')
     def get_dashboard_stats():
         """Get dashboard statistics"""
         try:
-            total_servers = Server.query.count()
-            online_servers = Server.query.filter_by(status=ServerStatus.ONLINE).count()
-            maintenance_servers = Server.query.filter_by(status=ServerStatus.MAINTENANCE).count()
-            offline_servers = Server.query.filter_by(status=ServerStatus.OFFLINE).count()
-            
-            scheduled_maintenance = MaintenanceSchedule.query.filter_by(status=MaintenanceStatus.SCHEDULED).count()
-            in_progress_maintenance = MaintenanceSchedule.query.filter_by(status=MaintenanceStatus.IN_PROGRESS).count()
-            
-            # Upcoming maintenance (next 24 hours)
-            tomorrow = datetime.utcnow() + timedelta(days=1)
-            upcoming_maintenance = MaintenanceSchedule.query.filter(
-                MaintenanceSchedule.scheduled_start <= tomorrow,
-                MaintenanceSchedule.scheduled_start > datetime.utcnow(),
-                MaintenanceSchedule.status == MaintenanceStatus.SCHEDULED
-            ).count()
-            
-            return jsonify({
-                'servers': {
-                    'total': total_servers,
-                    'online': online_servers,
-                    'maintenance': maintenance_servers,
-                    'offline': offline_servers
-                },
-                'maintenance': {
-                    'scheduled': scheduled_maintenance,
-                    'in_progress': in_progress_maintenance,
-                    'upcoming_24h': upcoming_maintenance
-                }
-            })
-            
+            return jsonify(dashboard_stats.get())
         except Exception as e:
             app.logger.error(f"Error getting dashboard stats: {e}")
             return jsonify({'error': 'Failed to get dashboard stats'}), 500
 
+    @app.route('/api/dashboard/snapshot')
+    def get_dashboard_snapshot():
+        """Everything the dashboard shows, in one request
+        
+        Sections (?include=, default all): stats, the first servers and the
+        latest maintenance windows (?limit= rows each) with their totals, and
+        the next scheduled jobs. The totals come from the cached stats
+        counters, so the lists add one LIMIT query each.
+        """
+        sections = ('stats', 'servers', 'maintenance', 'jobs')
+        try:
+            include = request.args.get('include')
+            if include:
+                wanted = {section.strip() for section in include.split(',') if section.strip()}
+                unknown = wanted.difference(sections)
+                if unknown:
+                    raise ValueError(f"Unknown sections: {', '.join(sorted(unknown))} (available: {', '.join(sections)})")
+                sections = tuple(section for section in sections if section in wanted)
+            limit = _parse_limit(request.args, app.config['DASHBOARD_SNAPSHOT_ITEMS_MAX'])
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        
+        try:
+            return serializers.json_response(
+                _dashboard_snapshot(scheduler, sections, limit or app.config['DASHBOARD_SNAPSHOT_ITEMS'])
+            )
+        except Exception as e:
+            app.logger.error(f"Error getting dashboard snapshot: {e}")
+            return jsonify({'error': 'Failed to get dashboard snapshot'}), 500
+
+    @app.route('/api/events')
+    def event_stream():
+        """Server-Sent Events stream of server and maintenance changes"""
+        # Each open stream holds a worker thread; past the limit clients are sent back to polling
+        subscription = event_broker.subscribe(request.headers.get('Last-Event-ID'))
+        if subscription is None:
+            return jsonify({'error': 'Too many event stream clients'}), 503, {
+                'Retry-After': str(app.config['SSE_RETRY_AFTER_SECONDS'])
+            }
+        
+        response = app.response_class(
+            event_broker.stream(
+                subscription,
+                heartbeat=app.config['SSE_HEARTBEAT_SECONDS'],
+                max_duration=app.config['SSE_MAX_STREAM_SECONDS']
+            ),
+            mimetype='text/event-stream'
+        )
+        response.headers['Cache-Control'] = 'no-cache'
+        response.headers['X-Accel-Buffering'] = 'no'
+        # The stream unsubscribes when it ends, but not if it never started
+        response.call_on_close(lambda: event_broker.unsubscribe(subscription))
+        return response
+
     @app.route('/api/scheduler/jobs')
     def get_scheduled_jobs():
         """Get currently scheduled jobs"""
@@ -399,6 +1085,15 @@ def register_routes(app, scheduler):
             app.logger.error(f"Error getting scheduled jobs: {e}")
             return jsonify({'error': 'Failed to get scheduled jobs'}), 500
 
+    @app.route('/api/scheduler/status')
+    def get_scheduler_status():
+        """Get scheduler mode, leadership and dispatcher lag"""
+        try:
+            return jsonify(scheduler.get_status())
+        except Exception as e:
+            app.logger.error(f"Error getting scheduler status: {e}")
+            return jsonify({'error': 'Failed to get scheduler status'}), 500
+
     # Web interface routes
     @app.route('/servers')
     def servers_page():
@@ -423,85 +1118,299 @@ def register_routes(app, scheduler):
     def internal_error(error):
         return jsonify({'error': 'Internal server error'}), 500
 
-def _import_from_csv(content):
-    """Parse CSV content and extract server data"""
-    import csv
-    from io import StringIO
+def _not_modified(etag):
+    """Empty 304 response carrying the current ETag"""
+    response = current_app.response_class(status=304)
+    response.set_etag(etag)
+    return response
+
+def _collection_response(payload, etag, as_of):
+    """JSON collection response tagged for conditional GET and delta polling; payload may hold encoded rows"""
+    response = serializers.json_response(payload)
+    response.set_etag(etag)
+    response.headers['X-Changes-As-Of'] = as_of.isoformat()
+    return response
+
+def _encode_servers(query, rows, fields=None, single=False):
+    """Encoded JSON list (or with single, object) of Server.projection_query() rows
     
-    servers = []
-    errors = []
+    Their tags are read in one query, and only when fields asks for them.
+    """
+    extra = ()
+    if fields is None or 'tags' in fields:
+        tags = tags_by_server([row.id for row in rows])
+        rows = [(*row, tags[row.id]) for row in rows]
+        extra = (('tags', 'json'),)
+    encoder = serializers.row_encoder(query, extra)
+    return encoder.encode_object(rows[0]) if single else encoder.encode(rows)
+
+def _dashboard_snapshot(scheduler, sections, limit):
+    """Body of /api/dashboard/snapshot; lists carry only the fields the dashboard renders"""
+    stats = dashboard_stats.get()
+    snapshot = {'generated_at': datetime.utcnow().isoformat()}
+    if 'stats' in sections:
+        snapshot['stats'] = stats
+    if 'servers' in sections:
+        fields = ('id', 'name', 'hostname', 'status')
+        query = Server.projection_query(fields).order_by(Server.id).limit(limit)
+        snapshot['servers'] = {
+            'total': stats['servers']['total'],
+            'items': _encode_servers(query, query.all(), fields)
+        }
+    if 'maintenance' in sections:
+        query = MaintenanceSchedule.projection_query(
+            ('id', 'title', 'server_name', 'scheduled_start', 'status')
+        ).order_by(MaintenanceSchedule.scheduled_start.desc(), MaintenanceSchedule.id.desc()).limit(limit)
+        snapshot['maintenance'] = {
+            'total': stats['maintenance']['total'],
+            'items': serializers.row_encoder(query).encode(query.all())
+        }
+    if 'jobs' in sections:
+        # Maintenance starts and ends only, not the dispatcher, reconcile or materialization jobs
+        jobs = [job for job in scheduler.get_scheduled_jobs() if job['id'].startswith(scheduler.JOB_PREFIXES)]
+        upcoming = sorted((job for job in jobs if job['next_run_time']), key=lambda job: job['next_run_time'])
+        snapshot['jobs'] = {'total': len(jobs), 'items': upcoming[:limit]}
+    return snapshot
+
+def _parse_fields(args, available):
+    """?fields= as a tuple in to_dict() order (id is always included), or None for every field"""
+    value = args.get('fields')
+    if not value:
+        return None
+    wanted = {field.strip() for field in value.split(',') if field.strip()}
+    unknown = wanted.difference(available)
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(sorted(unknown))} (available: {', '.join(available)})")
+    return tuple(field for field in available if field in wanted or field == 'id')
+
+def _projected_dict(row, fields):
+    """Serialize the fields of a projection_query(fields) row like to_dict() does"""
+    values = {}
+    for field in fields:
+        value = getattr(row, field)
+        if isinstance(value, datetime):
+            value = value.isoformat()
+        elif isinstance(value, (MaintenanceStatus, ServerStatus)):
+            value = value.value
+        values[field] = value
+    return values
+
+def _parse_export_format(args):
+    export_format = args.get('format', 'csv')
+    if export_format not in exporter.FORMATS:
+        raise ValueError(f"format must be one of: {', '.join(exporter.FORMATS)}")
+    return export_format
+
+def _export_response(name, export_format, chunks):
+    """Streaming download of encoded chunks; rows are read while the response is sent"""
+    def generate():
+        try:
+            yield from chunks
+        except Exception as e:
+            # Headers are gone already; the client sees a truncated file
+            current_app.logger.error(f"Error exporting {name}: {e}")
     
+    filename = f"{name}-{datetime.utcnow().strftime('%Y%m%dT%H%M%SZ')}.{export_format}"
+    response = current_app.response_class(stream_with_context(generate()), mimetype=exporter.FORMATS[export_format])
+    response.headers['Content-Disposition'] = f'attachment; filename="{filename}"'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+def _delta_payload(model, since, as_of, changed):
+    """Body of a ?since= response: changed rows plus ids of deleted rows"""
+    return {
+        'since': since.isoformat(),
+        'as_of': as_of.isoformat(),
+        'changed': changed,
+        'deleted': changes.deleted_since(model, since)
+    }
+
+def _parse_since(args):
+    """Parse ?since= as a naive UTC datetime, or None when absent"""
+    value = args.get('since')
+    if not value:
+        return None
     try:
-        csv_reader = csv.DictReader(StringIO(content))
-        for row_num, row in enumerate(csv_reader, start=2):  # Start at 2 because of header
-            try:
-                # Required fields
-                name = row.get('name', '').strip()
-                hostname = row.get('hostname', '').strip()
-                ip_address = row.get('ip_address', '').strip()
-                
-                if not name or not hostname or not ip_address:
-                    errors.append(f"Row {row_num}: Missing required fields (name, hostname, ip_address)")
-                    continue
-                
-                servers.append({
-                    'name': name,
-                    'hostname': hostname,
-                    'ip_address': ip_address,
-                    'description': row.get('description', '').strip()
-                })
-                
-            except Exception as e:
-                errors.append(f"Row {row_num}: {str(e)}")
-                
-    except Exception as e:
-        errors.append(f"CSV parsing error: {str(e)}")
+        since = parser.parse(value)
+    except (ValueError, OverflowError):
+        raise ValueError(f"Invalid 'since' timestamp: {value}")
+    if since.tzinfo is not None:
+        since = since.astimezone(pytz.utc).replace(tzinfo=None)
+    return since
+
+def _parse_window(data):
+    """Parse and validate scheduled_start/scheduled_end from a request body"""
+    try:
+        scheduled_start = parser.parse(data['scheduled_start'])
+        scheduled_end = parser.parse(data['scheduled_end'])
+    except (TypeError, ValueError, OverflowError):
+        raise ValueError('Invalid scheduled_start or scheduled_end')
+    
+    if scheduled_start >= scheduled_end:
+        raise ValueError('Start time must be before end time')
+    
+    if scheduled_start <= datetime.utcnow():
+        raise ValueError('Start time must be in the future')
+    
+    return scheduled_start, scheduled_end
+
+def _resolve_server_ids(data):
+    """Requested server ids (in order) and the set of those that exist, from 'server_ids' or 'filter'"""
+    if 'server_ids' in data:
+        requested_ids = [int(server_id) for server_id in data['server_ids']]
+        found_ids = set()
+        for index in range(0, len(requested_ids), 500):
+            found_ids.update(server_id for (server_id,) in db.session.query(Server.id).filter(
+                Server.id.in_(requested_ids[index:index + 500])
+            ))
+        return requested_ids, found_ids
+    
+    server_query = _filter_server_query(db.session.query(Server.id), data['filter'] or {})
+    requested_ids = [server_id for (server_id,) in server_query.order_by(Server.id)]
+    return requested_ids, set(requested_ids)
+
+def _conflict_response(conflicts):
+    """409 listing the active windows a new or updated window overlaps"""
+    return jsonify({
+        'error': 'Maintenance window overlaps existing maintenance on this server',
+        'conflicts': conflicts
+    }), 409
+
+def _validate_recurrence(data, scheduled_start=None, scheduled_end=None):
+    """Reject a recurring window whose recurring_pattern cannot be parsed or whose occurrences would overlap"""
+    if data.get('recurring') and data.get('recurring_pattern'):
+        recurrence.parse_pattern(data['recurring_pattern'])
+        if scheduled_start is not None:
+            recurrence.check_duration(data['recurring_pattern'], scheduled_start, scheduled_end - scheduled_start)
+
+def _validate_action(data):
+    """Validate a maintenance action definition from a request body"""
+    for field in ('name', 'kind', 'phase'):
+        if not data.get(field):
+            raise ValueError(f'Missing required field: {field}')
+    if data['kind'] not in ACTION_TYPES:
+        raise ValueError(f"kind must be one of: {', '.join(sorted(ACTION_TYPES))}")
+    if data['phase'] not in PHASES:
+        raise ValueError(f"phase must be one of: {', '.join(PHASES)}")
+    if data['kind'] == 'shell':
+        if not current_app.config['ACTION_SHELL_ENABLED']:
+            raise ValueError('Shell actions are disabled (set ACTION_SHELL_ENABLED)')
+        if not data.get('command'):
+            raise ValueError('Missing required field: command')
+    if data['kind'] == 'http' and not str(data.get('url', '')).startswith(('http://', 'https://')):
+        raise ValueError('url must be an http:// or https:// URL')
+    if data.get('server_id') is not None and not db.session.get(Server, data['server_id']):
+        raise ValueError('Server not found')
+    for field in ('timeout_seconds', 'max_concurrency'):
+        if data.get(field) is not None and data[field] <= 0:
+            raise ValueError(f'{field} must be positive')
+    if data.get('retries', 0) < 0:
+        raise ValueError('retries must not be negative')
+
+def _filter_server_query(query, params):
+    """Apply status, name_prefix, cidr and tags filters from request args or a filter object"""
+    status = params.get('status')
+    if status:
+        try:
+            query = query.filter(Server.status == ServerStatus(status))
+        except ValueError:
+            raise ValueError(f'Invalid status: {status}')
+    
+    name_prefix = params.get('name_prefix')
+    if name_prefix:
+        query = query.filter(Server.name.startswith(name_prefix, autoescape=True))
+    
+    cidr = params.get('cidr')
+    if cidr:
+        # One index range scan on ip_key per block
+        query = query.filter(or_(*(Server.ip_key.between(first, last) for first, last in parse_cidrs(cidr))))
+    
+    expression = params.get('tags')
+    if expression:
+        # e.g. 'tag:db AND region:eu AND NOT tag:canary', resolved by the bitmap index
+        if not isinstance(expression, str):
+            raise ValueError('tags must be a tag expression string')
+        query = query.filter(filter_ids(Server.id, tag_index.resolve(expression)))
     
-    return servers, errors
+    return query
 
-def _import_from_json(content):
-    """Parse JSON content and extract server data"""
-    import json
+def _filter_maintenance_query(query, args):
+    """Apply status, server_id and from/to filters from request args"""
+    statuses = args.get('status')
+    if statuses:
+        try:
+            wanted = [MaintenanceStatus(value.strip()) for value in statuses.split(',') if value.strip()]
+        except ValueError:
+            raise ValueError(f'Invalid status: {statuses}')
+        query = query.filter(MaintenanceSchedule.status.in_(wanted))
     
-    servers = []
-    errors = []
+    server_id = args.get('server_id')
+    if server_id:
+        try:
+            query = query.filter(MaintenanceSchedule.server_id == int(server_id))
+        except ValueError:
+            raise ValueError(f'Invalid server_id: {server_id}')
     
-    try:
-        data = json.loads(content)
-        
-        # Support both array of servers and single server object
-        if isinstance(data, dict):
-            data = [data]
-        elif not isinstance(data, list):
-            errors.append("JSON must contain an array of server objects or a single server object")
-            return servers, errors
-        
-        for index, server_data in enumerate(data):
+    for param, column_filter in (('from', MaintenanceSchedule.scheduled_start.__ge__),
+                                 ('to', MaintenanceSchedule.scheduled_start.__lt__)):
+        value = args.get(param)
+        if value:
             try:
-                name = server_data.get('name', '').strip()
-                hostname = server_data.get('hostname', '').strip()
-                ip_address = server_data.get('ip_address', '').strip()
-                
-                if not name or not hostname or not ip_address:
-                    errors.append(f"Server {index + 1}: Missing required fields (name, hostname, ip_address)")
-                    continue
-                
-                servers.append({
-                    'name': name,
-                    'hostname': hostname,
-                    'ip_address': ip_address,
-                    'description': server_data.get('description', '').strip()
-                })
-                
-            except Exception as e:
-                errors.append(f"Server {index + 1}: {str(e)}")
-                
-    except json.JSONDecodeError as e:
-        errors.append(f"Invalid JSON format: {str(e)}")
-    except Exception as e:
-        errors.append(f"JSON parsing error: {str(e)}")
+                query = query.filter(column_filter(parser.parse(value)))
+            except (ValueError, OverflowError):
+                raise ValueError(f"Invalid '{param}' date: {value}")
+    
+    return query
+
+def _parse_range(args, max_days):
+    """Parse the required from/to args of a range query"""
+    try:
+        range_from = parser.parse(args['from'])
+        range_to = parser.parse(args['to'])
+    except KeyError:
+        raise ValueError("Both 'from' and 'to' are required")
+    except (ValueError, OverflowError):
+        raise ValueError("Invalid 'from' or 'to' date")
     
-    return servers, errors
+    if range_from >= range_to:
+        raise ValueError("'from' must be before 'to'")
+    if range_to - range_from > timedelta(days=max_days):
+        raise ValueError(f'Range is limited to {max_days} days')
+    return range_from, range_to
+
+def _availability_report(server_ids, range_from, range_to, per_server=False):
+    """history.availability() for a request range, with the range echoed back"""
+    report = history.availability(server_ids, range_from, range_to, per_server)
+    report['from'] = range_from.isoformat()
+    report['to'] = range_to.isoformat()
+    return report
+
+def _parse_limit(args, max_limit):
+    """Return the requested page size, or None when no limit was given"""
+    limit = args.get('limit')
+    if limit is None and not args.get('cursor'):
+        return None
+    try:
+        limit = int(limit) if limit is not None else max_limit
+    except ValueError:
+        raise ValueError(f'Invalid limit: {limit}')
+    if limit < 1:
+        raise ValueError('Limit must be positive')
+    return min(limit, max_limit)
+
+def _encode_cursor(scheduled_start, maintenance_id):
+    """Encode a (scheduled_start, id) keyset position as an opaque token"""
+    raw = f'{scheduled_start.isoformat()}|{maintenance_id}'
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii')
+
+def _decode_cursor(cursor):
+    """Decode a token produced by _encode_cursor"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor.encode('ascii')).decode('utf-8')
+        start, maintenance_id = raw.rsplit('|', 1)
+        return datetime.fromisoformat(start), int(maintenance_id)
+    except (ValueError, UnicodeError):
+        raise ValueError('Invalid cursor')
 
 if __name__ == '__main__':
     app = create_app()
@@ -0,0 +1,88 @@
+import hashlib
+import threading
+import time
+from datetime import datetime, timedelta
+from sqlalchemy import event, func, select
+from models import db, Server, MaintenanceSchedule, DeletedRecord
+
+# Request args that never change the content of a collection response
+_VOLATILE_ARGS = {'since', '_'}
+
+_TOMBSTONED_MODELS = (Server, MaintenanceSchedule)
+
+def collection_version(model):
+    """Cheap change marker for a table: row count, newest update and newest deletion"""
+    last_deleted = select(func.max(DeletedRecord.deleted_at)).where(
+        DeletedRecord.table_name == model.__tablename__
+    ).scalar_subquery()
+    return tuple(db.session.execute(
+        select(func.count(model.id), func.max(model.updated_at), last_deleted)
+    ).one())
+
+def collection_etag(model, args):
+    """ETag for a collection response: the table version plus the request filters"""
+    params = sorted((key, value) for key, value in args.items(multi=True) if key not in _VOLATILE_ARGS)
+    marker = repr((model.__tablename__, collection_version(model), params))
+    return hashlib.sha1(marker.encode('utf-8')).hexdigest()
+
+def changes_as_of(app):
+    """Timestamp a client should send as ?since= on its next poll
+
+    It lags the clock by DELTA_SAFETY_WINDOW so that rows stamped just
+    before a slow transaction committed are delivered again rather than
+    missed; clients apply the feed idempotently by id.
+    """
+    return datetime.utcnow() - timedelta(seconds=app.config['DELTA_SAFETY_WINDOW'])
+
+def deleted_since(model, since):
+    """Ids of rows of model deleted after since"""
+    return [
+        record_id for (record_id,) in db.session.query(DeletedRecord.record_id).filter(
+            DeletedRecord.table_name == model.__tablename__,
+            DeletedRecord.deleted_at > since
+        )
+    ]
+
+def retention_cutoff(app):
+    """Oldest ?since= value for which tombstones are still complete"""
+    return datetime.utcnow() - timedelta(days=app.config['DELETED_RECORD_RETENTION_DAYS'])
+
+def prune_tombstones(app):
+    """Remove tombstones older than the retention period"""
+    removed = DeletedRecord.query.filter(DeletedRecord.deleted_at < retention_cutoff(app)).delete()
+    db.session.commit()
+    return removed
+
+def watch_collections(app, broker, interval):
+    """Publish 'servers.changed'/'maintenance.changed' events for writes made by other processes
+
+    Event streams only see events published in their own process; when
+    jobs run in another process (leader election or a standalone
+    scheduler) this polls the cheap collection versions instead, and only
+    while someone is subscribed.
+    """
+    def run():
+        versions = {}
+        while True:
+            time.sleep(interval)
+            if not broker.subscriber_count():
+                continue
+            try:
+                with app.app_context():
+                    for model, event_type in ((Server, 'servers.changed'), (MaintenanceSchedule, 'maintenance.changed')):
+                        version = collection_version(model)
+                        if model in versions and versions[model] != version:
+                            broker.publish(event_type, {})
+                        versions[model] = version
+            except Exception as e:
+                app.logger.error(f"Error checking collection versions: {e}")
+
+    threading.Thread(target=run, name='collection-watcher', daemon=True).start()
+
+def init_app(app):
+    event.listen(db.session, 'before_flush', _record_tombstones)
+
+def _record_tombstones(session, flush_context, instances):
+    for instance in list(session.deleted):
+        if isinstance(instance, _TOMBSTONED_MODELS):
+            session.add(DeletedRecord(table_name=instance.__tablename__, record_id=instance.id))
@@ -31,6 +31,31 @@ class Config:
     # APScheduler settings
     SCHEDULER_TIMEZONE = os.environ.get('TIMEZONE', 'UTC')
     SCHEDULER_API_ENABLED = True
+    # 'memory' rebuilds jobs from the schedule table on every start; 'sqlalchemy'
+    # keeps them in the apscheduler_jobs table (of SCHEDULER_JOBSTORE_URL, default
+    # the app database) and only reconciles differences at startup
+    SCHEDULER_JOBSTORE = os.environ.get('SCHEDULER_JOBSTORE', 'memory')
+    SCHEDULER_JOBSTORE_URL = os.environ.get('SCHEDULER_JOBSTORE_URL')
+    SCHEDULER_MISFIRE_GRACE_TIME = int(os.environ.get('SCHEDULER_MISFIRE_GRACE_TIME', 60))  # seconds
+    # Multi-process deployments: only the holder of a database lease runs jobs.
+    # Set SCHEDULER_RUN_JOBS=false on web processes when a dedicated
+    # scheduler_worker.py process runs the jobs.
+    SCHEDULER_LEADER_ELECTION = os.environ.get('SCHEDULER_LEADER_ELECTION', 'False').lower() in ['true', '1', 'on']
+    SCHEDULER_RUN_JOBS = os.environ.get('SCHEDULER_RUN_JOBS', 'True').lower() in ['true', '1', 'on']
+    SCHEDULER_LEASE_TTL = int(os.environ.get('SCHEDULER_LEASE_TTL', 30))  # seconds
+    # 'jobs' adds two date jobs per maintenance window; 'dispatcher' runs one
+    # periodic job that applies every due start/end in batched UPDATEs
+    SCHEDULER_MODE = os.environ.get('SCHEDULER_MODE', 'jobs')
+    SCHEDULER_DISPATCH_TICK = float(os.environ.get('SCHEDULER_DISPATCH_TICK', 1))  # seconds
+    SCHEDULER_DISPATCH_HORIZON = int(os.environ.get('SCHEDULER_DISPATCH_HORIZON', 600))  # seconds loaded ahead
+    SCHEDULER_DISPATCH_REFRESH = int(os.environ.get('SCHEDULER_DISPATCH_REFRESH', 10))  # seconds
+    SCHEDULER_DISPATCH_BATCH_SIZE = int(os.environ.get('SCHEDULER_DISPATCH_BATCH_SIZE', 500))
+    # Starts later than the misfire grace time: 'run' them anyway or 'skip' them, completing
+    # the window as missed without taking its server down (jobs and dispatcher mode alike)
+    SCHEDULER_MISFIRE_POLICY = os.environ.get('SCHEDULER_MISFIRE_POLICY', 'run')
+    SCHEDULER_DISPATCH_COALESCE = os.environ.get('SCHEDULER_DISPATCH_COALESCE', 'True').lower() in ['true', '1', 'on']
+    # Sweep for windows whose transitions were missed (0 = only at startup)
+    SCHEDULER_RECONCILE_INTERVAL = int(os.environ.get('SCHEDULER_RECONCILE_INTERVAL', 300))  # seconds
     
     # Application settings
     FLASK_ENV = os.environ.get('FLASK_ENV', 'production')
@@ -38,6 +63,62 @@ class Config:
     HOST = os.environ.get('HOST', '0.0.0.0')
     PORT = int(os.environ.get('PORT', 5000))
     
+    # API settings
+    MAINTENANCE_PAGE_SIZE_MAX = int(os.environ.get('MAINTENANCE_PAGE_SIZE_MAX', 1000))
+    DASHBOARD_STATS_TTL = int(os.environ.get('DASHBOARD_STATS_TTL', 10))  # seconds
+    DASHBOARD_SNAPSHOT_ITEMS = int(os.environ.get('DASHBOARD_SNAPSHOT_ITEMS', 5))  # rows per list in the snapshot
+    DASHBOARD_SNAPSHOT_ITEMS_MAX = int(os.environ.get('DASHBOARD_SNAPSHOT_ITEMS_MAX', 100))
+    DELTA_SAFETY_WINDOW = int(os.environ.get('DELTA_SAFETY_WINDOW', 5))  # seconds
+    DELETED_RECORD_RETENTION_DAYS = int(os.environ.get('DELETED_RECORD_RETENTION_DAYS', 7))
+    BULK_SCHEDULE_MAX = int(os.environ.get('BULK_SCHEDULE_MAX', 10000))
+    PLACEMENT_MAX_SERVERS = int(os.environ.get('PLACEMENT_MAX_SERVERS', 50000))
+    IMPORT_CHUNK_SIZE = int(os.environ.get('IMPORT_CHUNK_SIZE', 500))
+    IMPORT_MAX_ERRORS = int(os.environ.get('IMPORT_MAX_ERRORS', 1000))  # error messages returned, not tolerated
+    # Recurring maintenance: occurrences within the horizon are rows, later ones are expanded on demand
+    RECURRENCE_HORIZON_DAYS = int(os.environ.get('RECURRENCE_HORIZON_DAYS', 7))
+    RECURRENCE_EXPAND_MAX_DAYS = int(os.environ.get('RECURRENCE_EXPAND_MAX_DAYS', 366))
+    CALENDAR_MAX_BUCKETS = int(os.environ.get('CALENDAR_MAX_BUCKETS', 2000))
+    CALENDAR_MAX_LANES = int(os.environ.get('CALENDAR_MAX_LANES', 1000))
+    AVAILABILITY_MAX_DAYS = int(os.environ.get('AVAILABILITY_MAX_DAYS', 1100))  # longest availability report range
+    # Server search (search.py): 'auto' uses SQLite FTS5 when available, 'memory' the in-process index
+    SEARCH_BACKEND = os.environ.get('SEARCH_BACKEND', 'auto')
+    SEARCH_PAGE_SIZE_MAX = int(os.environ.get('SEARCH_PAGE_SIZE_MAX', 200))
+    # Tag bitmap index (tags.py): how often to pick up tag changes made by other processes
+    TAG_INDEX_SYNC_SECONDS = float(os.environ.get('TAG_INDEX_SYNC_SECONDS', 2))
+    
+    # Maintenance actions (actions.py): pool size bounds all running actions,
+    # ACTION_GROUP_CONCURRENCY each concurrency group without its own limit
+    ACTION_MAX_WORKERS = int(os.environ.get('ACTION_MAX_WORKERS', 32))
+    ACTION_GROUP_CONCURRENCY = int(os.environ.get('ACTION_GROUP_CONCURRENCY', 8))
+    ACTION_DEFAULT_TIMEOUT = float(os.environ.get('ACTION_DEFAULT_TIMEOUT', 60))  # seconds
+    ACTION_RETRY_DELAY = float(os.environ.get('ACTION_RETRY_DELAY', 1))  # seconds, doubled per retry
+    ACTION_OUTPUT_LIMIT = int(os.environ.get('ACTION_OUTPUT_LIMIT', 4000))  # characters kept per result
+    # Shell actions run commands on the scheduler host; they can only be registered when enabled
+    ACTION_SHELL_ENABLED = os.environ.get('ACTION_SHELL_ENABLED', 'False').lower() in ['true', '1', 'on']
+    
+    # Health probing (prober.py): servers that stop answering are marked offline
+    PROBE_ENABLED = os.environ.get('PROBE_ENABLED', 'False').lower() in ['true', '1', 'on']
+    PROBE_MODE = os.environ.get('PROBE_MODE', 'tcp')  # 'tcp' connect or 'http' GET
+    PROBE_PORT = int(os.environ.get('PROBE_PORT', 22))
+    PROBE_HTTP_PATH = os.environ.get('PROBE_HTTP_PATH', '/')
+    PROBE_TIMEOUT = float(os.environ.get('PROBE_TIMEOUT', 2))  # seconds
+    PROBE_CONCURRENCY = int(os.environ.get('PROBE_CONCURRENCY', 512))  # open sockets; keep below the file limit
+    PROBE_INTERVAL = float(os.environ.get('PROBE_INTERVAL', 60))  # seconds between checks of a server
+    PROBE_MAX_INTERVAL = float(os.environ.get('PROBE_MAX_INTERVAL', 600))  # back-off cap for servers that are down
+    PROBE_FAILURE_THRESHOLD = int(os.environ.get('PROBE_FAILURE_THRESHOLD', 2))  # failed checks before offline
+    # Probe servers when their maintenance ends and mark the unreachable ones offline
+    PROBE_RECOVERY_CHECK = os.environ.get('PROBE_RECOVERY_CHECK', 'False').lower() in ['true', '1', 'on']
+    
+    # Server-Sent Events (/api/events); every open stream holds a worker thread
+    SSE_QUEUE_SIZE = int(os.environ.get('SSE_QUEUE_SIZE', 100))
+    SSE_HISTORY_SIZE = int(os.environ.get('SSE_HISTORY_SIZE', 256))
+    SSE_HEARTBEAT_SECONDS = int(os.environ.get('SSE_HEARTBEAT_SECONDS', 15))
+    SSE_MAX_STREAM_SECONDS = int(os.environ.get('SSE_MAX_STREAM_SECONDS', 300))
+    SSE_CHANGE_POLL_SECONDS = int(os.environ.get('SSE_CHANGE_POLL_SECONDS', 5))  # multi-process only
+    # Open streams per process; keep it below the worker's thread count (gunicorn --threads) so API calls still get one
+    SSE_MAX_SUBSCRIBERS = int(os.environ.get('SSE_MAX_SUBSCRIBERS', 4))
+    SSE_RETRY_AFTER_SECONDS = int(os.environ.get('SSE_RETRY_AFTER_SECONDS', 30))  # Retry-After of refused streams
+    
     # Logging
     LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO')
 
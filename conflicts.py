@@ -0,0 +1,71 @@
+from models import db, MaintenanceSchedule
+import recurrence
+
+# Windows that still hold (or will hold) their server
+ACTIVE_STATUSES = MaintenanceSchedule.ACTIVE_STATUSES
+
+def find_conflicts(server_id, start, end, exclude_ids=(), exclude_series_id=None):
+    """Active windows of a server overlapping [start, end), in start order
+
+    Includes occurrences of recurring series beyond the materialized
+    horizon, shaped like recurrence.expand() entries ('virtual': True).
+    """
+    found = find_conflicts_bulk([server_id], start, end, exclude_ids, exclude_series_id).get(server_id, [])
+    conflicts = _load([entry for entry in found if isinstance(entry, int)])
+    conflicts.extend(entry for entry in found if isinstance(entry, dict))
+    return sorted(conflicts, key=lambda conflict: conflict['scheduled_start'])
+
+def find_conflicts_bulk(server_ids, start, end, exclude_ids=(), exclude_series_id=None, chunk_size=500):
+    """{server_id: [conflicting window ids, then virtual occurrence dicts]} for one window [start, end) on many servers
+
+    A window conflicts when it is active and overlaps [start, end)
+    (MaintenanceSchedule.overlapping). Occurrences of active series that
+    are not rows yet are expanded over the same range, so a window is
+    also refused when a recurrence will land on it later. Windows in
+    exclude_ids and the unmaterialized occurrences of exclude_series_id
+    are left out (e.g. those an edit replaces).
+    """
+    conflicts = {}
+    server_ids = list(server_ids)
+    for index in range(0, len(server_ids), chunk_size):
+        chunk = server_ids[index:index + chunk_size]
+        query = MaintenanceSchedule.overlapping(chunk, start, end)
+        if exclude_ids:
+            query = query.where(MaintenanceSchedule.id.notin_(list(exclude_ids)))
+        for server_id, maintenance_id, _, _ in db.session.execute(query.order_by(MaintenanceSchedule.scheduled_start)):
+            conflicts.setdefault(server_id, []).append(maintenance_id)
+        for series, server_name, occurrence_start, occurrence_end in recurrence.expand_spans(start, end, chunk):
+            if series.id != exclude_series_id:
+                conflicts.setdefault(series.server_id, []).append(
+                    recurrence.occurrence_dict(series, server_name, occurrence_start, occurrence_end)
+                )
+    return conflicts
+
+def find_plan_conflicts(placements):
+    """[{server_id, scheduled_start, scheduled_end, conflicts}] for the (server_id, start, end) placements that conflict
+
+    Placements sharing a start slot are checked together with
+    find_conflicts_bulk.
+    """
+    slots = {}
+    for server_id, start, end in placements:
+        slots.setdefault((start, end), []).append(server_id)
+
+    found = []
+    for (start, end), server_ids in slots.items():
+        for server_id, conflicts in find_conflicts_bulk(server_ids, start, end).items():
+            found.append({
+                'server_id': server_id,
+                'scheduled_start': start.isoformat(),
+                'scheduled_end': end.isoformat(),
+                'conflicts': conflicts
+            })
+    return found
+
+def _load(ids):
+    if not ids:
+        return []
+    return [
+        MaintenanceSchedule.row_to_dict(row) for row in
+        MaintenanceSchedule.projection_query().filter(MaintenanceSchedule.id.in_(ids)).order_by(MaintenanceSchedule.scheduled_start)
+    ]
@@ -0,0 +1,322 @@
+import heapq
+import logging
+import threading
+import time
+from datetime import datetime, timedelta
+from sqlalchemy import select, update
+from models import db, Server, MaintenanceSchedule, ServerStatus, MaintenanceStatus
+from history import set_server_status
+
+START = 'start'
+END = 'end'
+
+class TransitionDispatcher:
+    """Apply maintenance start/end transitions in set-based batches
+
+    Upcoming transitions are kept in a heap ordered by time. It holds only
+    the transitions due within `horizon` seconds and is reloaded from the
+    schedule table every `refresh_interval` seconds, so the database stays
+    the source of truth (windows created in other processes are picked up
+    by the next refresh). Each tick pops everything that is due and applies
+    it with one guarded UPDATE per batch of `batch_size` rows.
+
+    Misfire policy: a start more than `misfire_grace_time` late is applied
+    anyway ('run') or its window is completed as missed without taking the
+    server down ('skip'). Late ends are always applied.
+    With `coalesce`, a window whose start and end are both due at once is
+    completed directly instead of flipping its server twice.
+    """
+
+    def __init__(self, owner, tick=1.0, horizon=600, refresh_interval=10, batch_size=500,
+                 misfire_grace_time=60, misfire_policy='run', coalesce=True):
+        self.owner = owner
+        self.tick_interval = tick
+        self.horizon = horizon
+        self.refresh_interval = refresh_interval
+        self.batch_size = batch_size
+        self.misfire_grace_time = misfire_grace_time
+        self.misfire_policy = misfire_policy
+        self.coalesce = coalesce
+        self.logger = logging.getLogger(__name__)
+        self._lock = threading.Lock()
+        self._heap = []
+        self._entries = {}
+        self._loaded_until = None
+        self._refreshed_at = None
+        self._stats = {
+            'ticks': 0,
+            'started': 0,
+            'completed': 0,
+            'skipped': 0,
+            'last_tick_at': None,
+            'last_batch': None,
+            'max_lag_seconds': 0.0
+        }
+
+    def push(self, kind, maintenance_id, run_at):
+        """Queue one transition if it falls inside the loaded horizon"""
+        with self._lock:
+            if self._loaded_until is None or run_at > self._loaded_until:
+                return  # The next refresh loads it
+            self._entries[(kind, maintenance_id)] = run_at
+            heapq.heappush(self._heap, (run_at, kind == END, maintenance_id))
+
+    def discard(self, maintenance_id):
+        """Forget queued transitions of a maintenance window"""
+        with self._lock:
+            self._entries.pop((START, maintenance_id), None)
+            self._entries.pop((END, maintenance_id), None)
+
+    def refresh(self, now=None):
+        """Reload the transitions due before now + horizon from the schedule table"""
+        now = now or datetime.utcnow()
+        until = now + timedelta(seconds=self.horizon)
+
+        starts = select(MaintenanceSchedule.id, MaintenanceSchedule.scheduled_start).where(
+            MaintenanceSchedule.status == MaintenanceStatus.SCHEDULED,
+            MaintenanceSchedule.scheduled_start <= until
+        )
+        ends = select(MaintenanceSchedule.id, MaintenanceSchedule.scheduled_end).where(
+            MaintenanceSchedule.status.in_([MaintenanceStatus.SCHEDULED, MaintenanceStatus.IN_PROGRESS]),
+            MaintenanceSchedule.scheduled_end <= until
+        )
+
+        entries = {}
+        for kind, statement in ((START, starts), (END, ends)):
+            for maintenance_id, run_at in db.session.execute(statement):
+                entries[(kind, maintenance_id)] = run_at
+
+        heap = [(run_at, kind == END, maintenance_id) for (kind, maintenance_id), run_at in entries.items()]
+        heapq.heapify(heap)
+        with self._lock:
+            self._entries = entries
+            self._heap = heap
+            self._loaded_until = until
+            self._refreshed_at = time.monotonic()
+
+    def tick(self):
+        """Apply every transition that is due; runs inside an app context"""
+        now = datetime.utcnow()
+        if self._refreshed_at is None or time.monotonic() - self._refreshed_at >= self.refresh_interval:
+            self.refresh(now)
+
+        due = self._pop_due(now)
+        self._stats['ticks'] += 1
+        self._stats['last_tick_at'] = now.isoformat()
+        if not due:
+            return
+
+        starts, ends, late_starts, max_lag = {}, {}, [], 0.0
+        for kind, maintenance_id, run_at in due:
+            lag = (now - run_at).total_seconds()
+            if kind == START and lag > self.misfire_grace_time and self.misfire_policy == 'skip':
+                late_starts.append(maintenance_id)
+                continue
+            max_lag = max(max_lag, lag)
+            (starts if kind == START else ends)[maintenance_id] = run_at
+
+        coalesced = set(starts) & set(ends) if self.coalesce else set()
+        missed = self._apply_missed(late_starts, now)
+        started = self._apply_starts([i for i in starts if i not in coalesced], now)
+        completed = self._apply_ends(list(ends), now, coalesced)
+        skipped = len(missed)
+
+        batch = {
+            'started': len(started),
+            'completed': len(completed),
+            'skipped': skipped,
+            'max_lag_seconds': round(max_lag, 3)
+        }
+        self._stats['started'] += batch['started']
+        self._stats['completed'] += batch['completed']
+        self._stats['skipped'] += skipped
+        self._stats['last_batch'] = batch
+        self._stats['max_lag_seconds'] = max(self._stats['max_lag_seconds'], batch['max_lag_seconds'])
+
+        if max_lag > max(5 * self.tick_interval, 5):
+            self.logger.warning(f"Maintenance transitions running {max_lag:.1f}s late")
+        self.logger.info(
+            f"Dispatched {batch['started']} starts and {batch['completed']} ends "
+            f"({skipped} skipped, max lag {batch['max_lag_seconds']}s)"
+        )
+
+        self.owner._after_transitions(started, completed, missed)
+
+    def pending(self):
+        """Queued transitions as (kind, maintenance_id, run_at), soonest first"""
+        with self._lock:
+            return sorted(
+                ((kind, maintenance_id, run_at) for (kind, maintenance_id), run_at in self._entries.items()),
+                key=lambda entry: entry[2]
+            )
+
+    def stats(self):
+        with self._lock:
+            pending = len(self._entries)
+        return dict(self._stats, pending=pending, horizon_seconds=self.horizon)
+
+    def _pop_due(self, now):
+        due = []
+        with self._lock:
+            while self._heap and self._heap[0][0] <= now:
+                run_at, is_end, maintenance_id = heapq.heappop(self._heap)
+                kind = END if is_end else START
+                # Entries replaced or discarded since they were pushed are stale
+                if self._entries.get((kind, maintenance_id)) != run_at:
+                    continue
+                del self._entries[(kind, maintenance_id)]
+                due.append((kind, maintenance_id, run_at))
+        return due
+
+    def _apply_starts(self, ids, now):
+        """SCHEDULED -> IN_PROGRESS and servers -> MAINTENANCE; returns [(id, server_id)]"""
+        applied = []
+        for batch in _chunks(ids, self.batch_size):
+            rows = _update_returning(
+                update(MaintenanceSchedule).where(
+                    MaintenanceSchedule.id.in_(batch),
+                    MaintenanceSchedule.status == MaintenanceStatus.SCHEDULED,
+                    MaintenanceSchedule.scheduled_start <= now
+                ).values(status=MaintenanceStatus.IN_PROGRESS, actual_start=now)
+            )
+            _set_server_status({server_id for _, server_id in rows}, ServerStatus.MAINTENANCE)
+            db.session.commit()
+            applied.extend(rows)
+        return applied
+
+    def _apply_missed(self, ids, now):
+        """SCHEDULED -> COMPLETED without touching servers, for starts skipped by the misfire policy"""
+        applied = []
+        for batch in _chunks(ids, self.batch_size):
+            applied.extend(_update_returning(
+                update(MaintenanceSchedule).where(
+                    MaintenanceSchedule.id.in_(batch),
+                    MaintenanceSchedule.status == MaintenanceStatus.SCHEDULED
+                ).values(status=MaintenanceStatus.COMPLETED, actual_start=now, actual_end=now)
+            ))
+            db.session.commit()
+        return applied
+
+    def _apply_ends(self, ids, now, coalesced):
+        """IN_PROGRESS (or coalesced SCHEDULED) -> COMPLETED and servers -> ONLINE; returns [(id, server_id)]"""
+        applied = []
+        for batch in _chunks(ids, self.batch_size):
+            rows = _update_returning(
+                update(MaintenanceSchedule).where(
+                    MaintenanceSchedule.id.in_([i for i in batch if i not in coalesced]),
+                    MaintenanceSchedule.status == MaintenanceStatus.IN_PROGRESS,
+                    MaintenanceSchedule.scheduled_end <= now
+                ).values(status=MaintenanceStatus.COMPLETED, actual_end=now)
+            )
+            # A server may still be held by another window (e.g. an overlapping one started by hand)
+            _set_server_status({server_id for _, server_id in rows}, ServerStatus.ONLINE, unless_in_progress=True)
+
+            skipped_start = [i for i in batch if i in coalesced]
+            if skipped_start:
+                # Missed windows never take their servers down
+                rows += _update_returning(
+                    update(MaintenanceSchedule).where(
+                        MaintenanceSchedule.id.in_(skipped_start),
+                        MaintenanceSchedule.status == MaintenanceStatus.SCHEDULED,
+                        MaintenanceSchedule.scheduled_end <= now
+                    ).values(status=MaintenanceStatus.COMPLETED, actual_start=now, actual_end=now)
+                )
+            db.session.commit()
+            applied.extend(rows)
+        return applied
+
+def sweep_overdue_transitions(cutoff, batch_size=500, skip_late_starts=False):
+    """Bring windows whose transitions were missed (e.g. while the app was down) up to date
+
+    Works in three set-based passes over the status indexes, each a loop
+    of guarded bulk UPDATEs of at most batch_size rows with one commit per
+    batch:
+
+    - SCHEDULED windows that ended before cutoff (with skip_late_starts,
+      the misfire policy 'skip': that started before cutoff) are completed
+      without touching their servers (missed)
+    - SCHEDULED windows that started before cutoff are started
+    - IN_PROGRESS windows that ended before cutoff are completed and their
+      servers released, unless another window still holds them
+
+    Returns (missed, started, completed): missed and completed are
+    (id, server_id) pairs, started are (id, server_id, scheduled_end).
+    """
+    now = datetime.utcnow()
+
+    missed = _sweep(
+        MaintenanceStatus.SCHEDULED,
+        MaintenanceSchedule.scheduled_start if skip_late_starts else MaintenanceSchedule.scheduled_end,
+        cutoff, batch_size,
+        dict(status=MaintenanceStatus.COMPLETED, actual_start=now, actual_end=now)
+    )
+    started = _sweep(
+        MaintenanceStatus.SCHEDULED, MaintenanceSchedule.scheduled_start, cutoff, batch_size,
+        dict(status=MaintenanceStatus.IN_PROGRESS, actual_start=now),
+        lambda rows: _set_server_status({row[1] for row in rows}, ServerStatus.MAINTENANCE),
+        columns=(MaintenanceSchedule.id, MaintenanceSchedule.server_id, MaintenanceSchedule.scheduled_end)
+    )
+    completed = _sweep(
+        MaintenanceStatus.IN_PROGRESS, MaintenanceSchedule.scheduled_end, cutoff, batch_size,
+        dict(status=MaintenanceStatus.COMPLETED, actual_end=now),
+        lambda rows: _set_server_status({row[1] for row in rows}, ServerStatus.ONLINE, unless_in_progress=True)
+    )
+    return missed, started, completed
+
+def _sweep(status, column, cutoff, batch_size, values, after_update=None, columns=None):
+    applied = []
+    while True:
+        ids = list(db.session.execute(
+            select(MaintenanceSchedule.id).where(
+                MaintenanceSchedule.status == status, column <= cutoff
+            ).order_by(column).limit(batch_size)
+        ).scalars())
+        if not ids:
+            break
+        rows = _update_returning(
+            update(MaintenanceSchedule).where(
+                MaintenanceSchedule.id.in_(ids), MaintenanceSchedule.status == status, column <= cutoff
+            ).values(**values),
+            columns
+        )
+        if rows and after_update:
+            after_update(rows)
+        db.session.commit()
+        if not rows:
+            break  # Everything selected was changed concurrently
+        applied.extend(rows)
+    return applied
+
+def _update_returning(statement, columns=None):
+    """Run a guarded UPDATE on maintenance_schedule and return the rows it changed
+
+    The rows are tuples of columns, by default (id, server_id).
+    """
+    columns = columns or (MaintenanceSchedule.id, MaintenanceSchedule.server_id)
+    statement = statement.execution_options(synchronize_session=False)
+    if db.engine.dialect.update_returning:
+        return [tuple(row) for row in db.session.execute(statement.returning(*columns))]
+
+    # Lock the matching rows first so the UPDATE changes exactly these
+    rows = [tuple(row) for row in db.session.execute(
+        select(*columns)
+        .where(*statement.whereclause.clauses)
+        .with_for_update()
+    )]
+    if rows:
+        db.session.execute(statement.where(MaintenanceSchedule.id.in_([row[0] for row in rows])))
+    return rows
+
+def _set_server_status(server_ids, status, unless_in_progress=False):
+    if server_ids:
+        criteria = []
+        if unless_in_progress:
+            criteria.append(~select(MaintenanceSchedule.id).where(
+                MaintenanceSchedule.server_id == Server.id,
+                MaintenanceSchedule.status == MaintenanceStatus.IN_PROGRESS
+            ).exists())
+        set_server_status(server_ids, status, *criteria, source='scheduler')
+
+def _chunks(items, size):
+    for index in range(0, len(items), size):
+        yield items[index:index + size]
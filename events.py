@@ -0,0 +1,131 @@
+import json
+import queue
+import threading
+import time
+from collections import deque
+
+class Subscription:
+    """One connected event-stream client with a bounded backlog"""
+
+    def __init__(self, maxsize):
+        self.queue = queue.Queue(maxsize=maxsize)
+        self.overflowed = False
+
+    def put(self, event):
+        try:
+            self.queue.put_nowait(event)
+        except queue.Full:
+            # A slow client loses events instead of growing the backlog;
+            # it is told to resync and reload instead.
+            self.overflowed = True
+
+    def get(self, timeout):
+        try:
+            return self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def drain(self):
+        while True:
+            try:
+                self.queue.get_nowait()
+            except queue.Empty:
+                return
+
+class EventBroker:
+    """In-process publish/subscribe hub behind the /api/events SSE stream
+
+    Events are (sequence, type, json data) tuples. Their SSE ids are
+    '<epoch>.<sequence>', where the epoch identifies this process, so a
+    short history lets reconnecting clients resume from Last-Event-ID and
+    clients that reconnect to a restarted process are told to resync.
+    """
+
+    def __init__(self, queue_size=100, history_size=256, max_subscribers=None):
+        self.queue_size = queue_size
+        self.max_subscribers = max_subscribers
+        self._lock = threading.Lock()
+        self._subscribers = set()
+        self._history = deque(maxlen=history_size)
+        self._next_id = 1
+        self.epoch = str(int(time.time()))
+
+    def init_app(self, app):
+        self.queue_size = app.config.get('SSE_QUEUE_SIZE', self.queue_size)
+        self.max_subscribers = app.config.get('SSE_MAX_SUBSCRIBERS', self.max_subscribers)
+        self._history = deque(self._history, maxlen=app.config.get('SSE_HISTORY_SIZE', self._history.maxlen))
+
+    def publish(self, event_type, data):
+        """Send an event to every connected subscriber"""
+        with self._lock:
+            event = (self._next_id, event_type, json.dumps(data))
+            self._next_id += 1
+            self._history.append(event)
+            subscribers = list(self._subscribers)
+
+        for subscription in subscribers:
+            subscription.put(event)
+
+    def subscribe(self, last_event_id=None):
+        """Register a subscriber, replaying history after last_event_id if possible
+        
+        Returns None when max_subscribers streams are already open.
+        """
+        subscription = Subscription(self.queue_size)
+        with self._lock:
+            if self.max_subscribers and len(self._subscribers) >= self.max_subscribers:
+                return None
+            self._subscribers.add(subscription)
+            if last_event_id:
+                epoch, _, sequence = last_event_id.partition('.')
+                if epoch != self.epoch or not sequence.isdigit():
+                    subscription.overflowed = True
+                elif self._history and self._history[0][0] > int(sequence) + 1:
+                    subscription.overflowed = True
+                else:
+                    for event in self._history:
+                        if event[0] > int(sequence):
+                            subscription.put(event)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._subscribers.discard(subscription)
+
+    def subscriber_count(self):
+        with self._lock:
+            return len(self._subscribers)
+
+    def stream(self, subscription, heartbeat=15, max_duration=None, retry_ms=2000):
+        """Yield text/event-stream chunks for a subscription until max_duration, then unsubscribe it"""
+        deadline = time.monotonic() + max_duration if max_duration else None
+        try:
+            yield f'retry: {retry_ms}\n\n'
+            while deadline is None or time.monotonic() < deadline:
+                event = subscription.get(timeout=heartbeat)
+
+                if subscription.overflowed:
+                    subscription.drain()
+                    subscription.overflowed = False
+                    yield format_sse('resync', '{}')
+                    continue
+
+                if event is None:
+                    yield ': keepalive\n\n'
+                    continue
+
+                sequence, event_type, data = event
+                yield format_sse(event_type, data, f'{self.epoch}.{sequence}')
+        finally:
+            self.unsubscribe(subscription)
+
+def format_sse(event_type, data, event_id=None):
+    """Encode one server-sent event"""
+    lines = []
+    if event_id is not None:
+        lines.append(f'id: {event_id}')
+    lines.append(f'event: {event_type}')
+    lines.append(f'data: {data}')
+    return '\n'.join(lines) + '\n\n'
+
+event_broker = EventBroker()
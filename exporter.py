@@ -0,0 +1,73 @@
+import csv
+import io
+import json
+from itertools import islice
+from models import Server, MaintenanceSchedule
+from tags import tags_by_server
+
+FORMATS = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson'
+}
+
+# Column order of the exports; the server CSV can be imported again as is
+SERVER_FIELDS = ('id', 'name', 'hostname', 'ip_address', 'status', 'description', 'tags', 'created_at', 'updated_at')
+MAINTENANCE_FIELDS = (
+    'id', 'server_id', 'server_name', 'title', 'description', 'scheduled_start', 'scheduled_end',
+    'actual_start', 'actual_end', 'status', 'recurring', 'recurring_pattern', 'series_id', 'created_at', 'updated_at'
+)
+
+def iter_servers(query, batch_size=1000):
+    """Yield lists of server dicts (like to_dict()) from a Server.projection_query()
+
+    Rows are fetched batch_size at a time from a server-side cursor and
+    the tags of each batch are read with one query, so memory does not
+    grow with the number of servers.
+    """
+    rows = iter(query.order_by(Server.id).yield_per(batch_size))
+    while True:
+        batch = list(islice(rows, batch_size))
+        if not batch:
+            return
+        tags = tags_by_server([row.id for row in batch])
+        yield [Server.row_to_dict(row, tags[row.id]) for row in batch]
+
+def iter_maintenance(query, batch_size=1000):
+    """Yield lists of maintenance dicts (like to_dict()) from a MaintenanceSchedule.projection_query()"""
+    rows = iter(query.order_by(MaintenanceSchedule.scheduled_start.desc(), MaintenanceSchedule.id.desc())
+                .yield_per(batch_size))
+    while True:
+        batch = list(islice(rows, batch_size))
+        if not batch:
+            return
+        yield [MaintenanceSchedule.row_to_dict(row) for row in batch]
+
+def encode(batches, fields, export_format):
+    """Encode batches of dicts as CSV (with a header row) or NDJSON, one string per batch"""
+    if export_format == 'ndjson':
+        for batch in batches:
+            yield ''.join(json.dumps(record, separators=(',', ':')) + '\n' for record in batch)
+        return
+
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(fields)
+    yield _drain(buffer)
+    for batch in batches:
+        writer.writerows([_csv_value(record[field]) for field in fields] for record in batch)
+        yield _drain(buffer)
+
+def _csv_value(value):
+    if value is None:
+        return ''
+    if isinstance(value, bool):
+        return 'true' if value else 'false'
+    if isinstance(value, list):
+        return ';'.join(value)  # Tags, in the form the importer reads
+    return value
+
+def _drain(buffer):
+    value = buffer.getvalue()
+    buffer.seek(0)
+    buffer.truncate()
+    return value
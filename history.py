@@ -0,0 +1,195 @@
+import calendar
+from contextlib import contextmanager
+from datetime import datetime
+from sqlalchemy import event, insert, select, update
+from models import db, Server, ServerStatus, ServerStatusChange
+
+# Compact encodings of ServerStatusChange.status and .source
+STATUS_CODES = {ServerStatus.ONLINE: 0, ServerStatus.MAINTENANCE: 1, ServerStatus.OFFLINE: 2}
+STATUSES = {code: status for status, code in STATUS_CODES.items()}
+SOURCES = ('api', 'scheduler', 'prober', 'import', 'baseline')
+SOURCE_CODES = {source: code for code, source in enumerate(SOURCES)}
+
+def to_epoch(value):
+    """Naive UTC datetime -> epoch seconds"""
+    return calendar.timegm(value.utctimetuple())
+
+def init_app(app):
+    event.listen(db.session, 'after_flush', _record_flushed_changes)
+
+@contextmanager
+def status_source(source):
+    """Attribute server status changes flushed inside the block to source (default 'api')"""
+    previous = db.session.info.get('status_source')
+    db.session.info['status_source'] = source
+    try:
+        yield
+    finally:
+        db.session.info['status_source'] = previous
+
+def record(server_ids, status, source, at=None):
+    """Append one transition to status per server; part of the caller's transaction"""
+    at = to_epoch(at or datetime.utcnow())
+    rows = [
+        {'server_id': server_id, 'changed_at': at, 'status': STATUS_CODES[status], 'source': SOURCE_CODES[source]}
+        for server_id in server_ids
+    ]
+    if rows:
+        db.session.execute(insert(ServerStatusChange), rows)
+
+def set_server_status(server_ids, status, *criteria, source='scheduler', batch_size=500):
+    """Bulk-set the status of servers and record their transitions
+
+    Servers that already have the status, or that do not match the extra
+    criteria, are left alone. Returns the ids of the servers changed; the
+    caller commits.
+    """
+    server_ids = sorted(server_ids)
+    changed = []
+    for index in range(0, len(server_ids), batch_size):
+        statement = update(Server).where(
+            Server.id.in_(server_ids[index:index + batch_size]), Server.status != status, *criteria
+        ).values(status=status).execution_options(synchronize_session=False)
+        if db.engine.dialect.update_returning:
+            batch = list(db.session.execute(statement.returning(Server.id)).scalars())
+        else:
+            # Lock the matching rows first so the UPDATE changes exactly these
+            batch = list(db.session.execute(
+                select(Server.id).where(*statement.whereclause.clauses).with_for_update()
+            ).scalars())
+            if batch:
+                db.session.execute(statement.where(Server.id.in_(batch)))
+        record(batch, status, source)
+        changed.extend(batch)
+    return changed
+
+def record_initial_status(names=None, source='baseline'):
+    """Start the history of servers that have none at their current status
+
+    Runs at startup for servers created before history was kept, and
+    after bulk imports (limited to the imported names).
+    """
+    query = select(Server.id, Server.status).where(
+        ~select(ServerStatusChange.id).where(ServerStatusChange.server_id == Server.id).exists()
+    )
+    if names is not None:
+        query = query.where(Server.name.in_(list(names)))
+
+    at = to_epoch(datetime.utcnow())
+    rows = [
+        {'server_id': server_id, 'changed_at': at, 'status': STATUS_CODES[status or ServerStatus.ONLINE],
+         'source': SOURCE_CODES[source]}
+        for server_id, status in db.session.execute(query)
+    ]
+    for index in range(0, len(rows), 5000):
+        db.session.execute(insert(ServerStatusChange), rows[index:index + 5000])
+    db.session.commit()
+    return len(rows)
+
+def _record_flushed_changes(session, flush_context):
+    """Record status changes of Server objects written through the ORM"""
+    rows = []
+    at = to_epoch(datetime.utcnow())
+    source = SOURCE_CODES[session.info.get('status_source') or 'api']
+    # new/dirty still describe the flushed state here, with ids assigned
+    for instance in session.new:
+        if isinstance(instance, Server):
+            rows.append((instance.id, instance.status or ServerStatus.ONLINE))
+    for instance in session.dirty:
+        if isinstance(instance, Server) and instance not in session.deleted:
+            history = db.inspect(instance).attrs.status.history
+            if history.added and history.deleted and history.added[0] != history.deleted[0]:
+                rows.append((instance.id, history.added[0]))
+    if rows:
+        session.connection().execute(insert(ServerStatusChange.__table__), [
+            {'server_id': server_id, 'changed_at': at, 'status': STATUS_CODES[status], 'source': source}
+            for server_id, status in rows
+        ])
+
+def _initial_statuses(server_ids, at):
+    """{server_id: status code} in effect at epoch second `at`, one index lookup per server"""
+    latest = select(ServerStatusChange.status).where(
+        ServerStatusChange.server_id == Server.id, ServerStatusChange.changed_at <= at
+    ).order_by(ServerStatusChange.changed_at.desc(), ServerStatusChange.id.desc()).limit(1).scalar_subquery()
+    return dict(db.session.connection().execute(select(Server.id, latest).where(Server.id.in_(server_ids))).all())
+
+def availability(server_ids, range_start, range_end, per_server=False, chunk_size=1000):
+    """Time per status of servers over [range_start, range_end), from their transitions
+
+    Per chunk of servers, one query finds each server's status at
+    range_start and one covering-index range scan streams the transitions
+    inside the range in (server, time) order; a single sweep adds up the
+    time between consecutive transitions as the rows arrive. The range is
+    cut off at the current time. Time before a server's first transition
+    is 'untracked'.
+    """
+    start = to_epoch(range_start)
+    end = min(to_epoch(range_end), to_epoch(datetime.utcnow()))
+    server_ids = sorted(set(server_ids))
+    totals = _empty_durations()
+    servers = []
+
+    def close(server_id, durations, cursor, state):
+        durations[state] += max(0, end - cursor)
+        for key, seconds in durations.items():
+            totals[key] += seconds
+        if per_server:
+            servers.append(dict(_summary(durations), server_id=server_id))
+
+    for index in range(0, len(server_ids), chunk_size):
+        chunk = server_ids[index:index + chunk_size]
+        initial = _initial_statuses(chunk, start) if end > start else {}
+        # Core rows: the ORM result layer would cost more than the sweep itself
+        rows = db.session.connection().execute(
+            select(ServerStatusChange.server_id, ServerStatusChange.changed_at, ServerStatusChange.status).where(
+                ServerStatusChange.server_id.in_(chunk),
+                ServerStatusChange.changed_at > start,
+                ServerStatusChange.changed_at < end
+            ).order_by(ServerStatusChange.server_id, ServerStatusChange.changed_at, ServerStatusChange.id)
+        ) if end > start else ()
+
+        pending = iter(chunk)
+        current = None
+        for server_id, changed_at, status in rows:
+            if server_id != current:
+                if current is not None:
+                    close(current, durations, cursor, state)
+                # Servers without transitions in the range keep their initial status throughout
+                for quiet_id in pending:
+                    if quiet_id == server_id:
+                        break
+                    close(quiet_id, _empty_durations(), start, initial.get(quiet_id))
+                current, durations, cursor, state = server_id, _empty_durations(), start, initial.get(server_id)
+            durations[state] += changed_at - cursor
+            cursor, state = changed_at, status
+        if current is not None:
+            close(current, durations, cursor, state)
+        for quiet_id in pending:
+            close(quiet_id, _empty_durations(), start, initial.get(quiet_id))
+
+    result = _summary(totals)
+    result['server_count'] = len(server_ids)
+    if per_server:
+        result['servers'] = servers
+    return result
+
+def _empty_durations():
+    return dict.fromkeys([*STATUSES, None], 0)
+
+def _summary(durations):
+    uptime = durations[STATUS_CODES[ServerStatus.ONLINE]]
+    planned = durations[STATUS_CODES[ServerStatus.MAINTENANCE]]
+    unplanned = durations[STATUS_CODES[ServerStatus.OFFLINE]]
+    tracked = uptime + planned + unplanned
+    return {
+        'uptime_seconds': uptime,
+        'planned_maintenance_seconds': planned,
+        'unplanned_downtime_seconds': unplanned,
+        'untracked_seconds': durations[None],
+        'uptime_percent': _percent(uptime, tracked),
+        # SLA availability: planned maintenance does not count against it
+        'availability_percent': _percent(uptime, uptime + unplanned)
+    }
+
+def _percent(part, whole):
+    return round(100.0 * part / whole, 4) if whole else None
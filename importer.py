@@ -0,0 +1,270 @@
+import csv
+import io
+import json
+from itertools import islice
+from sqlalchemy import insert
+from sqlalchemy.exc import IntegrityError
+from models import db, Server, ServerStatus
+from history import record_initial_status
+from iprange import ip_key
+from tags import insert_tags, normalize_tags, tag_index
+
+def iter_csv_servers(stream):
+    """Lazily parse a binary CSV stream into (server_data, error) pairs"""
+    text = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+    try:
+        csv_reader = csv.DictReader(text)
+        for row_num, row in enumerate(csv_reader, start=2):  # Start at 2 because of header
+            try:
+                yield _clean_server_data(row, f"Row {row_num}")
+            except Exception as e:
+                yield None, f"Row {row_num}: {str(e)}"
+    except Exception as e:
+        yield None, f"CSV parsing error: {str(e)}"
+    finally:
+        text.detach()
+
+def iter_json_servers(stream, chunk_size=65536):
+    """Lazily parse a binary JSON stream (array of objects or one object) into (server_data, error) pairs"""
+    text = io.TextIOWrapper(stream, encoding='utf-8-sig')
+    try:
+        for index, server_data in enumerate(_iter_json_values(text, chunk_size)):
+            try:
+                yield _clean_server_data(server_data, f"Server {index + 1}")
+            except Exception as e:
+                yield None, f"Server {index + 1}: {str(e)}"
+    except json.JSONDecodeError as e:
+        yield None, f"Invalid JSON format: {str(e)}"
+    except ValueError as e:
+        yield None, str(e)
+    except Exception as e:
+        yield None, f"JSON parsing error: {str(e)}"
+    finally:
+        text.detach()
+
+def import_servers(parsed_rows, chunk_size=500, max_errors=1000):
+    """Insert parsed servers in chunked transactions
+
+    Each chunk checks for existing names with one IN query, bulk inserts
+    the rest and commits, so memory is bounded by chunk_size rather than
+    by the size of the upload. Returns the overall counts, the first
+    max_errors error messages and a summary per chunk. Chunks stay
+    committed when later rows fail: committed_rows counts them and partial
+    is set when some rows were imported and others were not.
+    """
+    result = {'success_count': 0, 'error_count': 0, 'errors': [], 'chunks': []}
+
+    def add_error(message):
+        result['error_count'] += 1
+        if len(result['errors']) < max_errors:
+            result['errors'].append(message)
+
+    parsed_rows = iter(parsed_rows)
+    chunk_number = 0
+    while True:
+        chunk = list(islice(parsed_rows, chunk_size))
+        if not chunk:
+            break
+        chunk_number += 1
+        errors_before = result['error_count']
+
+        candidates = {}
+        for server_data, error in chunk:
+            if error:
+                add_error(error)
+            elif server_data['name'] in candidates:
+                add_error(f"Server '{server_data['name']}' appears more than once in the file")
+            else:
+                candidates[server_data['name']] = server_data
+
+        existing = {
+            name for (name,) in db.session.query(Server.name).filter(Server.name.in_(list(candidates)))
+        } if candidates else set()
+        for name in existing:
+            add_error(f"Server '{name}' already exists")
+
+        tags_by_name = {name: data['tags'] for name, data in candidates.items() if name not in existing}
+        new_rows = [
+            {
+                'name': data['name'],
+                'hostname': data['hostname'],
+                'ip_address': data['ip_address'],
+                'ip_key': data['ip_key'],
+                'description': data.get('description', ''),
+                'status': ServerStatus.ONLINE
+            }
+            for name, data in candidates.items() if name not in existing
+        ]
+        imported = _insert_server_chunk(new_rows, tags_by_name, add_error)
+
+        result['success_count'] += imported
+        result['chunks'].append({
+            'chunk': chunk_number,
+            'rows': len(chunk),
+            'imported': imported,
+            'errors': result['error_count'] - errors_before
+        })
+
+    result['committed_rows'] = result['success_count']
+    result['partial'] = bool(result['success_count'] and result['error_count'])
+    return result
+
+def _insert_server_chunk(rows, tags_by_name, add_error):
+    """Bulk insert one chunk (and its tags) in its own transaction; returns the number inserted"""
+    if not rows:
+        return 0
+    try:
+        db.session.execute(insert(Server), rows)
+        insert_tags(tags_by_name)
+        db.session.commit()
+        tag_index.mark_stale()
+        record_initial_status([row['name'] for row in rows], source='import')
+        return len(rows)
+    except IntegrityError:
+        # A concurrent writer took some names; retry the chunk row by row
+        db.session.rollback()
+
+    inserted = []
+    for row in rows:
+        try:
+            with db.session.begin_nested():
+                db.session.execute(insert(Server), [row])
+            inserted.append(row['name'])
+        except IntegrityError:
+            add_error(f"Server '{row['name']}' already exists")
+    insert_tags({name: tags_by_name[name] for name in inserted})
+    db.session.commit()
+    tag_index.mark_stale()
+    record_initial_status(inserted, source='import')
+    return len(inserted)
+
+def _clean_server_data(raw, label):
+    """Validate one parsed record; returns (server_data, None) or (None, error)"""
+    name = (raw.get('name') or '').strip()
+    hostname = (raw.get('hostname') or '').strip()
+    ip_address = (raw.get('ip_address') or '').strip()
+
+    if not name or not hostname or not ip_address:
+        return None, f"{label}: Missing required fields (name, hostname, ip_address)"
+    key = ip_key(ip_address)
+    if key is None:
+        return None, f"{label}: Invalid IP address: {ip_address}"
+
+    try:
+        # A list in JSON; in CSV a string of tags separated by spaces, commas or semicolons
+        tags = normalize_tags(raw.get('tags') or [])
+    except ValueError as e:
+        return None, f"{label}: {e}"
+
+    return {
+        'name': name,
+        'hostname': hostname,
+        'ip_address': ip_address,
+        'ip_key': key,
+        'description': (raw.get('description') or '').strip(),
+        'tags': tags
+    }, None
+
+def _iter_json_values(text, chunk_size):
+    """Yield the elements of a top-level JSON array (or a single object) without loading the whole document
+
+    Only the unparsed tail of the document is kept; errors report the line,
+    column and character offset in the whole document, like json.loads().
+    """
+    decoder = json.JSONDecoder()
+    buffer = ''
+    eof = False
+    consumed, line, column = 0, 1, 1  # of buffer[0] in the document
+
+    def fill():
+        nonlocal buffer, eof
+        data = text.read(chunk_size)
+        if data:
+            buffer += data
+        else:
+            eof = True
+
+    def advance(count):
+        nonlocal buffer, consumed, line, column
+        dropped = buffer[:count]
+        newlines = dropped.count('\n')
+        if newlines:
+            line += newlines
+            column = count - dropped.rfind('\n')
+        else:
+            column += count
+        consumed += count
+        buffer = buffer[count:]
+
+    def skip(characters):
+        while True:
+            advance(len(buffer) - len(buffer.lstrip(characters)))
+            if buffer or eof:
+                return
+            fill()
+
+    def error(message, pos=0):
+        return _decode_error(message, buffer, pos, consumed, line, column)
+
+    skip(' \t\r\n')
+    if not buffer:
+        raise error('Expecting value')
+
+    if buffer[0] != '[':
+        # A single object: small by definition, decode it in one go
+        while not eof:
+            fill()
+        try:
+            value, end = decoder.raw_decode(buffer)
+        except json.JSONDecodeError as e:
+            raise error(e.msg, e.pos) from None
+        extra = buffer[end:].lstrip(' \t\r\n')
+        if extra:
+            raise error('Extra data', len(buffer) - len(extra))
+        if not isinstance(value, dict):
+            raise ValueError("JSON must contain an array of server objects or a single server object")
+        yield value
+        return
+
+    advance(1)
+    expect_value = True
+    while True:
+        skip(' \t\r\n')
+        if not buffer:
+            raise error('Unterminated array')
+        if buffer[0] == ']':
+            advance(1)
+            skip(' \t\r\n')
+            if buffer:
+                raise error('Extra data')
+            return
+        if not expect_value:
+            if buffer[0] != ',':
+                raise error("Expecting ',' delimiter")
+            advance(1)
+            expect_value = True
+            continue
+
+        while True:
+            try:
+                value, end = decoder.raw_decode(buffer)
+                break
+            except json.JSONDecodeError as e:
+                if eof:
+                    raise error(e.msg, e.pos) from None
+                fill()
+        advance(end)
+        expect_value = False
+        yield value
+
+def _decode_error(message, buffer, pos, consumed, line, column):
+    """JSONDecodeError at buffer[pos], where buffer starts at char consumed (line, column) of the document"""
+    newlines = buffer.count('\n', 0, pos)
+    lineno = line + newlines
+    colno = pos - buffer.rfind('\n', 0, pos) if newlines else column + pos
+    # JSONDecodeError derives its position from the document it is given,
+    # of which only the unparsed tail is left here
+    e = json.JSONDecodeError(message, buffer, pos)
+    e.args = (f'{message}: line {lineno} column {colno} (char {consumed + pos})',)
+    e.pos, e.lineno, e.colno = consumed + pos, lineno, colno
+    return e
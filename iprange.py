@@ -0,0 +1,39 @@
+import ipaddress
+
+# IPv4 addresses are keyed as their IPv4-mapped IPv6 form (::ffff:a.b.c.d)
+_MAPPED_PREFIX = b'\0' * 10 + b'\xff\xff'
+
+def ip_key(value):
+    """16-byte key of an IPv4/IPv6 address that sorts in address order, or None if value is not one
+
+    Both versions share one key space, so one B-tree index serves
+    subnets of either.
+    """
+    try:
+        address = ipaddress.ip_address(value.strip())
+    except (AttributeError, ValueError):
+        return None
+    return _MAPPED_PREFIX + address.packed if address.version == 4 else address.packed
+
+def cidr_range(cidr):
+    """(first, last) keys of a CIDR block such as '10.20.0.0/16' or '2001:db8::/32'
+
+    Host bits are ignored ('10.20.1.5/16' is 10.20.0.0/16); a bare
+    address is a block of one. Raises ValueError for anything else.
+    """
+    try:
+        network = ipaddress.ip_network(cidr.strip(), strict=False)
+    except ValueError:
+        raise ValueError(f'Invalid CIDR block: {cidr}')
+    return ip_key(str(network.network_address)), ip_key(str(network.broadcast_address))
+
+def parse_cidrs(value):
+    """Key ranges of a comma-separated string (or a list) of CIDR blocks"""
+    if isinstance(value, str):
+        value = value.split(',')
+    elif not isinstance(value, (list, tuple)):
+        raise ValueError('cidr must be a string or a list of CIDR blocks')
+    blocks = [block for block in value if isinstance(block, str) and block.strip()]
+    if not blocks:
+        raise ValueError('Empty cidr filter')
+    return [cidr_range(block) for block in blocks]
@@ -0,0 +1,127 @@
+import logging
+import os
+import socket
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+from sqlalchemy import or_, update
+from sqlalchemy.exc import IntegrityError
+from models import db, SchedulerLease
+
+class LeaderElection:
+    """Elect one process to run scheduler jobs through a lease row in the app database
+
+    Every candidate tries to take or renew the lease every ttl/3 seconds
+    with a conditional UPDATE, which works the same on SQLite and
+    PostgreSQL. The holder steps down as soon as it fails to renew for
+    two intervals, before the lease can expire and be taken by someone
+    else. Host clocks are assumed to be NTP-synchronised.
+    """
+
+    def __init__(self, app, name='maintenance-scheduler', ttl=30, on_elected=None, on_demoted=None, on_tick=None):
+        self.app = app
+        self.name = name
+        self.ttl = ttl
+        self.interval = ttl / 3.0
+        self.holder = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.on_elected = on_elected
+        self.on_demoted = on_demoted
+        self.on_tick = on_tick
+        self.is_leader = False
+        self.logger = logging.getLogger(__name__)
+        self._renewed_at = 0.0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._campaign()
+        self._thread = threading.Thread(target=self._run, name='leader-election', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop campaigning and release the lease so another process takes over at once"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.interval)
+        if self.is_leader:
+            self._set_leader(False)
+            try:
+                with self.app.app_context():
+                    db.session.execute(
+                        update(SchedulerLease)
+                        .where(SchedulerLease.name == self.name, SchedulerLease.holder == self.holder)
+                        .values(expires_at=datetime.utcnow())
+                    )
+                    db.session.commit()
+            except Exception as e:
+                self.logger.error(f"Error releasing scheduler lease: {e}")
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self._campaign()
+
+    def _campaign(self):
+        try:
+            with self.app.app_context():
+                acquired = self._try_acquire()
+        except Exception as e:
+            self.logger.error(f"Error renewing scheduler lease: {e}")
+            acquired = False
+
+        if acquired:
+            self._renewed_at = time.monotonic()
+            if not self.is_leader:
+                self._set_leader(True)
+        elif self.is_leader and (not self._holds_lease() or time.monotonic() - self._renewed_at >= self.ttl - self.interval):
+            self._set_leader(False)
+
+        if self.is_leader and self.on_tick:
+            self.on_tick()
+
+    def _holds_lease(self):
+        # A failed UPDATE can mean another holder (step down now) or a
+        # database error (keep going until the safety margin runs out).
+        try:
+            with self.app.app_context():
+                lease = db.session.get(SchedulerLease, self.name)
+                return lease is not None and lease.holder == self.holder
+        except Exception:
+            return True
+
+    def _try_acquire(self):
+        now = datetime.utcnow()
+        expires_at = now + timedelta(seconds=self.ttl)
+        result = db.session.execute(
+            update(SchedulerLease)
+            .where(
+                SchedulerLease.name == self.name,
+                or_(SchedulerLease.holder == self.holder, SchedulerLease.expires_at < now)
+            )
+            .values(holder=self.holder, expires_at=expires_at)
+        )
+        if result.rowcount:
+            db.session.commit()
+            return True
+
+        if db.session.get(SchedulerLease, self.name) is not None:
+            db.session.rollback()
+            return False
+
+        try:
+            db.session.add(SchedulerLease(name=self.name, holder=self.holder, expires_at=expires_at))
+            db.session.commit()
+            return True
+        except IntegrityError:
+            db.session.rollback()
+            return False
+
+    def _set_leader(self, is_leader):
+        self.is_leader = is_leader
+        self.logger.info(f"{self.holder} {'acquired' if is_leader else 'lost'} the scheduler lease")
+        callback = self.on_elected if is_leader else self.on_demoted
+        if callback:
+            try:
+                callback()
+            except Exception as e:
+                self.logger.error(f"Error handling scheduler leadership change: {e}")
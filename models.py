@@ -1,6 +1,9 @@
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import bindparam, inspect, select, text, update
+from sqlalchemy.orm import joinedload, validates
 from datetime import datetime
 from enum import Enum
+from iprange import ip_key
 
 db = SQLAlchemy()
 
@@ -19,16 +22,22 @@ class Server(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), nullable=False, unique=True)
     hostname = db.Column(db.String(255), nullable=False)
-    ip_address = db.Column(db.String(15), nullable=False)
+    ip_address = db.Column(db.String(45), nullable=False)  # IPv4 or IPv6 text
+    # iprange.ip_key(ip_address): subnet filters become index range scans
+    ip_key = db.Column(db.LargeBinary(16), index=True)
     status = db.Column(db.Enum(ServerStatus), default=ServerStatus.ONLINE)
     description = db.Column(db.Text)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
-    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)
     
     # Relationship to maintenance schedules
     maintenance_schedules = db.relationship('MaintenanceSchedule', backref='server', lazy=True, cascade='all, delete-orphan')
+    maintenance_series = db.relationship('MaintenanceSeries', backref='server', lazy=True, cascade='all, delete-orphan')
+    maintenance_actions = db.relationship('MaintenanceAction', backref='server', lazy=True, cascade='all, delete-orphan')
+    tags = db.relationship('ServerTag', lazy=True, cascade='all, delete-orphan')
     
-    def to_dict(self):
+    def to_dict(self, tags=None):
+        """tags: the server's display tags when already loaded in bulk (tags.tags_by_server)"""
         return {
             'id': self.id,
             'name': self.name,
@@ -36,9 +45,56 @@ class Server(db.Model):
             'ip_address': self.ip_address,
             'status': self.status.value,
             'description': self.description,
+            'tags': sorted(ServerTag.display(tag.name) for tag in self.tags) if tags is None else tags,
             'created_at': self.created_at.isoformat(),
             'updated_at': self.updated_at.isoformat()
         }
+    
+    # to_dict() keys, for sparse fieldsets (?fields=); tags are not a column
+    FIELDS = ('id', 'name', 'hostname', 'ip_address', 'status', 'description', 'tags', 'created_at', 'updated_at')
+    
+    @classmethod
+    def projection_query(cls, fields=None):
+        """Column-only query of the to_dict() columns, or of those in fields; serialize full rows with row_to_dict()"""
+        return db.session.query(*(
+            getattr(cls, name) for name in cls.FIELDS if name != 'tags' and (fields is None or name in fields)
+        ))
+    
+    @staticmethod
+    def row_to_dict(row, tags):
+        """Serialize a projection_query() row exactly like to_dict()"""
+        return {
+            'id': row.id,
+            'name': row.name,
+            'hostname': row.hostname,
+            'ip_address': row.ip_address,
+            'status': row.status.value,
+            'description': row.description,
+            'tags': tags,
+            'created_at': row.created_at.isoformat(),
+            'updated_at': row.updated_at.isoformat()
+        }
+    
+    @validates('ip_address')
+    def _set_ip_key(self, key, value):
+        self.ip_key = ip_key(value)
+        return value
+
+class ServerTag(db.Model):
+    """A tag of a server, stored as '<key>:<value>': 'tag:db' for a plain tag, 'region:eu' for a label"""
+    id = db.Column(db.Integer, primary_key=True)
+    server_id = db.Column(db.Integer, db.ForeignKey('server.id'), nullable=False)
+    name = db.Column(db.String(100), nullable=False)
+    
+    __table_args__ = (
+        db.UniqueConstraint('server_id', 'name', name='uq_server_tag_server_name'),
+        db.Index('ix_server_tag_name_server', 'name', 'server_id'),
+    )
+    
+    @staticmethod
+    def display(name):
+        """Plain tags without their 'tag:' key"""
+        return name[4:] if name.startswith('tag:') else name
 
 class MaintenanceSchedule(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -51,9 +107,24 @@ class MaintenanceSchedule(db.Model):
     actual_end = db.Column(db.DateTime)
     status = db.Column(db.Enum(MaintenanceStatus), default=MaintenanceStatus.SCHEDULED)
     recurring = db.Column(db.Boolean, default=False)
-    recurring_pattern = db.Column(db.String(50))  # e.g., 'weekly', 'monthly'
+    recurring_pattern = db.Column(db.String(255))  # 'daily'/'weekly'/'monthly', an RRULE or a cron expression
+    series_id = db.Column(db.Integer, db.ForeignKey('maintenance_series.id'))  # Set on occurrences of a recurring series
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
-    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)
+    
+    action_results = db.relationship('MaintenanceActionResult', lazy=True, cascade='all, delete-orphan')
+    
+    # Composite indexes backing the filtered, keyset-paginated list endpoint
+    __table_args__ = (
+        db.Index('ix_maintenance_schedule_start_id', 'scheduled_start', 'id'),
+        db.Index('ix_maintenance_schedule_status_start', 'status', 'scheduled_start'),
+        db.Index('ix_maintenance_schedule_server_start', 'server_id', 'scheduled_start'),
+        # Range scan for due window ends (transition dispatcher)
+        db.Index('ix_maintenance_schedule_status_end', 'status', 'scheduled_end'),
+        db.Index('ix_maintenance_schedule_series_start', 'series_id', 'scheduled_start'),
+        # Interval lookups for overlap checks (conflicts.py)
+        db.Index('ix_maintenance_schedule_server_status_start', 'server_id', 'status', 'scheduled_start'),
+    )
     
     def to_dict(self):
         return {
@@ -69,6 +140,278 @@ class MaintenanceSchedule(db.Model):
             'status': self.status.value,
             'recurring': self.recurring,
             'recurring_pattern': self.recurring_pattern,
+            'series_id': self.series_id,
+            'created_at': self.created_at.isoformat(),
+            'updated_at': self.updated_at.isoformat()
+        }
+    
+    @classmethod
+    def query_with_server(cls):
+        """Query that loads the owning server in the same SELECT (no N+1 on server_name)"""
+        return cls.query.options(joinedload(cls.server))
+    
+    # Windows that still hold (or will hold) their server
+    ACTIVE_STATUSES = (MaintenanceStatus.SCHEDULED, MaintenanceStatus.IN_PROGRESS)
+    
+    @classmethod
+    def overlapping(cls, server_ids, start, end):
+        """Select (server_id, id, scheduled_start, scheduled_end) of the active windows of servers overlapping [start, end)
+        
+        Active windows may overlap each other, so none can be ruled out by
+        its start alone; the (server_id, status, scheduled_start) index
+        narrows the scan to the active windows starting before end.
+        """
+        return select(cls.server_id, cls.id, cls.scheduled_start, cls.scheduled_end).where(
+            cls.server_id.in_(list(server_ids)),
+            cls.status.in_(cls.ACTIVE_STATUSES),
+            cls.scheduled_start < end,
+            cls.scheduled_end > start
+        )
+    
+    # to_dict() keys, for sparse fieldsets (?fields=)
+    FIELDS = (
+        'id', 'server_id', 'server_name', 'title', 'description', 'scheduled_start', 'scheduled_end',
+        'actual_start', 'actual_end', 'status', 'recurring', 'recurring_pattern', 'series_id', 'created_at', 'updated_at'
+    )
+    
+    @classmethod
+    def projection_query(cls, fields=None):
+        """Column-only query of (schedule columns..., server_name) rows
+        
+        Rows are plain tuples, so listing them skips ORM identity-map
+        hydration entirely; serialize them with row_to_dict(). With fields
+        only those columns are selected, and the server join is left out
+        unless server_name is one of them.
+        """
+        columns = [column for column in cls.__table__.columns if fields is None or column.name in fields]
+        if fields is not None and 'server_name' not in fields:
+            return db.session.query(*columns)
+        return db.session.query(
+            *columns,
+            Server.name.label('server_name')
+        ).outerjoin(Server, Server.id == cls.server_id)
+    
+    @staticmethod
+    def row_to_dict(row):
+        """Serialize a projection_query() row exactly like to_dict()"""
+        return {
+            'id': row.id,
+            'server_id': row.server_id,
+            'server_name': row.server_name,
+            'title': row.title,
+            'description': row.description,
+            'scheduled_start': row.scheduled_start.isoformat(),
+            'scheduled_end': row.scheduled_end.isoformat(),
+            'actual_start': row.actual_start.isoformat() if row.actual_start else None,
+            'actual_end': row.actual_end.isoformat() if row.actual_end else None,
+            'status': row.status.value,
+            'recurring': row.recurring,
+            'recurring_pattern': row.recurring_pattern,
+            'series_id': row.series_id,
+            'created_at': row.created_at.isoformat(),
+            'updated_at': row.updated_at.isoformat()
+        }
+
+class MaintenanceSeries(db.Model):
+    """Recurrence rule of a recurring maintenance
+    
+    Occurrences are expanded from the rule on demand (see recurrence.py);
+    only those starting before materialized_until exist as
+    MaintenanceSchedule rows.
+    """
+    id = db.Column(db.Integer, primary_key=True)
+    server_id = db.Column(db.Integer, db.ForeignKey('server.id'), nullable=False)
+    title = db.Column(db.String(200), nullable=False)
+    description = db.Column(db.Text)
+    rule = db.Column(db.String(255), nullable=False)
+    dtstart = db.Column(db.DateTime, nullable=False)
+    duration_seconds = db.Column(db.Integer, nullable=False)
+    materialized_until = db.Column(db.DateTime, nullable=False)
+    active = db.Column(db.Boolean, default=True, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    occurrences = db.relationship('MaintenanceSchedule', backref='series', lazy=True)
+    
+    __table_args__ = (
+        db.Index('ix_maintenance_series_active_materialized', 'active', 'materialized_until'),
+    )
+
+class MaintenanceAction(db.Model):
+    """An action run against servers when their maintenance starts or ends
+    
+    Applies to one server (server_id) or to the group of servers whose
+    name starts with server_prefix ('' for every server). Actions of a
+    phase run in position order per server; see actions.py.
+    """
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(100), nullable=False)
+    kind = db.Column(db.String(20), nullable=False)  # 'shell', 'http' or a registered action type
+    phase = db.Column(db.String(10), nullable=False)  # 'start' or 'end'
+    server_id = db.Column(db.Integer, db.ForeignKey('server.id'))
+    server_prefix = db.Column(db.String(100))
+    command = db.Column(db.Text)  # shell: command line with {hostname}-style placeholders
+    url = db.Column(db.String(500))  # http: URL with placeholders
+    method = db.Column(db.String(10), default='POST')
+    timeout_seconds = db.Column(db.Float)  # default ACTION_DEFAULT_TIMEOUT
+    retries = db.Column(db.Integer, default=0, nullable=False)
+    concurrency_group = db.Column(db.String(100))  # actions sharing a group share its concurrency limit
+    max_concurrency = db.Column(db.Integer)  # default ACTION_GROUP_CONCURRENCY
+    position = db.Column(db.Integer, default=0, nullable=False)
+    enabled = db.Column(db.Boolean, default=True, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    __table_args__ = (
+        db.Index('ix_maintenance_action_phase_position', 'phase', 'position'),
+    )
+    
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'name': self.name,
+            'kind': self.kind,
+            'phase': self.phase,
+            'server_id': self.server_id,
+            'server_prefix': self.server_prefix,
+            'command': self.command,
+            'url': self.url,
+            'method': self.method,
+            'timeout_seconds': self.timeout_seconds,
+            'retries': self.retries,
+            'concurrency_group': self.concurrency_group,
+            'max_concurrency': self.max_concurrency,
+            'position': self.position,
+            'enabled': self.enabled,
             'created_at': self.created_at.isoformat(),
             'updated_at': self.updated_at.isoformat()
-        } 
\ No newline at end of file
+        }
+
+class MaintenanceActionResult(db.Model):
+    """Outcome of one action run for one maintenance window"""
+    id = db.Column(db.Integer, primary_key=True)
+    maintenance_id = db.Column(db.Integer, db.ForeignKey('maintenance_schedule.id'), nullable=False)
+    server_id = db.Column(db.Integer, nullable=False)
+    action_id = db.Column(db.Integer)  # Not a foreign key: results outlive deleted actions
+    action_name = db.Column(db.String(100), nullable=False)
+    phase = db.Column(db.String(10), nullable=False)
+    status = db.Column(db.String(20), nullable=False)  # 'succeeded', 'failed', 'timeout' or 'skipped'
+    attempts = db.Column(db.Integer, default=0, nullable=False)
+    return_code = db.Column(db.Integer)  # exit code or HTTP status
+    output = db.Column(db.Text)
+    started_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
+    duration_ms = db.Column(db.Integer)
+    
+    __table_args__ = (
+        db.Index('ix_maintenance_action_result_maintenance', 'maintenance_id', 'id'),
+    )
+    
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'maintenance_id': self.maintenance_id,
+            'server_id': self.server_id,
+            'action_id': self.action_id,
+            'action_name': self.action_name,
+            'phase': self.phase,
+            'status': self.status,
+            'attempts': self.attempts,
+            'return_code': self.return_code,
+            'output': self.output,
+            'started_at': self.started_at.isoformat() if self.started_at else None,
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None,
+            'duration_ms': self.duration_ms
+        }
+
+class ServerStatusChange(db.Model):
+    """Append-only log of server status transitions (see history.py)
+    
+    Kept compact for long retention: the status and the source of the
+    change are small integer codes and the time is UTC epoch seconds.
+    The server id is not a foreign key so history outlives deleted
+    servers.
+    """
+    id = db.Column(db.Integer, primary_key=True)
+    server_id = db.Column(db.Integer, nullable=False)
+    changed_at = db.Column(db.Integer, nullable=False)
+    status = db.Column(db.SmallInteger, nullable=False)
+    source = db.Column(db.SmallInteger, nullable=False)
+    
+    # Covers the per-server sweeps in (server, time, id) order, which never read the table itself
+    __table_args__ = (
+        db.Index('ix_server_status_change_server_at', 'server_id', 'changed_at', 'id', 'status'),
+    )
+
+class DeletedRecord(db.Model):
+    """Tombstone for a deleted row, consumed by the ?since= delta feeds"""
+    id = db.Column(db.Integer, primary_key=True)
+    table_name = db.Column(db.String(50), nullable=False)
+    record_id = db.Column(db.Integer, nullable=False)
+    deleted_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    
+    __table_args__ = (
+        db.Index('ix_deleted_record_table_deleted', 'table_name', 'deleted_at'),
+    )
+
+class SchedulerLease(db.Model):
+    """Time-limited lease naming the one process allowed to run scheduler jobs"""
+    name = db.Column(db.String(50), primary_key=True)
+    holder = db.Column(db.String(200), nullable=False)
+    expires_at = db.Column(db.DateTime, nullable=False)
+
+def ensure_indexes():
+    """Create model indexes that db.create_all() skips on pre-existing tables"""
+    for table in db.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=db.engine, checkfirst=True)
+
+def ensure_columns():
+    """Add nullable columns that db.create_all() skips on pre-existing tables, and widen shorter strings"""
+    inspector = inspect(db.engine)
+    dialect = db.engine.dialect.name
+    for table in db.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        existing = {column['name']: column for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            column_type = column.type.compile(dialect=db.engine.dialect)
+            if column.name not in existing:
+                if column.nullable:
+                    db.session.execute(text(f'ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}'))
+                continue
+            # SQLite does not enforce string lengths
+            length = getattr(existing[column.name]['type'], 'length', None)
+            if isinstance(column.type, db.String) and column.type.length and length and length < column.type.length:
+                if dialect == 'postgresql':
+                    db.session.execute(text(f'ALTER TABLE {table.name} ALTER COLUMN {column.name} TYPE {column_type}'))
+                elif dialect in ('mysql', 'mariadb'):
+                    null = 'NULL' if column.nullable else 'NOT NULL'
+                    db.session.execute(text(f'ALTER TABLE {table.name} MODIFY COLUMN {column.name} {column_type} {null}'))
+    db.session.commit()
+
+def backfill_ip_keys(batch_size=5000):
+    """Set Server.ip_key on rows written before the column existed; returns the number set"""
+    updated = 0
+    last_id = 0
+    while True:
+        rows = db.session.execute(
+            select(Server.id, Server.ip_address)
+            .where(Server.ip_key.is_(None), Server.id > last_id)
+            .order_by(Server.id).limit(batch_size)
+        ).all()
+        if not rows:
+            break
+        last_id = rows[-1].id
+        # Rows whose ip_address is not an address keep a NULL key
+        keys = [{'server_id': server_id, 'key': ip_key(ip_address)} for server_id, ip_address in rows]
+        keys = [key for key in keys if key['key'] is not None]
+        if keys:
+            # A derived column: leave updated_at (and so the delta feeds) alone
+            table = Server.__table__
+            db.session.execute(update(table).where(table.c.id == bindparam('server_id')).values(
+                ip_key=bindparam('key'), updated_at=table.c.updated_at
+            ), keys)
+            updated += len(keys)
+        db.session.commit()
+    return updated
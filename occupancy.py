@@ -0,0 +1,96 @@
+from datetime import timedelta
+from itertools import accumulate
+from sqlalchemy import select
+from models import db, Server, MaintenanceSchedule, MaintenanceStatus
+import recurrence
+
+BUCKETS = {'hour': timedelta(hours=1), 'day': timedelta(days=1)}
+
+# Cancelled windows never occupy their servers
+OCCUPYING_STATUSES = (MaintenanceStatus.SCHEDULED, MaintenanceStatus.IN_PROGRESS, MaintenanceStatus.COMPLETED)
+
+def load_spans(range_from, range_to, server_ids=None, statuses=OCCUPYING_STATUSES, chunk_size=500):
+    """(server_id, start, end) of the windows overlapping [range_from, range_to)
+
+    Only three columns of the schedule rows are read. Recurrences past the
+    materialized horizon are expanded from their rules and included when
+    scheduled windows are wanted.
+    """
+    query = select(
+        MaintenanceSchedule.server_id, MaintenanceSchedule.scheduled_start, MaintenanceSchedule.scheduled_end
+    ).where(
+        MaintenanceSchedule.status.in_(statuses),
+        MaintenanceSchedule.scheduled_end > range_from,
+        MaintenanceSchedule.scheduled_start < range_to
+    )
+    spans = []
+    if server_ids is None:
+        spans.extend(db.session.connection().execute(query))
+    else:
+        server_ids = list(server_ids)
+        for index in range(0, len(server_ids), chunk_size):
+            spans.extend(db.session.connection().execute(
+                query.where(MaintenanceSchedule.server_id.in_(server_ids[index:index + chunk_size]))
+            ))
+
+    if MaintenanceStatus.SCHEDULED in statuses:
+        spans.extend(
+            (series.server_id, start, end)
+            for series, _, start, end in recurrence.expand_spans(range_from, range_to, server_ids)
+        )
+    return spans
+
+def bucket_spans(spans, range_from, range_to, bucket_size, lanes=False):
+    """Bucket windows into [range_from + i * bucket_size, ...) slots in one sweep
+
+    Returns {'windows': [...], 'servers': [...]} with, per bucket, the
+    number of windows and of distinct servers with a window overlapping
+    it, and with lanes the merged busy bucket ranges per server as
+    {server_id: [[first, last), ...]}. Difference arrays keep this at
+    O(windows log windows + buckets).
+    """
+    count = -((range_from - range_to) // bucket_size)
+    window_diff = [0] * (count + 1)
+    by_server = {}
+    for server_id, start, end in spans:
+        first = max(0, (start - range_from) // bucket_size)
+        last = min(count, -((range_from - end) // bucket_size))
+        if first < last:
+            window_diff[first] += 1
+            window_diff[last] -= 1
+            by_server.setdefault(server_id, []).append((first, last))
+
+    # A server counts once per bucket however many of its windows touch it
+    server_diff = [0] * (count + 1)
+    busy = {}
+    for server_id, ranges in by_server.items():
+        ranges.sort()
+        merged = []
+        for first, last in ranges:
+            if merged and first <= merged[-1][1]:
+                merged[-1][1] = max(merged[-1][1], last)
+            else:
+                merged.append([first, last])
+        for first, last in merged:
+            server_diff[first] += 1
+            server_diff[last] -= 1
+        if lanes:
+            busy[server_id] = merged
+
+    result = {
+        'windows': list(accumulate(window_diff))[:count],
+        'servers': list(accumulate(server_diff))[:count]
+    }
+    if lanes:
+        result['lanes'] = busy
+    return result
+
+def server_names(server_ids, chunk_size=500):
+    """{server_id: name} for the lanes of a calendar"""
+    server_ids = list(server_ids)
+    names = {}
+    for index in range(0, len(server_ids), chunk_size):
+        names.update(db.session.execute(
+            select(Server.id, Server.name).where(Server.id.in_(server_ids[index:index + chunk_size]))
+        ).all())
+    return names
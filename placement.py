@@ -0,0 +1,104 @@
+import math
+from models import db, MaintenanceSchedule
+import recurrence
+
+def load_busy_windows(server_ids, range_start, range_end, chunk_size=500):
+    """(server_id, start, end) of the active windows of server_ids overlapping the range
+
+    Includes the occurrences of recurring series that are not rows yet, as
+    the conflict checks do.
+    """
+    server_ids = list(server_ids)
+    windows = []
+    for index in range(0, len(server_ids), chunk_size):
+        chunk = server_ids[index:index + chunk_size]
+        windows.extend(
+            (server_id, start, end) for server_id, _, start, end in
+            db.session.execute(MaintenanceSchedule.overlapping(chunk, range_start, range_end))
+        )
+        windows.extend(
+            (series.server_id, start, end) for series, _, start, end in
+            recurrence.expand_spans(range_start, range_end, chunk)
+        )
+    return windows
+
+def plan_windows(server_ids, duration, range_start, range_end, max_concurrent, step=None, busy_windows=()):
+    """Pack one maintenance window per server into [range_start, range_end)
+
+    Windows start on a grid of `step` (default: the duration, i.e.
+    back-to-back waves). A sweep over the grid keeps, per slot, how many
+    windows of the group are open, counting both the group's existing
+    windows and the ones placed so far, and greedily fills each start slot
+    up to max_concurrent with servers that are free for the whole window.
+    Runs in O(slots * windows per slot + servers + busy windows).
+
+    Returns (placements, unplaced): placements are (server_id, start, end)
+    in start order, unplaced the server ids that did not fit.
+    """
+    step = step or duration
+    slot_seconds = step.total_seconds()
+    span = math.ceil(duration.total_seconds() / slot_seconds)  # slots covered by one window
+    slot_count = int((range_end - range_start - duration).total_seconds() // slot_seconds) + 1
+    if slot_count <= 0 or max_concurrent <= 0:
+        return [], list(server_ids)
+
+    def slot_range(start, end):
+        """Slots [first, last) whose interval overlaps [start, end)"""
+        first = max(0, int((start - range_start).total_seconds() // slot_seconds))
+        last = min(slot_count + span, math.ceil((end - range_start).total_seconds() / slot_seconds))
+        return first, last
+
+    # Existing load per slot (difference array) and the servers that are busy somewhere in the range
+    open_windows = [0] * (slot_count + span + 1)
+    busy = {}
+    for server_id, start, end in busy_windows:
+        first, last = slot_range(start, end)
+        if first < last:
+            open_windows[first] += 1
+            open_windows[last] -= 1
+        busy.setdefault(server_id, []).append((start, end))
+    for index in range(1, len(open_windows)):
+        open_windows[index] += open_windows[index - 1]
+
+    busy_queue = [server_id for server_id in dict.fromkeys(server_ids) if server_id in busy]
+    free_queue = [server_id for server_id in dict.fromkeys(server_ids) if server_id not in busy]
+    free_index = 0
+
+    placements = []
+    for slot in range(slot_count):
+        if free_index >= len(free_queue) and not busy_queue:
+            break
+        capacity = max_concurrent - max(open_windows[slot:slot + span])
+        if capacity <= 0:
+            continue
+
+        start = range_start + step * slot
+        end = start + duration
+        chosen = []
+
+        # Servers with other windows in the range go first, wherever they fit
+        if busy_queue:
+            waiting = []
+            for server_id in busy_queue:
+                if len(chosen) < capacity and all(end <= s or start >= e for s, e in busy[server_id]):
+                    chosen.append(server_id)
+                else:
+                    waiting.append(server_id)
+            busy_queue = waiting
+
+        take = min(capacity - len(chosen), len(free_queue) - free_index)
+        chosen.extend(free_queue[free_index:free_index + take])
+        free_index += take
+
+        for covered in range(slot, slot + span):
+            open_windows[covered] += len(chosen)
+        placements.extend((server_id, start, end) for server_id in chosen)
+
+    unplaced = busy_queue + free_queue[free_index:]
+    return placements, unplaced
+
+def concurrency_limit(group_size, max_concurrent=None, max_concurrent_percent=None):
+    """Resolve 'at most N' or 'at most P%' of the group to a server count (at least 1)"""
+    if max_concurrent is not None:
+        return int(max_concurrent)
+    return max(1, int(group_size * float(max_concurrent_percent) / 100))
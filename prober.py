@@ -0,0 +1,332 @@
+import asyncio
+import atexit
+import heapq
+import logging
+import random
+import threading
+import time
+from sqlalchemy import select
+from models import db, Server, ServerStatus
+from events import event_broker
+from history import set_server_status
+
+# Servers under maintenance are expected to be down and are never probed
+PROBED_STATUSES = (ServerStatus.ONLINE, ServerStatus.OFFLINE)
+
+async def probe_tcp(address, port, timeout):
+    """Whether a TCP connection to address:port opens within timeout"""
+    try:
+        _, writer = await asyncio.wait_for(asyncio.open_connection(address, port), timeout)
+    except (OSError, asyncio.TimeoutError):
+        return False
+    writer.close()
+    try:
+        await writer.wait_closed()
+    except OSError:
+        pass
+    return True
+
+async def probe_http(address, port, timeout, path='/'):
+    """Whether GET path answers with a 2xx/3xx status line within timeout"""
+    async def request():
+        reader, writer = await asyncio.open_connection(address, port)
+        try:
+            writer.write(f'GET {path} HTTP/1.0\r\nHost: {address}\r\nConnection: close\r\n\r\n'.encode())
+            await writer.drain()
+            status_line = await reader.readline()
+        finally:
+            writer.close()
+        parts = status_line.split()
+        return len(parts) >= 2 and parts[1].isdigit() and 200 <= int(parts[1]) < 400
+
+    try:
+        return await asyncio.wait_for(request(), timeout)
+    except (OSError, asyncio.TimeoutError, ValueError):
+        return False
+
+def probe_address(server):
+    """The address a server is probed at; numeric IPs also skip DNS resolution"""
+    return server.ip_address or server.hostname
+
+def apply_status_changes(changes, batch_size=500):
+    """Write prober verdicts {server_id: ServerStatus} with guarded bulk UPDATEs
+
+    Only ONLINE -> OFFLINE and OFFLINE -> ONLINE flips are applied, so a
+    server that entered maintenance (or was changed through the API) since
+    it was probed keeps its status. The flips are recorded in the status
+    history. Returns {status: [changed ids]}.
+    """
+    applied = {}
+    for status, previous in ((ServerStatus.OFFLINE, ServerStatus.ONLINE), (ServerStatus.ONLINE, ServerStatus.OFFLINE)):
+        ids = sorted(server_id for server_id, verdict in changes.items() if verdict == status)
+        for index in range(0, len(ids), batch_size):
+            changed = set_server_status(ids[index:index + batch_size], status, Server.status == previous, source='prober')
+            db.session.commit()
+            applied.setdefault(status, []).extend(changed)
+
+    for status, ids in applied.items():
+        if ids:
+            event_broker.publish('servers.status_changed', {'status': status.value, 'count': len(ids), 'ids': ids})
+    return applied
+
+class _Host:
+    __slots__ = ('address', 'status', 'failures', 'due')
+
+    def __init__(self, address, status, due):
+        self.address = address
+        self.status = status
+        self.failures = 0
+        self.due = due
+
+class HealthProber:
+    """Background TCP/HTTP prober that marks unreachable servers OFFLINE
+
+    Runs an asyncio loop in its own thread. Every ONLINE or OFFLINE
+    server is checked about once per interval (with jitter, so checks
+    spread evenly instead of arriving in waves); at most `concurrency`
+    checks are in flight. A server goes OFFLINE after failure_threshold
+    consecutive failed checks and back ONLINE on the first success;
+    servers that stay down are checked exponentially less often, up to
+    max_interval. Verdicts are collected and written every flush_interval
+    with guarded bulk UPDATEs (see apply_status_changes).
+    """
+
+    def __init__(self, mode='tcp', port=22, http_path='/', timeout=2, concurrency=512, interval=60,
+                 max_interval=600, jitter=0.1, failure_threshold=2, refresh_interval=30, flush_interval=2):
+        self.app = None
+        self.active = None
+        self.mode = mode
+        self.port = port
+        self.http_path = http_path
+        self.timeout = timeout
+        self.concurrency = concurrency
+        self.interval = interval
+        self.max_interval = max_interval
+        self.jitter = jitter
+        self.failure_threshold = failure_threshold
+        self.refresh_interval = refresh_interval
+        self.flush_interval = flush_interval
+        self.logger = logging.getLogger(__name__)
+        self._hosts = {}
+        self._heap = []
+        self._changes = {}
+        self._loop = None
+        self._thread = None
+        self._stopped = threading.Event()
+        self._stats = {'checks': 0, 'failures': 0, 'marked_offline': 0, 'marked_online': 0, 'last_cycle_checks_per_minute': 0}
+
+    def init_app(self, app, active=None):
+        """active: callable telling whether this process should probe (e.g. the scheduler leader)"""
+        self.app = app
+        self.active = active
+        self.mode = app.config.get('PROBE_MODE', self.mode)
+        self.port = app.config.get('PROBE_PORT', self.port)
+        self.http_path = app.config.get('PROBE_HTTP_PATH', self.http_path)
+        self.timeout = app.config.get('PROBE_TIMEOUT', self.timeout)
+        self.concurrency = app.config.get('PROBE_CONCURRENCY', self.concurrency)
+        self.interval = app.config.get('PROBE_INTERVAL', self.interval)
+        self.max_interval = app.config.get('PROBE_MAX_INTERVAL', self.max_interval)
+        self.failure_threshold = app.config.get('PROBE_FAILURE_THRESHOLD', self.failure_threshold)
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        if self.running:
+            return
+        self._stopped.clear()
+        self._thread = threading.Thread(target=lambda: asyncio.run(self._main()), name='health-prober', daemon=True)
+        self._thread.start()
+        atexit.register(self.stop)
+
+    def stop(self):
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.timeout + self.flush_interval + 1)
+            self._thread = None
+
+    def stats(self):
+        return dict(self._stats, running=self.running, hosts=len(self._hosts), mode=self.mode)
+
+    async def probe(self, address):
+        if self.mode == 'http':
+            return await probe_http(address, self.port, self.timeout, self.http_path)
+        return await probe_tcp(address, self.port, self.timeout)
+
+    def check(self, servers):
+        """Probe servers now from the calling thread; returns {server_id: reachable}"""
+        async def check_all():
+            semaphore = asyncio.Semaphore(self.concurrency)
+
+            async def check_one(server):
+                async with semaphore:
+                    return server.id, await self.probe(probe_address(server))
+
+            return dict(await asyncio.gather(*(check_one(server) for server in servers)))
+
+        return asyncio.run(check_all()) if servers else {}
+
+    def recovery_check(self, server_ids):
+        """Check servers whose maintenance just ended
+
+        With the background prober running they are queued for an
+        immediate check there; otherwise they are probed synchronously,
+        up to failure_threshold times (a timeout apart) like the background
+        prober, and the ones unreachable every time are marked OFFLINE. Call
+        inside an app context.
+        """
+        server_ids = list(server_ids)
+        servers = []
+        for index in range(0, len(server_ids), 500):
+            servers.extend(Server.query.filter(
+                Server.id.in_(server_ids[index:index + 500]), Server.status.in_(PROBED_STATUSES)
+            ))
+        if not servers:
+            return
+
+        if self.running and self._loop is not None:
+            targets = [(server.id, probe_address(server), server.status) for server in servers]
+            self._loop.call_soon_threadsafe(self._add_hosts, targets, True)
+            return
+
+        unreachable = servers
+        for attempt in range(max(1, self.failure_threshold)):
+            if attempt:
+                time.sleep(self.timeout)  # Servers may still be booting
+            results = self.check(unreachable)
+            unreachable = [server for server in unreachable if not results[server.id]]
+            if not unreachable:
+                return
+        down = {server.id: ServerStatus.OFFLINE for server in unreachable}
+        if down:
+            applied = apply_status_changes(down)
+            self.logger.warning(f"{len(applied.get(ServerStatus.OFFLINE, []))} servers unreachable after maintenance, marked offline")
+
+    async def _main(self):
+        self._loop = asyncio.get_running_loop()
+        semaphore = asyncio.Semaphore(self.concurrency)
+        tasks = set()
+        next_refresh = next_flush = 0
+        cycle_started, cycle_checks = time.monotonic(), 0
+
+        while not self._stopped.is_set():
+            now = time.monotonic()
+            if not self.active or self.active():
+                if now >= next_refresh:
+                    next_refresh = now + self.refresh_interval
+                    try:
+                        self._sync_hosts(await self._loop.run_in_executor(None, self._load_targets))
+                    except Exception as e:
+                        self.logger.error(f"Error loading servers to probe: {e}")
+
+                while self._heap and self._heap[0][0] <= now and len(tasks) < self.concurrency * 2:
+                    due, server_id = heapq.heappop(self._heap)
+                    host = self._hosts.get(server_id)
+                    if host is None or host.due != due:
+                        continue  # Removed or rescheduled since it was queued
+                    task = asyncio.create_task(self._check_host(semaphore, server_id, host))
+                    tasks.add(task)
+                    task.add_done_callback(tasks.discard)
+                    cycle_checks += 1
+
+            if now >= next_flush:
+                next_flush = now + self.flush_interval
+                await self._flush()
+            if now - cycle_started >= 60:
+                self._stats['last_cycle_checks_per_minute'] = int(cycle_checks * 60 / (now - cycle_started))
+                cycle_started, cycle_checks = now, 0
+
+            sleep_for = min(0.25, max(0.005, self._heap[0][0] - now)) if self._heap else 0.25
+            await asyncio.sleep(sleep_for)
+
+        for task in list(tasks):
+            task.cancel()
+        await self._flush()
+        self._loop = None
+
+    def _load_targets(self):
+        """(id, address, status) of every server that should be probed"""
+        with self.app.app_context():
+            rows = db.session.execute(select(
+                Server.id, Server.ip_address, Server.hostname, Server.status
+            ).where(Server.status.in_(PROBED_STATUSES)).execution_options(yield_per=5000))
+            return [(server_id, ip_address or hostname, status) for server_id, ip_address, hostname, status in rows]
+
+    def _sync_hosts(self, targets):
+        seen = set()
+        new_targets = []
+        for server_id, address, status in targets:
+            seen.add(server_id)
+            host = self._hosts.get(server_id)
+            if host is None:
+                new_targets.append((server_id, address, status))
+            else:
+                host.address = address
+                if server_id not in self._changes:
+                    host.status = status
+        for server_id in list(self._hosts):
+            if server_id not in seen:
+                del self._hosts[server_id]
+        self._add_hosts(new_targets)
+
+    def _add_hosts(self, targets, immediately=False):
+        now = time.monotonic()
+        for server_id, address, status in targets:
+            # New hosts are spread over one interval instead of all being checked at once
+            due = now if immediately else now + random.uniform(0, self.interval)
+            host = self._hosts.get(server_id)
+            if host is None:
+                host = self._hosts[server_id] = _Host(address, status, due)
+            else:
+                host.address, host.status, host.due = address, status, due
+            heapq.heappush(self._heap, (due, server_id))
+
+    async def _check_host(self, semaphore, server_id, host):
+        async with semaphore:
+            reachable = await self.probe(host.address)
+        self._stats['checks'] += 1
+
+        if reachable:
+            host.failures = 0
+            delay = self.interval
+            if host.status == ServerStatus.OFFLINE:
+                host.status = self._changes[server_id] = ServerStatus.ONLINE
+        else:
+            self._stats['failures'] += 1
+            host.failures += 1
+            # Back off exponentially once the host is considered down
+            excess = max(0, host.failures - self.failure_threshold)
+            delay = min(self.interval * 2 ** min(excess, 16), self.max_interval)
+            if host.status == ServerStatus.ONLINE and host.failures >= self.failure_threshold:
+                host.status = self._changes[server_id] = ServerStatus.OFFLINE
+
+        if self._hosts.get(server_id) is host:
+            host.due = time.monotonic() + delay * random.uniform(1 - self.jitter, 1 + self.jitter)
+            heapq.heappush(self._heap, (host.due, server_id))
+
+    async def _flush(self):
+        if not self._changes:
+            return
+        changes, self._changes = self._changes, {}
+        try:
+            applied = await self._loop.run_in_executor(None, self._write_changes, changes)
+        except Exception as e:
+            self.logger.error(f"Error writing {len(changes)} probe results: {e}")
+            return
+        offline = len(applied.get(ServerStatus.OFFLINE, []))
+        online = len(applied.get(ServerStatus.ONLINE, []))
+        self._stats['marked_offline'] += offline
+        self._stats['marked_online'] += online
+        if offline or online:
+            self.logger.info(f"Health probes: {offline} servers marked offline, {online} back online")
+
+    def _write_changes(self, changes):
+        with self.app.app_context():
+            try:
+                return apply_status_changes(changes)
+            except Exception:
+                db.session.rollback()
+                raise
+
+health_prober = HealthProber()
@@ -0,0 +1,302 @@
+import functools
+from datetime import datetime, timedelta
+from itertools import islice
+import pytz
+from apscheduler.triggers.cron import CronTrigger
+from dateutil.relativedelta import relativedelta
+from dateutil.rrule import rrulestr
+from models import db, Server, MaintenanceSchedule, MaintenanceSeries, MaintenanceStatus
+
+# The original fixed patterns; 'monthly' has always meant every 30 days
+LEGACY_PATTERNS = {
+    'daily': 'FREQ=DAILY',
+    'weekly': 'FREQ=WEEKLY',
+    'monthly': 'FREQ=DAILY;INTERVAL=30'
+}
+
+_PERIODS = {
+    'MINUTELY': relativedelta(minutes=1),
+    'HOURLY': relativedelta(hours=1),
+    'DAILY': relativedelta(days=1),
+    'WEEKLY': relativedelta(weeks=1)
+}
+_CALENDAR_PERIODS = {'MONTHLY': 1, 'YEARLY': 12}  # length in months
+
+class Recurrence:
+    """A parsed recurrence pattern: a legacy name, an RFC 5545 RRULE or a cron expression
+
+    All datetimes are naive UTC, like the rest of the schedule table.
+    """
+
+    def __init__(self, pattern):
+        self.pattern = pattern
+        body = LEGACY_PATTERNS.get(pattern, pattern).strip()
+        if body.startswith('cron:') or (len(body.split()) == 5 and '=' not in body):
+            self.kind = 'cron'
+            self.trigger = CronTrigger.from_crontab(body[len('cron:'):] if body.startswith('cron:') else body,
+                                                    timezone=pytz.utc)
+            return
+
+        if 'FREQ=' not in body.upper():
+            raise ValueError("expected 'daily', 'weekly', 'monthly', an RRULE such as "
+                             "'FREQ=WEEKLY;BYDAY=MO' or a 5-field cron expression")
+        self.kind = 'rrule'
+        self.body = body[len('RRULE:'):] if body.upper().startswith('RRULE:') else body
+        parts = dict(part.split('=', 1) for part in self.body.upper().split(';') if '=' in part)
+        self.freq = parts.get('FREQ')
+        self.interval = int(parts.get('INTERVAL', 1))
+        self.has_count = 'COUNT' in parts
+        self.has_day_rules = any(key in parts for key in ('BYMONTHDAY', 'BYDAY', 'BYYEARDAY', 'BYWEEKNO'))
+        # Validates the rule
+        rrulestr(self.body, dtstart=datetime(2000, 1, 1), ignoretz=True)
+
+    def starts(self, dtstart, range_from, range_to):
+        """Lazily yield occurrence starts s with dtstart <= s, range_from <= s < range_to, in order"""
+        range_from = max(range_from, dtstart)
+        if range_from >= range_to:
+            return
+
+        if self.kind == 'cron':
+            now = pytz.utc.localize(range_from)
+            fire_time = self.trigger.get_next_fire_time(None, now)
+            while fire_time is not None:
+                start = fire_time.astimezone(pytz.utc).replace(tzinfo=None)
+                if start >= range_to:
+                    return
+                yield start
+                fire_time = self.trigger.get_next_fire_time(fire_time, fire_time + timedelta(microseconds=1))
+            return
+
+        rule = rrulestr(self.body, dtstart=self._advance(dtstart, range_from), ignoretz=True)
+        for start in rule.xafter(range_from, inc=True):
+            if start >= range_to:
+                return
+            yield start
+
+    def shortest_interval(self, dtstart, samples=64):
+        """Shortest time between consecutive starts among the first samples occurrences, or None for a single one"""
+        starts = list(islice(self.starts(dtstart, dtstart, datetime.max), samples))
+        return min((later - earlier for earlier, later in zip(starts, starts[1:])), default=None)
+
+    def _advance(self, dtstart, range_from):
+        """Move dtstart forward by whole periods to just before range_from
+
+        Expansion then costs O(occurrences in range) instead of O(occurrences
+        since dtstart). Whole periods keep weekdays, times and (for
+        calendar rules anchored on explicit days, or days <= 28) month days;
+        COUNT rules are counted from dtstart and are never moved.
+        """
+        if self.has_count or range_from <= dtstart:
+            return dtstart
+
+        if self.freq in _PERIODS:
+            step = _PERIODS[self.freq] * self.interval
+            step_seconds = (dtstart + step - dtstart).total_seconds()
+            periods = int((range_from - dtstart).total_seconds() // step_seconds) - 1
+            return dtstart + step * periods if periods > 0 else dtstart
+
+        if self.freq in _CALENDAR_PERIODS and (self.has_day_rules or dtstart.day <= 28):
+            step_months = _CALENDAR_PERIODS[self.freq] * self.interval
+            months = (range_from.year - dtstart.year) * 12 + range_from.month - dtstart.month
+            periods = months // step_months - 1
+            return dtstart + relativedelta(months=step_months * periods) if periods > 0 else dtstart
+
+        return dtstart
+
+@functools.lru_cache(maxsize=1024)
+def parse_pattern(pattern):
+    """Parse and cache a recurrence pattern; raises ValueError if it is invalid"""
+    if not pattern or len(pattern) > 255:
+        raise ValueError('Recurrence pattern must be 1-255 characters')
+    try:
+        return Recurrence(pattern)
+    except ValueError as e:
+        raise ValueError(f"Invalid recurrence pattern '{pattern}': {e}")
+    except Exception:
+        raise ValueError(f"Invalid recurrence pattern '{pattern}'")
+
+def check_duration(pattern, dtstart, duration):
+    """Reject a window that lasts as long as the gap to its next occurrence; raises ValueError"""
+    interval = parse_pattern(pattern).shortest_interval(dtstart)
+    if interval is not None and duration >= interval:
+        raise ValueError(f"A window lasting {duration} overlaps its next occurrence ('{pattern}' repeats after {interval})")
+
+def series_occurrences(series, range_from, range_to):
+    """(start, end) of the occurrences of series overlapping [range_from, range_to)"""
+    duration = timedelta(seconds=series.duration_seconds)
+    recurrence = parse_pattern(series.rule)
+    for start in recurrence.starts(series.dtstart, range_from - duration + timedelta(microseconds=1), range_to):
+        yield start, start + duration
+
+def create_series(maintenance):
+    """Start a series at a maintenance window, which becomes its first occurrence
+    
+    Raises ValueError for a pattern whose occurrences would overlap each other.
+    """
+    check_duration(maintenance.recurring_pattern, maintenance.scheduled_start,
+                   maintenance.scheduled_end - maintenance.scheduled_start)
+    series = MaintenanceSeries(
+        server_id=maintenance.server_id,
+        title=maintenance.title,
+        description=maintenance.description,
+        rule=maintenance.recurring_pattern,
+        dtstart=maintenance.scheduled_start,
+        duration_seconds=int((maintenance.scheduled_end - maintenance.scheduled_start).total_seconds()),
+        materialized_until=maintenance.scheduled_start,
+        active=True
+    )
+    db.session.add(series)
+    maintenance.series = series
+    return series
+
+def later_occurrences(maintenance, original_start):
+    """Query of the scheduled occurrences of a window's series after it, which split_series() deletes"""
+    return MaintenanceSchedule.query.filter(
+        MaintenanceSchedule.series_id == maintenance.series_id,
+        MaintenanceSchedule.id != maintenance.id,
+        MaintenanceSchedule.scheduled_start > original_start,
+        MaintenanceSchedule.status == MaintenanceStatus.SCHEDULED
+    )
+
+def split_series(maintenance, original_start=None):
+    """End the series of a window at that window ('this and following' edits)
+
+    Scheduled occurrences after the window (after original_start, its
+    start before the edit) are deleted and their ids returned; the window
+    starts a new series if it is still recurring.
+    """
+    removed = []
+    if maintenance.series_id is not None:
+        maintenance.series.active = False
+        for occurrence in later_occurrences(maintenance, original_start or maintenance.scheduled_start):
+            removed.append(occurrence.id)
+            db.session.delete(occurrence)
+        maintenance.series = None
+
+    if maintenance.recurring and maintenance.recurring_pattern:
+        create_series(maintenance)
+    return removed
+
+def materialize(horizon_end, series_ids=None, batch_size=500):
+    """Insert the occurrences that start before horizon_end as schedule rows
+
+    Only active series whose materialized_until is behind the horizon are
+    read, and only occurrences in the future are created; one commit per
+    batch of series. Occurrences overlapping an active window of their
+    server (including one created earlier in the same run) are skipped,
+    as the API refuses such windows; they are not retried. Returns (new
+    MaintenanceSchedule rows, skipped occurrences as (series, start) pairs).
+    """
+    now = datetime.utcnow()
+    query = MaintenanceSeries.query.filter(
+        MaintenanceSeries.active.is_(True),
+        MaintenanceSeries.materialized_until < horizon_end
+    )
+    if series_ids is not None:
+        query = query.filter(MaintenanceSeries.id.in_(list(series_ids)))
+
+    created = []
+    skipped = []
+    last_id = 0
+    while True:
+        batch = query.filter(MaintenanceSeries.id > last_id).order_by(MaintenanceSeries.id).limit(batch_size).all()
+        if not batch:
+            break
+        last_id = batch[-1].id
+
+        # (series, duration, starts) of the occurrences due, before any is created
+        due = []
+        for series in batch:
+            try:
+                recurrence = parse_pattern(series.rule)
+            except ValueError:
+                series.active = False
+                continue
+            duration = timedelta(seconds=series.duration_seconds)
+            after = max(series.materialized_until + timedelta(microseconds=1), now)
+            due.append((series, duration, list(recurrence.starts(series.dtstart, after, horizon_end))))
+            series.materialized_until = horizon_end
+
+        # Active windows of the batch's servers, in one query; new occurrences are added as they are accepted
+        busy = {}
+        if any(starts for _, _, starts in due):
+            longest = max(duration for _, duration, starts in due if starts)
+            for server_id, _, scheduled_start, scheduled_end in db.session.execute(MaintenanceSchedule.overlapping(
+                {series.server_id for series, _, starts in due if starts}, now, horizon_end + longest
+            )):
+                busy.setdefault(server_id, []).append((scheduled_start, scheduled_end))
+
+        batch_created = []
+        for series, duration, starts in due:
+            spans = busy.setdefault(series.server_id, [])
+            for start in starts:
+                end = start + duration
+                if any(busy_start < end and busy_end > start for busy_start, busy_end in spans):
+                    skipped.append((series, start))
+                    continue
+                spans.append((start, end))
+                batch_created.append(MaintenanceSchedule(
+                    server_id=series.server_id,
+                    title=series.title,
+                    description=series.description,
+                    scheduled_start=start,
+                    scheduled_end=end,
+                    status=MaintenanceStatus.SCHEDULED,
+                    recurring=True,
+                    recurring_pattern=series.rule,
+                    series_id=series.id
+                ))
+
+        db.session.add_all(batch_created)
+        db.session.commit()
+        created.extend(batch_created)
+    return created, skipped
+
+def expand_spans(range_from, range_to, server_ids=None):
+    """Yield (series, server_name, start, end) of the occurrences of active series
+    overlapping [range_from, range_to) that are not rows yet"""
+    query = db.session.query(MaintenanceSeries, Server.name).join(Server, Server.id == MaintenanceSeries.server_id).filter(
+        MaintenanceSeries.active.is_(True),
+        MaintenanceSeries.dtstart < range_to,
+        MaintenanceSeries.materialized_until < range_to
+    )
+    if server_ids is not None:
+        query = query.filter(MaintenanceSeries.server_id.in_(list(server_ids)))
+
+    for series, server_name in query:
+        range_start = max(range_from, series.materialized_until + timedelta(microseconds=1))
+        for start, end in series_occurrences(series, range_start, range_to):
+            if start <= series.materialized_until:
+                continue  # Already a row (or deliberately deleted)
+            yield series, server_name, start, end
+
+def expand(range_from, range_to, server_ids=None):
+    """Occurrences of active series overlapping [range_from, range_to) that are not rows yet
+
+    Returns dicts shaped like MaintenanceSchedule.to_dict() with id None
+    and 'virtual': True; combine them with the rows of the same range for
+    a complete view. No rows are inserted.
+    """
+    return [
+        occurrence_dict(series, server_name, start, end)
+        for series, server_name, start, end in expand_spans(range_from, range_to, server_ids)
+    ]
+
+def occurrence_dict(series, server_name, start, end):
+    """A not yet materialized occurrence, shaped like MaintenanceSchedule.to_dict()"""
+    return {
+        'id': None,
+        'server_id': series.server_id,
+        'server_name': server_name,
+        'title': series.title,
+        'description': series.description,
+        'scheduled_start': start.isoformat(),
+        'scheduled_end': end.isoformat(),
+        'actual_start': None,
+        'actual_end': None,
+        'status': MaintenanceStatus.SCHEDULED.value,
+        'recurring': True,
+        'recurring_pattern': series.rule,
+        'series_id': series.id,
+        'virtual': True
+    }
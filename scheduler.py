@@ -1,90 +1,353 @@
 from apscheduler.schedulers.background import BackgroundScheduler
+from apscheduler.jobstores.base import JobLookupError
 from apscheduler.triggers.date import DateTrigger
 from apscheduler.triggers.cron import CronTrigger
+from apscheduler.triggers.interval import IntervalTrigger
 from datetime import datetime, timedelta
+import atexit
 import logging
+import time
 import pytz
+from sqlalchemy import and_, or_, select
 from models import db, Server, MaintenanceSchedule, ServerStatus, MaintenanceStatus
+from events import event_broker
+from actions import action_executor
+from prober import health_prober
+import recurrence
+from history import status_source
+
+# Scheduler whose transitions the module-level job functions run. Jobs
+# reference those functions by name so persistent job stores can store them.
+_active_scheduler = None
+
+def start_maintenance_job(maintenance_id):
+    """Job entry point for the start of a maintenance window"""
+    _active_scheduler._start_maintenance(maintenance_id)
+
+def end_maintenance_job(maintenance_id):
+    """Job entry point for the end of a maintenance window"""
+    _active_scheduler._end_maintenance(maintenance_id)
+
+def dispatch_transitions_job():
+    """Job entry point for the transition dispatcher tick"""
+    _active_scheduler._dispatch_transitions()
+
+def reconcile_transitions_job():
+    """Job entry point for the periodic overdue-transition sweep"""
+    _active_scheduler.reconcile_overdue()
+    _active_scheduler.materialize_recurrences()
 
 class MaintenanceScheduler:
+    JOB_PREFIXES = ('start_maintenance_', 'end_maintenance_')
+    DISPATCHER_JOB_ID = 'transition_dispatcher'
+    RECONCILE_JOB_ID = 'reconcile_transitions'
+    
     def __init__(self, app=None):
         self.scheduler = BackgroundScheduler()
         self.app = app
         self.logger = logging.getLogger(__name__)
+        self.jobstore = None
+        self.election = None
+        self.dispatcher = None
+        self.last_reconcile = None
         
     def init_app(self, app):
+        global _active_scheduler
         self.app = app
-        self.scheduler.start()
+        _active_scheduler = self
+        
+        leader_election = app.config.get('SCHEDULER_LEADER_ELECTION', False)
+        run_jobs = app.config.get('SCHEDULER_RUN_JOBS', True)
+        jobstore = app.config.get('SCHEDULER_JOBSTORE', 'memory')
+        if (leader_election or not run_jobs) and jobstore != 'sqlalchemy':
+            # Processes that may not run jobs must share the jobs they create
+            self.logger.info("Using the sqlalchemy job store because jobs are shared between processes")
+            jobstore = 'sqlalchemy'
+        
         with app.app_context():
+            options = {'job_defaults': {
+                'misfire_grace_time': app.config.get('SCHEDULER_MISFIRE_GRACE_TIME', 60),
+                'coalesce': True
+            }}
+            if jobstore == 'sqlalchemy':
+                from apscheduler.jobstores.sqlalchemy import SQLAlchemyJobStore
+                url = app.config.get('SCHEDULER_JOBSTORE_URL')
+                self.jobstore = SQLAlchemyJobStore(url=url) if url else SQLAlchemyJobStore(engine=db.engine)
+                options['jobstores'] = {'default': self.jobstore}
+            self.scheduler.configure(**options)
+            
+            if app.config.get('SCHEDULER_MODE', 'jobs') == 'dispatcher':
+                from dispatcher import TransitionDispatcher
+                self.dispatcher = TransitionDispatcher(
+                    self,
+                    tick=app.config.get('SCHEDULER_DISPATCH_TICK', 1),
+                    horizon=app.config.get('SCHEDULER_DISPATCH_HORIZON', 600),
+                    refresh_interval=app.config.get('SCHEDULER_DISPATCH_REFRESH', 10),
+                    batch_size=app.config.get('SCHEDULER_DISPATCH_BATCH_SIZE', 500),
+                    misfire_grace_time=app.config.get('SCHEDULER_MISFIRE_GRACE_TIME', 60),
+                    misfire_policy=app.config.get('SCHEDULER_MISFIRE_POLICY', 'run'),
+                    coalesce=app.config.get('SCHEDULER_DISPATCH_COALESCE', True)
+                )
+            
+            if not run_jobs:
+                # Web-only process: jobs are written to the shared store and
+                # run by a scheduler process (see scheduler_worker.py)
+                self.scheduler.start(paused=True)
+                return
+            
+            if not leader_election:
+                self.scheduler.start()
+                self._reschedule_existing_jobs()
+                return
+            
+            self.scheduler.start(paused=True)
+        
+        from leader import LeaderElection
+        self.election = LeaderElection(
+            app,
+            ttl=app.config.get('SCHEDULER_LEASE_TTL', 30),
+            on_elected=self._on_elected,
+            on_demoted=self.scheduler.pause,
+            # Pick up jobs that other processes wrote to the shared store
+            on_tick=self.scheduler.wakeup
+        )
+        self.election.start()
+        atexit.register(self.shutdown)
+    
+    def _on_elected(self):
+        with self.app.app_context():
             self._reschedule_existing_jobs()
+        self.scheduler.resume()
+    
+    def is_running_jobs(self):
+        """Whether this process currently executes maintenance jobs"""
+        from apscheduler.schedulers.base import STATE_RUNNING
+        return self.scheduler.state == STATE_RUNNING
     
     def _reschedule_existing_jobs(self):
-        """Reschedule existing maintenance jobs on app startup"""
+        """Reconcile the job store with the maintenance schedule table on app startup
+        
+        Only ids and window bounds are read, and only the jobs that are
+        missing from the store are added (and stale ones removed), so with
+        a persistent job store a restart does almost no scheduling work.
+        """
         try:
-            scheduled_maintenances = MaintenanceSchedule.query.filter_by(
-                status=MaintenanceStatus.SCHEDULED
-            ).all()
+            # Nothing is pending for transitions missed while no process ran jobs
+            self.reconcile_overdue(grace=0)
+            self.materialize_recurrences()
+            self._add_reconcile_job()
+            
+            if self.dispatcher is not None:
+                self._reconcile_dispatcher()
+                return
+            
+            self._remove_job(self.DISPATCHER_JOB_ID)
+            now = datetime.utcnow()
+            rows = db.session.query(
+                MaintenanceSchedule.id,
+                MaintenanceSchedule.status,
+                MaintenanceSchedule.scheduled_start,
+                MaintenanceSchedule.scheduled_end
+            ).filter(or_(
+                and_(MaintenanceSchedule.status == MaintenanceStatus.SCHEDULED,
+                     MaintenanceSchedule.scheduled_start > now),
+                and_(MaintenanceSchedule.status == MaintenanceStatus.IN_PROGRESS,
+                     MaintenanceSchedule.scheduled_end > now)
+            ))
+            
+            stored_ids = self._stored_job_ids()
+            expected_ids = set()
+            added = 0
+            for maintenance_id, status, scheduled_start, scheduled_end in rows:
+                if status == MaintenanceStatus.SCHEDULED:
+                    expected_ids.add(f"start_maintenance_{maintenance_id}")
+                    if f"start_maintenance_{maintenance_id}" not in stored_ids:
+                        self._add_job(start_maintenance_job, 'start', maintenance_id, scheduled_start)
+                        added += 1
+                expected_ids.add(f"end_maintenance_{maintenance_id}")
+                if f"end_maintenance_{maintenance_id}" not in stored_ids:
+                    self._add_job(end_maintenance_job, 'end', maintenance_id, scheduled_end)
+                    added += 1
+            
+            stale_ids = {job_id for job_id in stored_ids if job_id.startswith(self.JOB_PREFIXES)} - expected_ids
+            for job_id in stale_ids:
+                self._remove_job(job_id)
             
-            for maintenance in scheduled_maintenances:
-                if maintenance.scheduled_start > datetime.utcnow():
-                    self._schedule_maintenance_job(maintenance)
+            self.logger.info(
+                f"Reconciled job store: {len(stored_ids)} stored, {added} added, {len(stale_ids)} removed"
+            )
                     
         except Exception as e:
             self.logger.error(f"Error rescheduling existing jobs: {e}")
     
+    def _reconcile_dispatcher(self):
+        """Replace per-window jobs with the dispatcher job and reload its queue"""
+        stale_ids = {job_id for job_id in self._stored_job_ids() if job_id.startswith(self.JOB_PREFIXES)}
+        for job_id in stale_ids:
+            self._remove_job(job_id)
+        
+        self.scheduler.add_job(
+            func=dispatch_transitions_job,
+            trigger=IntervalTrigger(seconds=self.dispatcher.tick_interval),
+            id=self.DISPATCHER_JOB_ID,
+            max_instances=1,
+            coalesce=True,
+            replace_existing=True
+        )
+        self.dispatcher.refresh()
+        self.logger.info(
+            f"Transition dispatcher loaded {self.dispatcher.stats()['pending']} transitions, "
+            f"{len(stale_ids)} per-window jobs removed"
+        )
+    
+    def _add_reconcile_job(self):
+        interval = self.app.config.get('SCHEDULER_RECONCILE_INTERVAL', 300)
+        if interval <= 0:
+            self._remove_job(self.RECONCILE_JOB_ID)
+            return
+        self.scheduler.add_job(
+            func=reconcile_transitions_job,
+            trigger=IntervalTrigger(seconds=interval),
+            id=self.RECONCILE_JOB_ID,
+            max_instances=1,
+            coalesce=True,
+            replace_existing=True
+        )
+    
+    def reconcile_overdue(self, grace=None):
+        """Apply start/end transitions that are overdue by more than grace seconds
+        
+        Covers windows whose jobs never ran, e.g. because no process was
+        running jobs at the time; the default grace (the misfire grace
+        time) leaves transitions that are merely late to their own jobs.
+        Returns a report of the rows touched and the time taken.
+        """
+        from dispatcher import sweep_overdue_transitions
+        
+        if grace is None:
+            grace = self.app.config.get('SCHEDULER_MISFIRE_GRACE_TIME', 60)
+        batch_size = self.app.config.get('SCHEDULER_DISPATCH_BATCH_SIZE', 500)
+        
+        with self.app.app_context():
+            try:
+                started_at = time.monotonic()
+                missed, started, completed = sweep_overdue_transitions(
+                    datetime.utcnow() - timedelta(seconds=grace), batch_size,
+                    skip_late_starts=self.app.config.get('SCHEDULER_MISFIRE_POLICY', 'run') == 'skip'
+                )
+                
+                for maintenance_id, server_id, scheduled_end in started:
+                    self._add_end_transition(maintenance_id, scheduled_end)
+                self._after_transitions([row[:2] for row in started], completed, missed)
+                
+                report = {
+                    'missed': len(missed),
+                    'started': len(started),
+                    'completed': len(completed),
+                    'elapsed_ms': round((time.monotonic() - started_at) * 1000, 1),
+                    'finished_at': datetime.utcnow().isoformat()
+                }
+                self.last_reconcile = report
+                log = self.logger.warning if missed or started or completed else self.logger.info
+                log(
+                    f"Reconciled overdue maintenance: {report['missed']} missed, {report['started']} started, "
+                    f"{report['completed']} completed in {report['elapsed_ms']}ms"
+                )
+                return report
+                
+            except Exception as e:
+                db.session.rollback()
+                self.logger.error(f"Error reconciling overdue maintenance: {e}")
+    
+    def _stored_job_ids(self):
+        """Ids of the jobs in the job store, read without unpickling the jobs"""
+        if self.jobstore is not None:
+            with self.jobstore.engine.connect() as connection:
+                return {job_id for (job_id,) in connection.execute(select(self.jobstore.jobs_t.c.id))}
+        return {job.id for job in self.scheduler.get_jobs()}
+    
     def schedule_maintenance(self, maintenance_id):
         """Schedule a maintenance task"""
         with self.app.app_context():
-            maintenance = MaintenanceSchedule.query.get(maintenance_id)
+            maintenance = MaintenanceSchedule.query_with_server().get(maintenance_id)
             if not maintenance:
                 raise ValueError(f"Maintenance schedule {maintenance_id} not found")
             
             self._schedule_maintenance_job(maintenance)
             
+    def schedule_maintenance_batch(self, maintenances):
+        """Register jobs for many already-loaded maintenance schedules at once"""
+        scheduled = 0
+        for maintenance in maintenances:
+            try:
+                self._add_transition_jobs(maintenance)
+                scheduled += 1
+            except Exception as e:
+                self.logger.error(f"Error scheduling maintenance {maintenance.id}: {e}")
+        
+        self.logger.info(f"Scheduled {scheduled} maintenance windows in batch")
+        return scheduled
+            
     def _schedule_maintenance_job(self, maintenance):
         """Internal method to schedule a maintenance job"""
         try:
-            # Schedule start maintenance job
-            start_job_id = f"start_maintenance_{maintenance.id}"
-            self.scheduler.add_job(
-                func=self._start_maintenance,
-                trigger=DateTrigger(run_date=maintenance.scheduled_start),
-                args=[maintenance.id],
-                id=start_job_id,
-                replace_existing=True
-            )
-            
-            # Schedule end maintenance job
-            end_job_id = f"end_maintenance_{maintenance.id}"
-            self.scheduler.add_job(
-                func=self._end_maintenance,
-                trigger=DateTrigger(run_date=maintenance.scheduled_end),
-                args=[maintenance.id],
-                id=end_job_id,
-                replace_existing=True
-            )
-            
+            self._add_transition_jobs(maintenance)
             self.logger.info(f"Scheduled maintenance {maintenance.id} for server {maintenance.server.name}")
             
         except Exception as e:
             self.logger.error(f"Error scheduling maintenance {maintenance.id}: {e}")
     
+    def _add_transition_jobs(self, maintenance):
+        """Add the start and end jobs of a maintenance window"""
+        if self.dispatcher is not None:
+            self.dispatcher.push('start', maintenance.id, maintenance.scheduled_start)
+            self.dispatcher.push('end', maintenance.id, maintenance.scheduled_end)
+            return
+        self._add_job(start_maintenance_job, 'start', maintenance.id, maintenance.scheduled_start)
+        self._add_job(end_maintenance_job, 'end', maintenance.id, maintenance.scheduled_end)
+    
+    def _add_end_transition(self, maintenance_id, scheduled_end):
+        if self.dispatcher is not None:
+            self.dispatcher.push('end', maintenance_id, scheduled_end)
+        else:
+            self._add_job(end_maintenance_job, 'end', maintenance_id, scheduled_end)
+    
+    def _add_job(self, func, kind, maintenance_id, run_date):
+        self.scheduler.add_job(
+            func=func,
+            trigger=DateTrigger(run_date=run_date),
+            args=[maintenance_id],
+            id=f"{kind}_maintenance_{maintenance_id}",
+            replace_existing=True
+        )
+    
+    def _remove_job(self, job_id):
+        try:
+            self.scheduler.remove_job(job_id)
+        except JobLookupError:
+            pass
+    
+    def unschedule_maintenance(self, maintenance_id):
+        """Remove the start/end jobs of a maintenance without changing its status"""
+        if self.dispatcher is not None:
+            self.dispatcher.discard(maintenance_id)
+            return
+        self._remove_job(f"start_maintenance_{maintenance_id}")
+        self._remove_job(f"end_maintenance_{maintenance_id}")
+    
     def cancel_maintenance(self, maintenance_id):
         """Cancel a scheduled maintenance"""
         try:
-            start_job_id = f"start_maintenance_{maintenance_id}"
-            end_job_id = f"end_maintenance_{maintenance_id}"
-            
-            if self.scheduler.get_job(start_job_id):
-                self.scheduler.remove_job(start_job_id)
-            if self.scheduler.get_job(end_job_id):
-                self.scheduler.remove_job(end_job_id)
+            self.unschedule_maintenance(maintenance_id)
                 
             with self.app.app_context():
                 maintenance = MaintenanceSchedule.query.get(maintenance_id)
                 if maintenance:
                     maintenance.status = MaintenanceStatus.CANCELLED
                     db.session.commit()
+                    event_broker.publish('maintenance.cancelled', {
+                        'id': maintenance.id, 'server_id': maintenance.server_id, 'status': maintenance.status.value
+                    })
                     
             self.logger.info(f"Cancelled maintenance {maintenance_id}")
             
@@ -99,6 +362,10 @@ class MaintenanceScheduler:
                 if not maintenance:
                     self.logger.error(f"Maintenance {maintenance_id} not found")
                     return
+                if maintenance.status != MaintenanceStatus.SCHEDULED:
+                    # Already started by the reconciliation sweep, or cancelled
+                    self.logger.info(f"Maintenance {maintenance_id} is {maintenance.status.value}, not starting")
+                    return
                 
                 server = maintenance.server
                 
@@ -109,13 +376,17 @@ class MaintenanceScheduler:
                 maintenance.status = MaintenanceStatus.IN_PROGRESS
                 maintenance.actual_start = datetime.utcnow()
                 
-                db.session.commit()
+                with status_source('scheduler'):
+                    db.session.commit()
+                
+                event_broker.publish('maintenance.started', {
+                    'id': maintenance.id, 'server_id': server.id,
+                    'status': maintenance.status.value, 'server_status': server.status.value
+                })
                 
                 self.logger.info(f"Started maintenance for server {server.name}")
                 
-                # Here you would implement actual server maintenance actions
-                # For example: stopping services, sending notifications, etc.
-                self._perform_maintenance_actions(server, 'start')
+                self._perform_maintenance_actions(server, 'start', maintenance.id)
                 
             except Exception as e:
                 self.logger.error(f"Error starting maintenance {maintenance_id}: {e}")
@@ -128,93 +399,200 @@ class MaintenanceScheduler:
                 if not maintenance:
                     self.logger.error(f"Maintenance {maintenance_id} not found")
                     return
+                if maintenance.status in (MaintenanceStatus.COMPLETED, MaintenanceStatus.CANCELLED):
+                    self.logger.info(f"Maintenance {maintenance_id} is {maintenance.status.value}, not ending")
+                    return
                 
                 server = maintenance.server
                 
-                # Update server status
-                server.status = ServerStatus.ONLINE
-                
                 # Update maintenance schedule
                 maintenance.status = MaintenanceStatus.COMPLETED
                 maintenance.actual_end = datetime.utcnow()
                 
-                db.session.commit()
+                # Release the server unless another window still holds it, as the dispatcher does
+                held = db.session.query(MaintenanceSchedule.id).filter(
+                    MaintenanceSchedule.server_id == server.id,
+                    MaintenanceSchedule.status == MaintenanceStatus.IN_PROGRESS,
+                    MaintenanceSchedule.id != maintenance.id
+                ).first() is not None
+                if not held:
+                    server.status = ServerStatus.ONLINE
+                
+                with status_source('scheduler'):
+                    db.session.commit()
+                
+                event_broker.publish('maintenance.completed', {
+                    'id': maintenance.id, 'server_id': server.id,
+                    'status': maintenance.status.value, 'server_status': server.status.value
+                })
                 
-                self.logger.info(f"Ended maintenance for server {server.name}")
+                if held:
+                    self.logger.info(f"Ended maintenance {maintenance.id}; server {server.name} stays in maintenance for another window")
+                else:
+                    self.logger.info(f"Ended maintenance for server {server.name}")
                 
-                # Here you would implement actual server recovery actions
-                self._perform_maintenance_actions(server, 'end')
+                self._perform_maintenance_actions(server, 'end', maintenance.id)
                 
                 # Schedule recurring maintenance if applicable
                 if maintenance.recurring:
                     self._schedule_recurring_maintenance(maintenance)
                 
+                # Mark the server offline if it did not come back
+                if not held and self.app.config.get('PROBE_RECOVERY_CHECK'):
+                    health_prober.recovery_check([server.id])
+                
             except Exception as e:
                 self.logger.error(f"Error ending maintenance {maintenance_id}: {e}")
     
-    def _perform_maintenance_actions(self, server, action):
-        """Perform actual maintenance actions (placeholder for real implementations)"""
-        if action == 'start':
-            self.logger.info(f"Starting maintenance actions for {server.name}")
-            # Implement actual maintenance start actions here:
-            # - Stop services
-            # - Send notifications
-            # - Update load balancer
-            # - etc.
-        elif action == 'end':
-            self.logger.info(f"Ending maintenance actions for {server.name}")
-            # Implement actual maintenance end actions here:
-            # - Start services
-            # - Health checks
-            # - Update load balancer
-            # - Send recovery notifications
-            # - etc.
+    def _dispatch_transitions(self):
+        """Run one dispatcher tick"""
+        with self.app.app_context():
+            try:
+                self.dispatcher.tick()
+            except Exception as e:
+                db.session.rollback()
+                self.logger.error(f"Error dispatching maintenance transitions: {e}")
+    
+    def _after_transitions(self, started, completed, missed=()):
+        """Follow-up work for windows that were started or completed in bulk
+        
+        started, completed and missed are (maintenance_id, server_id) pairs
+        that are already committed; servers and recurring windows are loaded
+        with one query per batch. Missed windows never took their servers
+        down, so they only get their recurring follow-up.
+        """
+        batch_size = self.app.config.get('SCHEDULER_DISPATCH_BATCH_SIZE', 500)
+        for event_type, action, rows in (
+            ('maintenance.batch_started', 'start', started),
+            ('maintenance.batch_completed', 'end', list(completed) + list(missed))
+        ):
+            if not rows:
+                continue
+            event_broker.publish(event_type, {
+                'count': len(rows),
+                'ids': [maintenance_id for maintenance_id, _ in rows],
+                'server_ids': sorted({server_id for _, server_id in rows})
+            })
+        
+        for action, rows in (('start', started), ('end', completed)):
+            rows = list(rows)
+            for index in range(0, len(rows), batch_size):
+                batch = rows[index:index + batch_size]
+                servers = {server.id: server for server in Server.query.filter(
+                    Server.id.in_({server_id for _, server_id in batch})
+                )}
+                try:
+                    self._perform_maintenance_actions_batch(action, [
+                        (maintenance_id, servers[server_id]) for maintenance_id, server_id in batch
+                        if server_id in servers
+                    ])
+                except Exception as e:
+                    self.logger.error(f"Error running maintenance actions for {len(batch)} windows: {e}")
+                
+                if action == 'end' and self.app.config.get('PROBE_RECOVERY_CHECK'):
+                    try:
+                        health_prober.recovery_check(list(servers))
+                    except Exception as e:
+                        self.logger.error(f"Error checking recovery of {len(servers)} servers: {e}")
+        
+        ended_ids = [maintenance_id for maintenance_id, _ in list(completed) + list(missed)]
+        for index in range(0, len(ended_ids), batch_size):
+            self._schedule_recurring_batch(MaintenanceSchedule.query.filter(
+                MaintenanceSchedule.id.in_(ended_ids[index:index + batch_size]),
+                MaintenanceSchedule.recurring.is_(True)
+            ).all())
+    
+    def get_status(self):
+        """Mode, leadership and dispatcher counters of this process"""
+        status = {
+            'mode': 'dispatcher' if self.dispatcher is not None else 'jobs',
+            'running_jobs': self.is_running_jobs(),
+            'leader_election': self.election is not None,
+            'is_leader': self.election.is_leader if self.election is not None else None,
+            'last_reconcile': self.last_reconcile
+        }
+        if self.dispatcher is not None:
+            status['dispatcher'] = self.dispatcher.stats()
+        status['actions'] = action_executor.stats()
+        status['health_prober'] = health_prober.stats()
+        return status
+    
+    def _perform_maintenance_actions(self, server, action, maintenance_id):
+        """Run the registered actions of a window's start or end for its server"""
+        self._perform_maintenance_actions_batch(action, [(maintenance_id, server)])
+    
+    def _perform_maintenance_actions_batch(self, action, targets):
+        """Queue the registered 'start' or 'end' actions for (maintenance_id, server) pairs
+        
+        The actions run on the action executor's pool (see actions.py);
+        their results are recorded per maintenance window.
+        """
+        if not targets:
+            return
+        queued = action_executor.run(action, targets)
+        verb = 'Starting' if action == 'start' else 'Ending'
+        servers = targets[0][1].name if len(targets) == 1 else f"{len(targets)} servers"
+        self.logger.info(f"{verb} maintenance actions for {servers} ({queued} with registered actions)")
     
     def _schedule_recurring_maintenance(self, maintenance):
         """Schedule the next occurrence of a recurring maintenance"""
+        self._schedule_recurring_batch([maintenance])
+    
+    def _schedule_recurring_batch(self, maintenances):
+        """Keep the series of ended recurring windows materialized
+        
+        Windows created before series existed (a chain of rows, each
+        creating the next when it ends) are turned into a series first.
+        """
         try:
-            if not maintenance.recurring_pattern:
-                return
-                
-            # Calculate next occurrence based on pattern
-            next_start = None
-            if maintenance.recurring_pattern == 'weekly':
-                next_start = maintenance.scheduled_start + timedelta(weeks=1)
-            elif maintenance.recurring_pattern == 'monthly':
-                next_start = maintenance.scheduled_start + timedelta(days=30)
-            elif maintenance.recurring_pattern == 'daily':
-                next_start = maintenance.scheduled_start + timedelta(days=1)
-            
-            if next_start and next_start > datetime.utcnow():
-                duration = maintenance.scheduled_end - maintenance.scheduled_start
-                next_end = next_start + duration
-                
-                # Create new maintenance schedule
-                new_maintenance = MaintenanceSchedule(
-                    server_id=maintenance.server_id,
-                    title=maintenance.title,
-                    description=maintenance.description,
-                    scheduled_start=next_start,
-                    scheduled_end=next_end,
-                    status=MaintenanceStatus.SCHEDULED,
-                    recurring=True,
-                    recurring_pattern=maintenance.recurring_pattern
-                )
-                
-                db.session.add(new_maintenance)
-                db.session.commit()
-                
-                # Schedule the new maintenance
-                self._schedule_maintenance_job(new_maintenance)
-                
-                self.logger.info(f"Scheduled recurring maintenance for {maintenance.server.name}")
-                
+            series_ids = set()
+            for maintenance in maintenances:
+                if maintenance.series_id is None and maintenance.recurring_pattern:
+                    try:
+                        recurrence.parse_pattern(maintenance.recurring_pattern)
+                        recurrence.create_series(maintenance)
+                    except ValueError as e:
+                        self.logger.error(f"Not repeating maintenance {maintenance.id}: {e}")
+                        continue
+                    db.session.flush()
+                if maintenance.series_id is not None:
+                    series_ids.add(maintenance.series_id)
+            db.session.commit()
+            
+            if series_ids:
+                self.materialize_recurrences(series_ids)
+            
         except Exception as e:
+            db.session.rollback()
             self.logger.error(f"Error scheduling recurring maintenance: {e}")
     
+    def materialize_recurrences(self, series_ids=None):
+        """Create and schedule the occurrences within the recurrence horizon"""
+        horizon_end = datetime.utcnow() + timedelta(days=self.app.config.get('RECURRENCE_HORIZON_DAYS', 7))
+        with self.app.app_context():
+            try:
+                created, skipped = recurrence.materialize(
+                    horizon_end, series_ids, self.app.config.get('SCHEDULER_DISPATCH_BATCH_SIZE', 500)
+                )
+                for series, start in skipped:
+                    self.logger.warning(
+                        f"Skipped occurrence {start.isoformat()} of maintenance series {series.id}: "
+                        f"server {series.server_id} already has maintenance at that time"
+                    )
+                if created:
+                    self.schedule_maintenance_batch(created)
+                    event_broker.publish('maintenance.bulk_created', {'count': len(created)})
+                    self.logger.info(f"Materialized {len(created)} recurring maintenance windows")
+                return created
+                
+            except Exception as e:
+                db.session.rollback()
+                self.logger.error(f"Error materializing recurring maintenance: {e}")
+                return []
+    
     def get_scheduled_jobs(self):
         """Get list of currently scheduled jobs"""
-        return [
+        jobs = [
             {
                 'id': job.id,
                 'next_run_time': job.next_run_time.isoformat() if job.next_run_time else None,
@@ -222,8 +600,23 @@ class MaintenanceScheduler:
             }
             for job in self.scheduler.get_jobs()
         ]
+        if self.dispatcher is not None:
+            # Transitions queued in the dispatcher stand in for per-window jobs
+            jobs.extend(
+                {
+                    'id': f"{kind}_maintenance_{maintenance_id}",
+                    'next_run_time': run_at.isoformat(),
+                    'func_name': dispatch_transitions_job.__name__
+                }
+                for kind, maintenance_id, run_at in self.dispatcher.pending()
+            )
+        return jobs
     
     def shutdown(self):
         """Shutdown the scheduler"""
+        if self.election is not None:
+            self.election.stop()
+            self.election = None
+        action_executor.shutdown()
         if self.scheduler.running:
             self.scheduler.shutdown() 
\ No newline at end of file
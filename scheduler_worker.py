@@ -0,0 +1,44 @@
+#!/usr/bin/env python3
+"""
+Standalone Scheduler Entry Point for Server Maintenance Scheduler
+Runs maintenance jobs in a dedicated process. Web processes started with
+SCHEDULER_RUN_JOBS=false only write jobs to the shared job store, so they
+can be scaled without scaling the scheduler. Several of these processes
+may run at once; leader election makes exactly one of them active.
+"""
+
+import os
+import signal
+import sys
+import threading
+import logging
+
+# This process runs jobs and takes part in leader election
+os.environ['SCHEDULER_RUN_JOBS'] = 'true'
+os.environ.setdefault('SCHEDULER_LEADER_ELECTION', 'true')
+
+from app import create_app
+
+def main():
+    """Main entry point"""
+    logging.basicConfig(
+        level=getattr(logging, os.environ.get('LOG_LEVEL', 'INFO').upper()),
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    )
+    
+    app = create_app()
+    scheduler = app.extensions['maintenance_scheduler']
+    
+    stopped = threading.Event()
+    signal.signal(signal.SIGTERM, lambda signum, frame: stopped.set())
+    signal.signal(signal.SIGINT, lambda signum, frame: stopped.set())
+    
+    print("⏰ Maintenance scheduler worker running (Ctrl+C to stop)")
+    stopped.wait()
+    
+    scheduler.shutdown()
+    print("🛑 Maintenance scheduler worker stopped")
+    sys.exit(0)
+
+if __name__ == '__main__':
+    main()
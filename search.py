@@ -0,0 +1,305 @@
+import bisect
+import heapq
+import re
+import threading
+from datetime import datetime, timedelta
+from sqlalchemy import bindparam, select, text
+from models import db, Server, DeletedRecord
+
+# Indexed columns and their ranking weights
+SEARCH_FIELDS = ('name', 'hostname', 'ip_address', 'description')
+FIELD_WEIGHTS = (10.0, 5.0, 5.0, 1.0)
+
+# Same token rule as the FTS5 unicode61 tokenizer: runs of letters and digits
+_TOKEN = re.compile(r'[^\W_]+')
+
+def tokenize(value):
+    return _TOKEN.findall((value or '').lower())
+
+def parse_query(query, max_terms=10):
+    """Split a search string into terms, each a list of tokens
+
+    A term is a whitespace-separated word; punctuation inside it
+    ('web-01', '10.0.3') splits it into tokens that must appear one after
+    another. The last token of every term also matches as a prefix.
+    """
+    terms = [tokens for tokens in (tokenize(word) for word in query.split()) if tokens]
+    return terms[:max_terms]
+
+class FtsBackend:
+    """SQLite FTS5 table over the server table, kept in sync by triggers
+
+    The triggers cover every write path, including bulk imports and bulk
+    UPDATEs that bypass the ORM. Ranking is bm25 with FIELD_WEIGHTS.
+    """
+    name = 'fts5'
+
+    TABLE = 'server_search'
+    TRIGGERS = {
+        'server_search_ai': """
+            CREATE TRIGGER server_search_ai AFTER INSERT ON server BEGIN
+                INSERT INTO server_search(rowid, name, hostname, ip_address, description)
+                VALUES (new.id, new.name, new.hostname, new.ip_address, new.description);
+            END""",
+        'server_search_ad': """
+            CREATE TRIGGER server_search_ad AFTER DELETE ON server BEGIN
+                INSERT INTO server_search(server_search, rowid, name, hostname, ip_address, description)
+                VALUES ('delete', old.id, old.name, old.hostname, old.ip_address, old.description);
+            END""",
+        # Status flips do not touch the indexed columns and skip the trigger
+        'server_search_au': """
+            CREATE TRIGGER server_search_au AFTER UPDATE OF name, hostname, ip_address, description ON server BEGIN
+                INSERT INTO server_search(server_search, rowid, name, hostname, ip_address, description)
+                VALUES ('delete', old.id, old.name, old.hostname, old.ip_address, old.description);
+                INSERT INTO server_search(rowid, name, hostname, ip_address, description)
+                VALUES (new.id, new.name, new.hostname, new.ip_address, new.description);
+            END"""
+    }
+
+    @staticmethod
+    def available():
+        try:
+            db.session.execute(text('CREATE VIRTUAL TABLE temp.fts5_probe USING fts5(value)'))
+            db.session.execute(text('DROP TABLE temp.fts5_probe'))
+            return True
+        except Exception:
+            db.session.rollback()
+            return False
+
+    def setup(self):
+        """Create the FTS table and triggers; rebuild the index when any was missing"""
+        existing = {name for (name,) in db.session.execute(
+            text('SELECT name FROM sqlite_master WHERE name IN :names').bindparams(bindparam('names', expanding=True)),
+            {'names': [self.TABLE, *self.TRIGGERS]}
+        )}
+        if self.TABLE not in existing:
+            db.session.execute(text(
+                f"CREATE VIRTUAL TABLE {self.TABLE} USING fts5("
+                f"{', '.join(SEARCH_FIELDS)}, content='server', content_rowid='id', prefix='2 3')"
+            ))
+        for trigger, statement in self.TRIGGERS.items():
+            if trigger not in existing:
+                db.session.execute(text(statement))
+        if len(existing) < len(self.TRIGGERS) + 1:
+            # Writes made while the table or a trigger was missing are not indexed
+            db.session.execute(text(f"INSERT INTO {self.TABLE}({self.TABLE}) VALUES ('rebuild')"))
+        db.session.commit()
+
+    def search(self, terms, limit, offset):
+        # Tokens are letters and digits only, so quoting them is safe
+        match = ' AND '.join('"' + ' '.join(tokens) + '"*' for tokens in terms)
+        weights = ', '.join(str(weight) for weight in FIELD_WEIGHTS)
+        total = db.session.execute(
+            text(f'SELECT count(*) FROM {self.TABLE} WHERE {self.TABLE} MATCH :match'), {'match': match}
+        ).scalar()
+        ids = list(db.session.execute(text(
+            f'SELECT rowid FROM {self.TABLE} WHERE {self.TABLE} MATCH :match '
+            f'ORDER BY bm25({self.TABLE}, {weights}), rowid LIMIT :limit OFFSET :offset'
+        ), {'match': match, 'limit': limit, 'offset': offset}).scalars())
+        return ids, total
+
+    def stats(self):
+        return {'backend': self.name}
+
+# Best field weight among the fields set in a bit mask of SEARCH_FIELDS
+_MASK_WEIGHTS = [
+    max((weight for bit, weight in enumerate(FIELD_WEIGHTS) if mask & 1 << bit), default=0.0)
+    for mask in range(1 << len(SEARCH_FIELDS))
+]
+
+class InvertedIndex:
+    """In-process inverted index for databases without FTS5
+
+    Postings map each token to {server_id: bit mask of the fields holding
+    it}; a sorted token list turns a prefix into one bisect range, like
+    walking a trie. A term scores the weight of its best field, doubled
+    for a whole-token match, so ranking needs one pass over the postings
+    of each term. The index is loaded once and then brought up to date
+    before each search from rows with a newer updated_at and from
+    deletion tombstones, so it also sees imports and writes made by other
+    processes.
+    """
+    name = 'memory'
+
+    def __init__(self, safety_window=5, retention_days=7):
+        self.safety_window = safety_window
+        self.retention_days = retention_days
+        self._lock = threading.Lock()
+        self._postings = {}
+        self._tokens = []
+        self._documents = {}
+        self._synced_at = None
+        # Tokens gained and lost during a sync, merged into _tokens once at its end
+        self._added = set()
+        self._removed = set()
+
+    def setup(self):
+        with self._lock:
+            self._sync()
+
+    def search(self, terms, limit, offset):
+        with self._lock:
+            self._sync()
+            term_scores = sorted((self._term_scores(tokens) for tokens in terms), key=len)
+        # Walk the rarest term's matches and look the others up
+        scored = []
+        for server_id, score in term_scores[0].items():
+            for other in term_scores[1:]:
+                other_score = other.get(server_id)
+                if other_score is None:
+                    break
+                score += other_score
+            else:
+                scored.append((-score, server_id))
+        top = heapq.nsmallest(offset + limit, scored)
+        return [server_id for _, server_id in top[offset:]], len(scored)
+
+    def stats(self):
+        return {'backend': self.name, 'documents': len(self._documents), 'tokens': len(self._tokens)}
+
+    def _sync(self):
+        now = datetime.utcnow()
+        columns = select(Server.id, *(getattr(Server, field) for field in SEARCH_FIELDS))
+        reload = self._synced_at is None or self._synced_at < now - timedelta(days=self.retention_days)
+        if reload:
+            # First load, or tombstones may have been pruned since the last sync
+            self._postings, self._tokens, self._documents = {}, [], {}
+            self._added, self._removed = set(), set()
+            changed = columns
+        else:
+            # Deletions first: SQLite may hand a deleted id to a new server
+            for server_id in db.session.execute(select(DeletedRecord.record_id).where(
+                DeletedRecord.table_name == Server.__tablename__,
+                DeletedRecord.deleted_at > self._synced_at
+            )).scalars():
+                self._remove(server_id)
+            changed = columns.where(Server.updated_at > self._synced_at)
+
+        for server_id, *values in db.session.execute(changed.execution_options(yield_per=5000)):
+            fields = tuple(tokenize(value) for value in values)
+            if self._documents.get(server_id) != fields:
+                self._remove(server_id)
+                self._add(server_id, fields)
+        self._merge_tokens()
+        # Rows stamped shortly before a slow transaction committed are read again next time
+        self._synced_at = now - timedelta(seconds=self.safety_window)
+
+    def _add(self, server_id, fields):
+        self._documents[server_id] = fields
+        masks = {}
+        for bit, tokens in enumerate(fields):
+            for token in tokens:
+                masks[token] = masks.get(token, 0) | 1 << bit
+        for token, mask in masks.items():
+            postings = self._postings.get(token)
+            if postings is None:
+                postings = self._postings[token] = {}
+                if token in self._removed:
+                    self._removed.discard(token)  # Still in _tokens
+                else:
+                    self._added.add(token)
+            postings[server_id] = mask
+
+    def _remove(self, server_id):
+        fields = self._documents.pop(server_id, None)
+        if fields is None:
+            return
+        for token in {token for tokens in fields for token in tokens}:
+            postings = self._postings[token]
+            del postings[server_id]
+            if not postings:
+                del self._postings[token]
+                if token in self._added:
+                    self._added.discard(token)  # Not in _tokens yet
+                else:
+                    self._removed.add(token)
+
+    def _merge_tokens(self):
+        """Apply the token changes of a sync to the sorted token list in one pass"""
+        if self._removed:
+            self._tokens = [token for token in self._tokens if token not in self._removed]
+            self._removed = set()
+        if self._added:
+            self._tokens = list(heapq.merge(self._tokens, sorted(self._added)))
+            self._added = set()
+
+    def _prefixed(self, prefix):
+        start = bisect.bisect_left(self._tokens, prefix)
+        end = bisect.bisect_left(self._tokens, prefix + '\uffff')
+        return self._tokens[start:end]
+
+    def _term_scores(self, tokens):
+        """{server_id: score} of the servers matching a term"""
+        last = tokens[-1]
+        scores = {}
+        for token in self._prefixed(last):
+            factor = 2.0 if token == last else 1.0
+            for server_id, mask in self._postings[token].items():
+                score = _MASK_WEIGHTS[mask] * factor
+                if score > scores.get(server_id, 0.0):
+                    scores[server_id] = score
+        if len(tokens) == 1:
+            return scores
+
+        # Token sequences: narrow down by postings, then check the order in the stored tokens
+        for token in tokens[:-1]:
+            postings = self._postings.get(token, {})
+            scores = {server_id: score for server_id, score in scores.items() if server_id in postings}
+        return {
+            server_id: score for server_id, score in (
+                (server_id, self._sequence_score(self._documents[server_id], tokens)) for server_id in scores
+            ) if score
+        }
+
+    @staticmethod
+    def _sequence_score(fields, tokens):
+        """Score of the best field holding tokens one after another (the last as a prefix), or 0"""
+        best = 0.0
+        width = len(tokens)
+        for weight, field in zip(FIELD_WEIGHTS, fields):
+            for index in range(len(field) - width + 1):
+                if field[index:index + width - 1] == tokens[:-1] and field[index + width - 1].startswith(tokens[-1]):
+                    best = max(best, weight * (2.0 if field[index + width - 1] == tokens[-1] else 1.0))
+        return best
+
+class ServerSearch:
+    """Ranked prefix/token search over the server inventory
+
+    Uses FTS5 on SQLite builds that have it and the in-process inverted
+    index elsewhere (or with SEARCH_BACKEND=memory).
+    """
+
+    def __init__(self):
+        self.app = None
+        self.backend = None
+
+    def init_app(self, app):
+        """Pick and prepare the backend; call inside an app context after the tables exist"""
+        self.app = app
+        wanted = app.config.get('SEARCH_BACKEND', 'auto')
+        if wanted != 'memory' and db.engine.dialect.name == 'sqlite' and FtsBackend.available():
+            self.backend = FtsBackend()
+        else:
+            if wanted == 'fts5':
+                app.logger.warning('FTS5 is not available; using the in-process search index')
+            self.backend = InvertedIndex(app.config['DELTA_SAFETY_WINDOW'], app.config['DELETED_RECORD_RETENTION_DAYS'])
+        self.backend.setup()
+
+    def search(self, query, limit, offset=0, projection=None):
+        """(servers in rank order, total matches) for a search string
+        
+        With projection (a Server.projection_query() selecting id) the
+        servers are its rows instead of Server objects.
+        """
+        terms = parse_query(query)
+        if not terms:
+            return [], 0
+        ids, total = self.backend.search(terms, limit, offset)
+        source = Server.query if projection is None else projection
+        servers = {server.id: server for server in source.filter(Server.id.in_(ids))} if ids else {}
+        return [servers[server_id] for server_id in ids if server_id in servers], total
+
+    def stats(self):
+        return self.backend.stats() if self.backend else {'backend': None}
+
+server_search = ServerSearch()
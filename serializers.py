@@ -0,0 +1,167 @@
+import json
+import re
+from datetime import datetime
+from itertools import repeat
+from json.encoder import encode_basestring_ascii
+from operator import itemgetter
+from flask import current_app, jsonify
+from flask.json.provider import DefaultJSONProvider
+from sqlalchemy import Boolean, DateTime, Integer, String
+from sqlalchemy import Enum as EnumType
+
+try:
+    import orjson  # Optional: pip install orjson
+except ImportError:
+    orjson = None
+
+# What jsonify() writes outside debug mode: sorted keys, compact, ASCII only
+_STDLIB = json.JSONEncoder(separators=(',', ':'), sort_keys=True)
+
+# orjson writes UTF-8; jsonify() escapes everything outside ' '..'~'
+_ASCII_KEPT = bytes(range(0x7f))
+_NOT_ASCII = re.compile(rb'[\x7f-\xff]+')
+_DISTINCT_REPLACE_MAX = 64
+
+class RawJSON(bytes):
+    """Already encoded JSON, spliced into a response body as it is"""
+
+class _EnumJSON(dict):
+    def __missing__(self, member):
+        value = self[member] = _STDLIB.encode(member.value)
+        return value
+
+_enum_json = _EnumJSON()
+_BOOLEANS = {True: 'true', False: 'false'}
+
+# Column-at-a-time encoders of non-null values; C-level map() over whole columns
+_ENCODERS = {
+    'int': lambda values: map(str, values),
+    'str': lambda values: map(encode_basestring_ascii, values),
+    'bool': lambda values: map(_BOOLEANS.__getitem__, values),
+    'datetime': lambda values: map('"{}"'.format, map(datetime.isoformat, values)),
+    'enum': lambda values: map(_enum_json.__getitem__, values),
+    'json': lambda values: map(_STDLIB.encode, values)
+}
+
+def column_kind(sql_type):
+    """Encoder kind of a SQLAlchemy column type"""
+    if isinstance(sql_type, Boolean):
+        return 'bool'
+    if isinstance(sql_type, Integer):
+        return 'int'
+    if isinstance(sql_type, DateTime):
+        return 'datetime'
+    if isinstance(sql_type, EnumType):
+        return 'enum' if sql_type.enum_class is not None else 'str'
+    if isinstance(sql_type, String):
+        return 'str'
+    raise ValueError(f'No JSON encoding for column type {sql_type!r}')
+
+class RowEncoder:
+    """Encodes column tuples as a JSON array of objects, byte for byte like jsonify() of to_dict()s
+
+    Built once per field list: the keys are sorted up front and every
+    field has a fixed kind ('int', 'str', 'bool', 'datetime', 'enum' or
+    'json' for lists and other plain values). With orjson installed rows
+    become dicts already in key order and orjson encodes them (naive
+    datetimes and enums the way isoformat()/.value do); without it each
+    column is encoded in one pass and the objects are filled into a
+    precompiled '%' template.
+    """
+
+    def __init__(self, fields):
+        self.fields = tuple(fields)
+        order = sorted(range(len(self.fields)), key=lambda index: self.fields[index][0])
+        self.keys = tuple(self.fields[index][0] for index in order)
+        self._kinds = tuple(self.fields[index][1] for index in order)
+        self._order = order
+        self._pick = itemgetter(*order) if len(order) > 1 else (lambda row: (row[order[0]],))
+        self._template = '{' + ','.join(
+            encode_basestring_ascii(key).replace('%', '%%') + ':%s' for key in self.keys
+        ) + '}'
+
+    def encode(self, rows):
+        """JSON array of rows (tuples in field order; values past the last field are left out)"""
+        if not rows:
+            return RawJSON(b'[]')
+        if orjson is not None:
+            try:
+                return RawJSON(_escape_non_ascii(orjson.dumps(
+                    list(map(dict, map(zip, repeat(self.keys), map(self._pick, rows))))
+                )))
+            except TypeError:
+                pass  # e.g. integers beyond 64 bits; the stdlib path encodes anything jsonify() does
+        columns = list(zip(*rows))
+        encoded = [_encode_column(kind, columns[index]) for index, kind in zip(self._order, self._kinds)]
+        return RawJSON(('[' + ','.join(map(self._template.__mod__, zip(*encoded))) + ']').encode())
+
+    def encode_object(self, row):
+        """JSON object of a single row"""
+        return RawJSON(self.encode([row])[1:-1])
+
+def _encode_column(kind, values):
+    if None not in values:
+        return _ENCODERS[kind](values)
+    encoded = iter(_ENCODERS[kind]([value for value in values if value is not None]))
+    return ['null' if value is None else next(encoded) for value in values]
+
+def _escape_non_ascii(body):
+    """\\uXXXX-escape what orjson left as UTF-8 (and DEL), as ensure_ascii does"""
+    if body.isascii() and b'\x7f' not in body:
+        return body
+    characters = set(body.translate(None, _ASCII_KEPT).decode())
+    if len(characters) > _DISTINCT_REPLACE_MAX:
+        return _NOT_ASCII.sub(lambda match: _escaped(match.group().decode()), body)
+    for character in characters:
+        body = body.replace(character.encode(), _escaped(character))
+    return body
+
+def _escaped(text):
+    # Surrogate pairs beyond U+FFFF, like the stdlib
+    return encode_basestring_ascii(text)[1:-1].encode()
+
+_encoders = {}
+
+def row_encoder(query, extra=()):
+    """Cached RowEncoder for the rows of a column-only query, with extra (key, kind) fields appended"""
+    fields = tuple((column['name'], column_kind(column['type'])) for column in query.column_descriptions)
+    fields += tuple(extra)
+    encoder = _encoders.get(fields)
+    if encoder is None:
+        encoder = _encoders[fields] = RowEncoder(fields)
+    return encoder
+
+def dumps(payload):
+    """Compact, sorted-key JSON of a payload whose values may be RawJSON"""
+    if isinstance(payload, RawJSON):
+        return payload
+    if isinstance(payload, dict) and _holds_raw(payload):
+        return b'{' + b','.join(
+            encode_basestring_ascii(key).encode() + b':' + dumps(payload[key]) for key in sorted(payload)
+        ) + b'}'
+    return _STDLIB.encode(payload).encode()
+
+def _holds_raw(value):
+    if isinstance(value, RawJSON):
+        return True
+    return isinstance(value, dict) and any(_holds_raw(item) for item in value.values())
+
+def json_response(payload):
+    """jsonify(payload) for payloads holding RawJSON (row lists from RowEncoder.encode)
+
+    Returns the same bytes jsonify() would; when the app's JSON settings
+    differ from the defaults (debug indentation, ensure_ascii off, a custom
+    provider) the payload is decoded again and handed to jsonify().
+    """
+    provider = current_app.json
+    if (type(provider) is DefaultJSONProvider and provider.sort_keys and provider.ensure_ascii
+            and provider.compact is not False and not (provider.compact is None and current_app.debug)):
+        return current_app.response_class(dumps(payload) + b'\n', mimetype=provider.mimetype)
+    return jsonify(_decoded(payload))
+
+def _decoded(payload):
+    if isinstance(payload, RawJSON):
+        return json.loads(payload)
+    if isinstance(payload, dict):
+        return {key: _decoded(value) for key, value in payload.items()}
+    return payload
@@ -360,6 +360,126 @@ function escapeHtml(text) {
     return text.replace(/[&<>"']/g, function(m) { return map[m]; });
 }
 
+/**
+ * Keep a local copy of a collection endpoint (/api/servers, /api/maintenance)
+ * in sync. The first call loads the full list; later calls send the last
+ * ETag and the ?since= delta cursor, so unchanged collections cost a 304
+ * and changed ones only ship the changed rows and deleted ids.
+ * @param {string} url - The collection endpoint
+ * @param {Function} compare - Sort comparator for rows (optional)
+ * @returns {Object} - Sync object with refresh() and rows()
+ */
+function createCollectionSync(url, compare = null) {
+    const rowsById = new Map();
+    let etag = null;
+    let asOf = null;
+    
+    function rows() {
+        const list = Array.from(rowsById.values());
+        return compare ? list.sort(compare) : list;
+    }
+    
+    function reset() {
+        rowsById.clear();
+        etag = null;
+        asOf = null;
+    }
+    
+    /**
+     * Fetch changes from the server
+     * @param {Function} onChange - Called with the sorted rows when anything changed
+     * @returns {jqXHR} - The underlying request
+     */
+    function refresh(onChange) {
+        return $.ajax({
+            url: url,
+            data: asOf ? { since: asOf } : {},
+            headers: etag ? { 'If-None-Match': etag } : {},
+            success: function(data, textStatus, xhr) {
+                if (xhr.status === 304) {
+                    return;
+                }
+                
+                etag = xhr.getResponseHeader('ETag');
+                
+                if (Array.isArray(data)) {
+                    rowsById.clear();
+                    data.forEach(row => rowsById.set(row.id, row));
+                    asOf = xhr.getResponseHeader('X-Changes-As-Of');
+                } else {
+                    data.changed.forEach(row => rowsById.set(row.id, row));
+                    data.deleted.forEach(id => rowsById.delete(id));
+                    asOf = data.as_of;
+                }
+                
+                onChange(rows());
+            },
+            error: function(xhr) {
+                // The change log no longer reaches back far enough
+                if (xhr.status === 410) {
+                    reset();
+                    refresh(onChange);
+                }
+            }
+        });
+    }
+    
+    return { refresh, rows, reset };
+}
+
+// Delay before reconnecting when the server refused the stream (503 when too many are open)
+const EVENT_STREAM_RETRY_MS = 30000;
+
+/**
+ * Subscribe to the /api/events Server-Sent Events stream
+ * @param {Array} eventTypes - Event names to listen for (e.g. 'maintenance.started')
+ * @param {Function} onEvent - Called with (type, data) for each event; type is
+ *                             'resync' when events were missed and the caller should reload
+ * @param {Function} onConnectionChange - Optional; called with true/false as the stream opens
+ *                                        and drops, so the caller can poll while it is down
+ * @returns {EventSource|null} - The first event source, or null when unsupported
+ */
+function connectEventStream(eventTypes, onEvent, onConnectionChange = null) {
+    if (!window.EventSource) {
+        return null;
+    }
+    
+    function connect(retried) {
+        const source = new EventSource('/api/events');
+        
+        eventTypes.concat(['resync']).forEach(function(type) {
+            source.addEventListener(type, function(event) {
+                onEvent(type, event.data ? JSON.parse(event.data) : {});
+            });
+        });
+        
+        source.onopen = function() {
+            if (onConnectionChange) {
+                onConnectionChange(true);
+            }
+            if (retried) {
+                // A new stream cannot replay what was missed while refused
+                retried = false;
+                onEvent('resync', {});
+            }
+        };
+        source.onerror = function() {
+            if (onConnectionChange) {
+                onConnectionChange(false);
+            }
+            // The browser reconnects dropped streams itself but gives up on
+            // error responses; try again later
+            if (source.readyState === EventSource.CLOSED) {
+                setTimeout(function() { connect(true); }, EVENT_STREAM_RETRY_MS);
+            }
+        };
+        
+        return source;
+    }
+    
+    return connect(false);
+}
+
 // Global utility functions for server status
 window.ServerUtils = {
     getStatusClass: function(status) {
@@ -411,5 +531,7 @@ window.MaintenanceApp = {
     copyToClipboard,
     generateId,
     escapeHtml,
-    debounce
+    debounce,
+    createCollectionSync,
+    connectEventStream
 }; 
\ No newline at end of file
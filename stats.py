@@ -0,0 +1,128 @@
+import threading
+import time
+from datetime import datetime, timedelta
+from sqlalchemy import String, event, func, literal, select, type_coerce, union_all
+from models import db, Server, MaintenanceSchedule, ServerStatus, MaintenanceStatus
+
+def compute_dashboard_stats(now=None):
+    """Compute all dashboard counters with a single grouped aggregate query"""
+    now = now or datetime.utcnow()
+
+    # Enum columns are compared as their stored names so that both tables
+    # can share one UNION ALL result column.
+    server_counts = select(
+        literal('server').label('kind'),
+        type_coerce(Server.status, String).label('status'),
+        func.count().label('total')
+    ).group_by(Server.status)
+
+    maintenance_counts = select(
+        literal('maintenance').label('kind'),
+        type_coerce(MaintenanceSchedule.status, String).label('status'),
+        func.count().label('total')
+    ).group_by(MaintenanceSchedule.status)
+
+    upcoming_counts = select(
+        literal('upcoming').label('kind'),
+        literal(None, String).label('status'),
+        func.count().label('total')
+    ).where(
+        MaintenanceSchedule.status == MaintenanceStatus.SCHEDULED,
+        MaintenanceSchedule.scheduled_start > now,
+        MaintenanceSchedule.scheduled_start <= now + timedelta(days=1)
+    )
+
+    servers = {status: 0 for status in ServerStatus.__members__}
+    maintenance = {status: 0 for status in MaintenanceStatus.__members__}
+    upcoming = 0
+
+    for kind, status, total in db.session.execute(union_all(server_counts, maintenance_counts, upcoming_counts)):
+        if kind == 'server' and status in servers:
+            servers[status] = total
+        elif kind == 'maintenance' and status in maintenance:
+            maintenance[status] = total
+        elif kind == 'upcoming':
+            upcoming = total
+
+    return {
+        'servers': {
+            'total': sum(servers.values()),
+            'online': servers['ONLINE'],
+            'maintenance': servers['MAINTENANCE'],
+            'offline': servers['OFFLINE']
+        },
+        'maintenance': {
+            'total': sum(maintenance.values()),
+            'scheduled': maintenance['SCHEDULED'],
+            'in_progress': maintenance['IN_PROGRESS'],
+            'upcoming_24h': upcoming
+        }
+    }
+
+class DashboardStatsCache:
+    """In-process snapshot of the dashboard counters
+
+    Any committed write to Server or MaintenanceSchedule drops the snapshot
+    (see init_app), whether it comes from an API route or a scheduler job.
+    The TTL is only a fallback for 'upcoming_24h', which changes as time
+    passes, and for writes made by other processes.
+    """
+
+    def __init__(self, ttl=10):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._snapshot = None
+        self._expires_at = 0.0
+        self._generation = 0
+
+    def init_app(self, app):
+        self.ttl = app.config.get('DASHBOARD_STATS_TTL', self.ttl)
+        event.listen(db.session, 'after_flush', _mark_stats_dirty)
+        event.listen(db.session, 'do_orm_execute', _mark_stats_dirty_on_bulk)
+        event.listen(db.session, 'after_commit', self._after_commit)
+        event.listen(db.session, 'after_rollback', _clear_stats_dirty)
+
+    def get(self):
+        """Return the cached counters, recomputing them if stale"""
+        with self._lock:
+            if self._snapshot is not None and time.monotonic() < self._expires_at:
+                return self._snapshot
+            generation = self._generation
+
+        snapshot = compute_dashboard_stats()
+
+        with self._lock:
+            # Don't publish a result that raced with a write
+            if generation == self._generation:
+                self._snapshot = snapshot
+                self._expires_at = time.monotonic() + self.ttl
+        return snapshot
+
+    def invalidate(self):
+        """Drop the snapshot so the next read recomputes it"""
+        with self._lock:
+            self._generation += 1
+            self._snapshot = None
+
+    def _after_commit(self, session):
+        if session.info.pop('stats_dirty', False):
+            self.invalidate()
+
+_TRACKED_MODELS = (Server, MaintenanceSchedule)
+
+def _mark_stats_dirty(session, flush_context):
+    for instance in list(session.new) + list(session.dirty) + list(session.deleted):
+        if isinstance(instance, _TRACKED_MODELS):
+            session.info['stats_dirty'] = True
+            return
+
+def _mark_stats_dirty_on_bulk(orm_execute_state):
+    if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+        mapper = orm_execute_state.bind_mapper
+        if mapper is not None and mapper.class_ in _TRACKED_MODELS:
+            orm_execute_state.session.info['stats_dirty'] = True
+
+def _clear_stats_dirty(session):
+    session.info.pop('stats_dirty', None)
+
+dashboard_stats = DashboardStatsCache()
@@ -0,0 +1,318 @@
+import json
+import re
+import threading
+import time
+from datetime import datetime, timedelta
+from sqlalchemy import ARRAY, Integer, any_, bindparam, event, func, insert, select
+from models import db, Server, ServerTag
+from changes import deleted_since
+
+_TAG = re.compile(r'^(?:([a-z0-9_.-]{1,40}):)?([a-z0-9_.\-/]{1,80})$')
+_KEY_WILDCARD = re.compile(r'^([a-z0-9_.-]{1,40}):\*$')
+_EXPRESSION_TOKEN = re.compile(r'\(|\)|[^\s()]+')
+_OPERATORS = ('AND', 'OR', 'NOT')
+
+# Larger id sets are bound as one list parameter instead of inlined (see filter_ids)
+INLINE_IDS_MAX = 1000
+
+# Set bit positions of each byte value, for turning bitmaps into id lists
+_BYTE_BITS = [tuple(bit for bit in range(8) if byte & 1 << bit) for byte in range(256)]
+
+def normalize_tag(value):
+    """'DB' -> 'tag:db', 'Region:EU' -> 'region:eu'; raises ValueError for malformed tags"""
+    match = _TAG.match(str(value).strip().lower())
+    if not match:
+        raise ValueError(f'Invalid tag: {value}')
+    return f"{match.group(1) or 'tag'}:{match.group(2)}"
+
+def normalize_tags(values):
+    """Normalized, de-duplicated tags from a list or a comma/semicolon/space separated string"""
+    if isinstance(values, str):
+        values = re.split(r'[\s,;]+', values)
+    elif not isinstance(values, (list, tuple)):
+        raise ValueError('tags must be a list or a string')
+    return sorted({normalize_tag(value) for value in values if str(value).strip()})
+
+def set_server_tags(server, values):
+    """Replace the tags of a server; bumps updated_at when they change (delta feeds, tag index)"""
+    wanted = set(normalize_tags(values))
+    current = {tag.name: tag for tag in server.tags}
+    if wanted == set(current):
+        return False
+    for name, tag in current.items():
+        if name not in wanted:
+            server.tags.remove(tag)
+    for name in sorted(wanted - set(current)):
+        server.tags.append(ServerTag(name=name))
+    if server.id is not None:
+        server.updated_at = datetime.utcnow()
+    return True
+
+def tags_by_server(server_ids, chunk_size=5000):
+    """{server_id: sorted display tags} for list responses, without loading ServerTag objects"""
+    server_ids = list(server_ids)
+    tags = {server_id: [] for server_id in server_ids}
+    for index in range(0, len(server_ids), chunk_size):
+        for server_id, name in db.session.execute(select(ServerTag.server_id, ServerTag.name).where(
+            filter_ids(ServerTag.server_id, server_ids[index:index + chunk_size])
+        )):
+            tags[server_id].append(ServerTag.display(name))
+    for names in tags.values():
+        names.sort()
+    return tags
+
+def insert_tags(tags_by_name):
+    """Tag newly inserted servers: {server name: [normalized tags]}; part of the caller's transaction"""
+    names = [name for name, tags in tags_by_name.items() if tags]
+    rows = []
+    for index in range(0, len(names), 500):
+        for server_id, name in db.session.execute(
+            select(Server.id, Server.name).where(Server.name.in_(names[index:index + 500]))
+        ):
+            rows.extend({'server_id': server_id, 'name': tag} for tag in tags_by_name[name])
+    if rows:
+        db.session.execute(insert(ServerTag), rows)
+
+def parse_expression(expression):
+    """Parse a tag expression into a tree of ('tag', name), ('prefix', 'key:'), ('not', a), ('and'|'or', a, b)
+
+    Terms are tags ('db', 'tag:db', 'region:eu') or 'key:*' for any
+    value of a key. NOT binds tightest, then AND (also implied between
+    adjacent terms), then OR; parentheses group.
+    """
+    tokens = _EXPRESSION_TOKEN.findall(expression)
+    position = 0
+
+    def peek():
+        return tokens[position] if position < len(tokens) else None
+
+    def take():
+        nonlocal position
+        position += 1
+        return tokens[position - 1]
+
+    def parse_or():
+        node = parse_and()
+        while peek() is not None and peek().upper() == 'OR':
+            take()
+            node = ('or', node, parse_and())
+        return node
+
+    def parse_and():
+        node = parse_not()
+        while peek() is not None and peek() != ')' and peek().upper() != 'OR':
+            if peek().upper() == 'AND':
+                take()
+            node = ('and', node, parse_not())
+        return node
+
+    def parse_not():
+        token = peek()
+        if token is None:
+            raise ValueError('Incomplete tag expression')
+        if token.upper() == 'NOT':
+            take()
+            return ('not', parse_not())
+        if token == '(':
+            take()
+            node = parse_or()
+            if peek() != ')':
+                raise ValueError("Missing ')' in tag expression")
+            take()
+            return node
+        if token == ')' or token.upper() in _OPERATORS:
+            raise ValueError(f"Unexpected '{token}' in tag expression")
+        take()
+        wildcard = _KEY_WILDCARD.match(token.lower())
+        if wildcard:
+            return ('prefix', f'{wildcard.group(1)}:')
+        return ('tag', normalize_tag(token))
+
+    if not tokens:
+        raise ValueError('Empty tag expression')
+    tree = parse_or()
+    if peek() is not None:
+        raise ValueError(f"Unexpected '{peek()}' in tag expression")
+    return tree
+
+def ids_to_bits(ids):
+    ids = list(ids)
+    if not ids:
+        return 0
+    buffer = bytearray(max(ids) // 8 + 1)
+    for server_id in ids:
+        buffer[server_id >> 3] |= 1 << (server_id & 7)
+    return int.from_bytes(buffer, 'little')
+
+def bits_to_ids(bits):
+    """Ascending ids of the set bits"""
+    ids = []
+    for offset, byte in enumerate(bits.to_bytes((bits.bit_length() + 7) // 8, 'little')):
+        if byte:
+            base = offset * 8
+            ids.extend(base + bit for bit in _BYTE_BITS[byte])
+    return ids
+
+class TagIndex:
+    """In-process bitmap index of server tags
+
+    Each tag maps to an int used as a bitset of server ids, so a tag
+    expression is a few big-int AND/OR/NOT operations. The index is loaded
+    at startup. Commits that touch servers or tags through the ORM (and
+    imports) mark it stale; a stale index, or one not refreshed for
+    sync_interval seconds (writes of other processes), catches up before
+    the next query from servers with a newer updated_at (set_server_tags
+    bumps it) and from deletion tombstones.
+    """
+
+    def __init__(self, sync_interval=2, safety_window=5, retention_days=7):
+        self.sync_interval = sync_interval
+        self.safety_window = safety_window
+        self.retention_days = retention_days
+        self._lock = threading.Lock()
+        self._bitmaps = {}
+        self._server_tags = {}
+        self._all = 0
+        self._synced_at = None
+        self._checked_at = 0
+        self._stale = True
+
+    def init_app(self, app):
+        """Load the index; call inside an app context after the tables exist"""
+        self.sync_interval = app.config.get('TAG_INDEX_SYNC_SECONDS', self.sync_interval)
+        self.safety_window = app.config['DELTA_SAFETY_WINDOW']
+        self.retention_days = app.config['DELETED_RECORD_RETENTION_DAYS']
+        event.listen(db.session, 'after_flush', _note_tag_writes)
+        event.listen(db.session, 'after_commit', _after_commit)
+        event.listen(db.session, 'after_rollback', _after_rollback)
+        with self._lock:
+            self._refresh()
+
+    def mark_stale(self):
+        self._stale = True
+
+    def resolve(self, expression):
+        """Ascending ids of the servers matching a tag expression; raises ValueError when malformed"""
+        return bits_to_ids(self.evaluate(parse_expression(expression)))
+
+    def evaluate(self, tree):
+        """Bitmap of the servers matching a parsed expression"""
+        with self._lock:
+            self._refresh()
+            return self._evaluate(tree)
+
+    def counts(self):
+        """{tag: number of servers}"""
+        with self._lock:
+            self._refresh()
+            return {name: bin(bits).count('1') for name, bits in sorted(self._bitmaps.items())}
+
+    def stats(self):
+        return {'tags': len(self._bitmaps), 'servers': len(self._server_tags)}
+
+    def _evaluate(self, node):
+        kind = node[0]
+        if kind == 'tag':
+            return self._bitmaps.get(node[1], 0)
+        if kind == 'prefix':
+            bits = 0
+            for name, tag_bits in self._bitmaps.items():
+                if name.startswith(node[1]):
+                    bits |= tag_bits
+            return bits
+        if kind == 'not':
+            return self._all & ~self._evaluate(node[1])
+        left, right = self._evaluate(node[1]), self._evaluate(node[2])
+        return left & right if kind == 'and' else left | right
+
+    def _refresh(self):
+        now = time.monotonic()
+        if self._stale or now - self._checked_at >= self.sync_interval:
+            # Cleared first: a commit landing during the sync marks it stale again
+            self._stale = False
+            self._checked_at = now
+            self._sync()
+
+    def _sync(self):
+        now = datetime.utcnow()
+        reload = self._synced_at is None or self._synced_at < now - timedelta(days=self.retention_days)
+        if reload:
+            # First load, or tombstones may have been pruned since the last sync
+            members = {}
+            server_tags = {}
+            for server_id, name in db.session.execute(select(ServerTag.server_id, ServerTag.name)):
+                members.setdefault(name, []).append(server_id)
+                server_tags.setdefault(server_id, set()).add(name)
+            all_ids = db.session.execute(select(Server.id)).scalars().all()
+            self._bitmaps = {name: ids_to_bits(ids) for name, ids in members.items()}
+            self._server_tags = {server_id: server_tags.get(server_id, set()) for server_id in all_ids}
+            self._all = ids_to_bits(all_ids)
+        else:
+            since = self._synced_at
+            # Deletions first: SQLite may hand a deleted id to a new server
+            for server_id in deleted_since(Server, since):
+                self._set(server_id, None)
+            changed = db.session.execute(select(Server.id).where(Server.updated_at > since)).scalars().all()
+            loaded = {server_id: set() for server_id in changed}
+            for index in range(0, len(changed), 500):
+                for server_id, name in db.session.execute(select(ServerTag.server_id, ServerTag.name).where(
+                    ServerTag.server_id.in_(changed[index:index + 500])
+                )):
+                    loaded[server_id].add(name)
+            for server_id, names in loaded.items():
+                self._set(server_id, names)
+        # Rows stamped shortly before a slow transaction committed are read again next time
+        self._synced_at = now - timedelta(seconds=self.safety_window)
+
+    def _set(self, server_id, names):
+        """Index a server's tags (None: the server is gone)"""
+        old = self._server_tags.get(server_id)
+        if old == names:
+            return
+        bit = 1 << server_id
+        for name in (old or set()) - (names or set()):
+            bits = self._bitmaps[name] & ~bit
+            if bits:
+                self._bitmaps[name] = bits
+            else:
+                del self._bitmaps[name]
+        for name in (names or set()) - (old or set()):
+            self._bitmaps[name] = self._bitmaps.get(name, 0) | bit
+        if names is None:
+            self._server_tags.pop(server_id, None)
+            self._all &= ~bit
+        else:
+            self._server_tags[server_id] = names
+            self._all |= bit
+
+def _note_tag_writes(session, flush_context):
+    for instance in (*session.new, *session.dirty, *session.deleted):
+        if isinstance(instance, (Server, ServerTag)):
+            session.info['tags_changed'] = True
+            return
+
+def _after_commit(session):
+    if session.info.pop('tags_changed', False):
+        tag_index.mark_stale()
+
+def _after_rollback(session):
+    session.info.pop('tags_changed', None)
+
+def filter_ids(column, ids):
+    """column IN ids, for id sets of any size (tag queries can match more ids than a statement may bind)
+
+    Up to INLINE_IDS_MAX ids are inlined into the SQL. Larger sets (e.g.
+    'NOT tag:canary' on a big fleet) are bound as a single parameter and
+    read back as a table: json_each() of a JSON array on SQLite, an array
+    with = ANY on PostgreSQL. Other databases get the ids inlined.
+    """
+    ids = list(ids)
+    dialect = db.engine.dialect.name
+    if len(ids) > INLINE_IDS_MAX and dialect == 'sqlite':
+        values = func.json_each(bindparam(None, json.dumps(ids))).table_valued('value')
+        return column.in_(select(values.c.value))
+    if len(ids) > INLINE_IDS_MAX and dialect == 'postgresql':
+        return column == any_(bindparam(None, ids, type_=ARRAY(Integer)))
+    return column.in_(bindparam(None, ids, expanding=True, literal_execute=True))
+
+tag_index = TagIndex()
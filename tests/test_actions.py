@@ -0,0 +1,210 @@
+import json
+import shlex
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+
+import pytest
+
+import actions
+from actions import ActionExecutor
+
+def make_action(action_id, **fields):
+    action = {
+        'id': action_id,
+        'name': f'action {action_id}',
+        'kind': 'shell',
+        'phase': 'start',
+        'server_id': None,
+        'server_prefix': '',
+        'command': None,
+        'url': None,
+        'method': None,
+        'timeout_seconds': 5,
+        'retries': 0,
+        'concurrency_group': None,
+        'max_concurrency': None,
+        'position': action_id,
+        'enabled': True
+    }
+    action.update(fields)
+    return action
+
+def python_command(code):
+    return f'{shlex.quote(sys.executable)} -c {shlex.quote(code)}'
+
+def make_server(server_id):
+    return SimpleNamespace(id=server_id, name=f'web{server_id}', hostname=f'web{server_id}.local', ip_address='127.0.0.1')
+
+@pytest.fixture
+def executor(monkeypatch):
+    """An executor whose results are collected in executor.results instead of written to the database"""
+    executor = ActionExecutor(max_workers=8, retry_delay=0.01)
+    executor.results = []
+    monkeypatch.setattr(executor, '_record', executor.results.append)
+    yield executor
+    executor.shutdown()
+
+def run(executor, monkeypatch, action_list, server_count=1):
+    monkeypatch.setattr(actions, 'actions_for', lambda phase, server_ids=None: action_list)
+    queued = executor.run('start', [(100 + index, make_server(index)) for index in range(1, server_count + 1)])
+    assert queued == server_count
+    assert executor.wait(timeout=10)
+    return executor.results
+
+def test_shell_action_is_retried_until_it_succeeds(executor, monkeypatch, tmp_path):
+    counter = tmp_path / 'attempts'
+    # Fails on the first two attempts
+    command = python_command(
+        f"import pathlib, sys; p = pathlib.Path({str(counter)!r}); "
+        "n = int(p.read_text()) + 1 if p.exists() else 1; p.write_text(str(n)); "
+        "print('attempt', n); sys.exit(0 if n >= 3 else 1)"
+    )
+    results = run(executor, monkeypatch, [make_action(1, command=command, retries=3)])
+
+    assert [(result['status'], result['attempts'], result['return_code']) for result in results] == [('succeeded', 3, 0)]
+    assert 'attempt 3' in results[0]['output']
+
+def test_shell_action_substitutes_placeholders(executor, monkeypatch):
+    command = python_command('import sys; print(sys.argv[1])') + ' {name}:{phase}'
+    results = run(executor, monkeypatch, [make_action(1, command=command)])
+
+    assert results[0]['status'] == 'succeeded'
+    assert results[0]['output'].strip() == 'web1:start'
+
+class _StandIn(BaseHTTPRequestHandler):
+    """Answers 503 until it has been called fail_first times, then 200"""
+    calls = []
+    fail_first = 0
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        self.calls.append((self.path, body))
+        status = 503 if len(self.calls) <= self.fail_first else 200
+        self.send_response(status)
+        self.end_headers()
+        self.wfile.write(b'drained' if status == 200 else b'busy')
+
+    def log_message(self, *args):
+        pass
+
+@pytest.fixture
+def stand_in():
+    _StandIn.calls = []
+    server = ThreadingHTTPServer(('127.0.0.1', 0), _StandIn)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+def test_http_action_is_retried_against_a_local_stand_in(executor, monkeypatch, stand_in):
+    _StandIn.fail_first = 1
+    url = f'http://127.0.0.1:{stand_in.server_port}/drain/{{name}}'
+    results = run(executor, monkeypatch, [make_action(1, kind='http', url=url, retries=2)])
+
+    assert [(result['status'], result['attempts'], result['return_code']) for result in results] == [('succeeded', 2, 200)]
+    assert results[0]['output'] == 'drained'
+    path, body = _StandIn.calls[-1]
+    assert path == '/drain/web1'
+    assert body['maintenance_id'] == 101 and body['phase'] == 'start'
+
+def test_http_action_failure_is_recorded_after_the_last_retry(executor, monkeypatch, stand_in):
+    _StandIn.fail_first = 10
+    url = f'http://127.0.0.1:{stand_in.server_port}/drain'
+    results = run(executor, monkeypatch, [make_action(1, kind='http', url=url, retries=1)])
+
+    assert [(result['status'], result['attempts'], result['return_code']) for result in results] == [('failed', 2, 503)]
+    assert len(_StandIn.calls) == 2
+
+def test_later_actions_are_skipped_after_a_failure(executor, monkeypatch, tmp_path):
+    marker = tmp_path / 'ran'
+    results = run(executor, monkeypatch, [
+        make_action(1, command=python_command('import sys; sys.exit(3)')),
+        make_action(2, command=python_command(f'open({str(marker)!r}, "w")')),
+        make_action(3, command=python_command('pass'))
+    ])
+
+    assert [(result['action_id'], result['status']) for result in results] == [(1, 'failed'), (2, 'skipped'), (3, 'skipped')]
+    assert results[0]['return_code'] == 3
+    assert not marker.exists()
+
+def test_group_concurrency_limit_is_respected(executor, monkeypatch):
+    lock = threading.Lock()
+    running = [0]
+    peak = [0]
+
+    def runner(action, context, timeout):
+        with lock:
+            running[0] += 1
+            peak[0] = max(peak[0], running[0])
+        time.sleep(0.05)
+        with lock:
+            running[0] -= 1
+        return True, 0, context['name']
+
+    monkeypatch.setitem(actions.ACTION_TYPES, 'probe', runner)
+    results = run(executor, monkeypatch, [
+        make_action(1, kind='probe', concurrency_group='lb', max_concurrency=2)
+    ], server_count=6)
+
+    assert sorted(result['output'] for result in results) == [f'web{index}' for index in range(1, 7)]
+    assert all(result['status'] == 'succeeded' for result in results)
+    assert peak[0] <= 2
+    assert executor.stats() == {'pending_runs': 0, 'running': 0, 'waiting': 0}
+
+def test_shell_action_timeout(executor, monkeypatch):
+    started = time.monotonic()
+    results = run(executor, monkeypatch, [
+        make_action(1, command=python_command('import time; time.sleep(30)'), timeout_seconds=0.5)
+    ])
+
+    assert [(result['status'], result['attempts']) for result in results] == [('timeout', 1)]
+    assert time.monotonic() - started < 10
+
+def test_custom_action_type_timeout_is_enforced_by_the_executor(executor, monkeypatch):
+    release = threading.Event()
+
+    def hangs(action, context, timeout):
+        release.wait()  # Ignores its timeout
+        return True, 0, ''
+
+    monkeypatch.setitem(actions.ACTION_TYPES, 'hangs', hangs)
+    try:
+        results = run(executor, monkeypatch, [
+            make_action(1, kind='hangs', timeout_seconds=0.2),
+            make_action(2, kind='hangs')
+        ])
+    finally:
+        release.set()
+
+    assert [(result['action_id'], result['status']) for result in results] == [(1, 'timeout'), (2, 'skipped')]
+    assert 'within 0.2s' in results[0]['output']
+
+def test_shutdown_skips_waiting_runs_without_losing_results(executor, monkeypatch):
+    entered = threading.Event()
+    release = threading.Event()
+
+    def blocks(action, context, timeout):
+        entered.set()
+        release.wait()
+        return True, 0, context['name']
+
+    monkeypatch.setitem(actions.ACTION_TYPES, 'blocks', blocks)
+    actions.register_action_type('blocks', blocks, enforces_timeout=True)
+    monkeypatch.setattr(actions, 'actions_for', lambda phase, server_ids=None: [
+        make_action(1, kind='blocks', concurrency_group='one', max_concurrency=1)
+    ])
+    assert executor.run('start', [(101, make_server(1)), (102, make_server(2))]) == 2
+    assert entered.wait(5)
+
+    executor.shutdown()
+    release.set()
+    assert executor.wait(timeout=5)
+
+    assert sorted((result['maintenance_id'], result['status']) for result in executor.results) == [
+        (101, 'succeeded'), (102, 'skipped')
+    ]
+    assert executor.stats() == {'pending_runs': 0, 'running': 0, 'waiting': 0}